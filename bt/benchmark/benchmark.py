@@ -0,0 +1,237 @@
+"""
+离线的性能benchmark，数据由SyntheticDataHandler生成，结果写成json文件，并且可以和之前的结果对比找出性能退化
+
+    python -m bt.benchmark.benchmark --output bench.json
+    python -m bt.benchmark.benchmark --output new.json --compare bench.json --threshold 0.1
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.event.event import EventType
+from bt.components.execution_handler.matching import MatchingExecutionHandler
+from bt.components.portfolio.portfolio import NaivePortfolio
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine, EventBus
+
+START = "2017-09-05 09:30:00"
+
+# (symbol数, bar数)
+DEFAULT_SIZES = [(10, 10000), (100, 10000), (500, 2000)]
+QUICK_SIZES = [(10, 1000), (50, 1000)]
+# 每个benchmark计时的次数
+DEFAULT_REPEAT = 3
+
+
+def symbols(n):
+    return ["%06d" % i for i in range(n)]
+
+
+def measure(prepare, repeat=DEFAULT_REPEAT):
+    """
+    测量一个benchmark的耗时和内存峰值
+    1、先运行一次预热（import、内存分配、缓存等），然后计时repeat次，取最快的一次，减少偶然的干扰
+    2、tracemalloc本身会让python代码变慢很多，所以计时和内存分别运行
+    :param prepare: prepare()做好准备工作（不计入耗时）之后返回要测量的函数，每次运行之前都会重新调用
+    :param repeat:  计时的次数
+    :return:    (秒数, 内存峰值MB)
+    """
+    prepare()()
+    seconds = []
+    for _ in range(max(1, repeat)):
+        func = prepare()
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+
+    func = prepare()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(seconds), peak / 2 ** 20
+
+
+def bench_event_loop(n_symbols, n_bars, seed=0, repeat=DEFAULT_REPEAT):
+    """
+    整个事件驱动回测的吞吐量，包括加载数据
+    """
+    counter = [0]
+
+    def count(event):
+        counter[0] += 1
+
+    def prepare():
+        def run():
+            # 每次运行之前清零，计数只是一次运行的事件数，和measure运行了几次无关
+            counter[0] = 0
+            engine = BacktestEngine(symbols(n_symbols), START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                                    data_handler_kwargs={"n_bars": n_bars, "seed": seed})
+            for event_type in EventType:
+                engine.register(event_type, count)
+            engine.run()
+        return run
+
+    seconds, peak = measure(prepare, repeat)
+    events = counter[0]
+    return {"bars_per_sec": n_bars / seconds, "events_per_sec": events / seconds, "seconds": seconds,
+            "peak_mb": peak}
+
+
+def bench_portfolio_update(n_symbols, n_bars, seed=0, repeat=DEFAULT_REPEAT):
+    """
+    只测Portfolio.update_timeindex，所有symbol都有持仓
+    """
+    def prepare():
+        data_handler = SyntheticDataHandler(EventBus(), symbols(n_symbols), START, n_bars=n_bars, seed=seed)
+        portfolio = NaivePortfolio(data_handler, data_handler.events, START)
+        portfolio.position_vector[:] = 100
+        bar_store = data_handler.bar_store
+
+        def run():
+            while bar_store.advance():
+                portfolio.update_timeindex()
+        return run
+
+    seconds, peak = measure(prepare, repeat)
+    return {"bars_per_sec": n_bars / seconds, "seconds": seconds, "peak_mb": peak}
+
+
+def bench_summary_stats(n_symbols, n_bars, seed=0, repeat=DEFAULT_REPEAT):
+    """
+    测output_summary_stats，portfolio的history已经填满
+    """
+    engine = BacktestEngine(symbols(n_symbols), START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                            data_handler_kwargs={"n_bars": n_bars, "seed": seed})
+    portfolio = engine.run()
+    seconds, peak = measure(lambda: portfolio.output_summary_stats, repeat)
+    return {"bars_per_sec": n_bars / seconds, "seconds": seconds, "peak_mb": peak}
+
+
+def bench_matching(n_symbols, n_bars, seed=0, repeat=DEFAULT_REPEAT):
+    """
+    测MatchingExecutionHandler的撮合吞吐量，每个bar每个symbol下4个订单：1个市价单和3个价格在收盘价附近的限价单
+    """
+    orders_per_bar = 4
+
+    def prepare():
+        data_handler = SyntheticDataHandler(EventBus(), symbols(n_symbols), START, n_bars=n_bars, seed=seed)
+        broker = MatchingExecutionHandler(data_handler.events, data_handler, participation=0.01)
+        bar_store = data_handler.bar_store
+        rng = np.random.RandomState(seed)
+        offsets = np.round(rng.normal(0.0, 0.002, (n_bars, n_symbols, orders_per_bar - 1)), 3)
+        sides = rng.randint(0, 2, (n_bars, n_symbols, orders_per_bar)).tolist()
+        close = bar_store.fields["close"]
+        limits = np.round(close[:, :, None] * (1 + offsets), 2).tolist()
+        symbol_list = bar_store.symbol_list
+        directions = ("BUY", "SELL")
+
+        def run():
+            events = data_handler.events
+            for t in range(n_bars):
+                bar_store.advance()
+                broker.on_market()
+                events.clear()
+                timestamp = int(bar_store.timestamp[t])
+                for j, s in enumerate(symbol_list):
+                    side = sides[t][j]
+                    broker.submit(s, 100, directions[side[0]], None, timestamp)
+                    for k, price in enumerate(limits[t][j]):
+                        broker.submit(s, 100, directions[side[k + 1]], price, timestamp)
+        return run
+
+    seconds, peak = measure(prepare, repeat)
+    orders = n_bars * n_symbols * orders_per_bar
+    return {"bars_per_sec": n_bars / seconds, "orders_per_sec": orders / seconds, "seconds": seconds,
+            "peak_mb": peak}
+
+
+BENCHMARKS = {"event_loop": bench_event_loop, "portfolio_update": bench_portfolio_update,
+              "summary_stats": bench_summary_stats, "matching": bench_matching}
+
+
+def run_benchmarks(sizes=None, names=None, repeat=DEFAULT_REPEAT):
+    """
+    :param sizes:   [(symbol数, bar数), ...]
+    :param names:   要运行的benchmark的名字，默认全部
+    :param repeat:  每个benchmark计时的次数，结果是最快的一次
+    :return:    可以直接写成json的dict
+    """
+    results = []
+    for name in names or BENCHMARKS:
+        for n_symbols, n_bars in sizes or DEFAULT_SIZES:
+            result = {"name": name, "symbols": n_symbols, "bars": n_bars, "repeat": repeat}
+            result.update(BENCHMARKS[name](n_symbols, n_bars, repeat=repeat))
+            results.append(result)
+    meta = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "machine": platform.machine()}
+    return {"meta": meta, "results": results}
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    对比两次benchmark的结果
+    :param current:     run_benchmarks的结果
+    :param baseline:    之前保存的结果
+    :param threshold:   吞吐量下降或者内存峰值上升超过这个比例就算退化
+    :return:    退化的list，每一项是一个dict
+    """
+    def key(r):
+        return r["name"], r["symbols"], r["bars"]
+    old = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = old.get(key(r))
+        if b is None:
+            continue
+        for metric in ("bars_per_sec", "events_per_sec", "orders_per_sec"):
+            if metric in r and metric in b and r[metric] < b[metric] * (1 - threshold):
+                regressions.append({"benchmark": key(r), "metric": metric, "baseline": b[metric],
+                                    "current": r[metric], "change": r[metric] / b[metric] - 1})
+        if r["peak_mb"] > b["peak_mb"] * (1 + threshold) and r["peak_mb"] - b["peak_mb"] > 1:
+            regressions.append({"benchmark": key(r), "metric": "peak_mb", "baseline": b["peak_mb"],
+                                "current": r["peak_mb"], "change": r["peak_mb"] / b["peak_mb"] - 1})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BackTester benchmark")
+    parser.add_argument("--output", help="结果写入的json文件")
+    parser.add_argument("--compare", help="用来对比的之前的json文件")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判断为退化的比例，默认0.1")
+    parser.add_argument("--quick", action="store_true", help="只跑小规模的数据")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="只跑指定的benchmark")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="预热之后计时的次数，取最快的一次，默认%d" % DEFAULT_REPEAT)
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(QUICK_SIZES if args.quick else DEFAULT_SIZES, args.only, args.repeat)
+    for r in current["results"]:
+        print("%-18s symbols=%-5d bars=%-7d %12.0f bars/s %8.1f MB" % (r["name"], r["symbols"], r["bars"],
+                                                                      r["bars_per_sec"], r["peak_mb"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for r in regressions:
+            print("REGRESSION %s %s: %.4g -> %.4g (%+.1f%%)" % (r["benchmark"], r["metric"], r["baseline"],
+                                                              r["current"], r["change"] * 100))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+事件创建和分发的microbenchmark，对比原来基于__dict__和property的事件与现在的__slots__事件
+
+    python -m bt.benchmark.event_benchmark
+"""
+import timeit
+
+from bt.components.event.event import EventType, MarketEvent, SignalEvent, FillEvent
+
+
+class DictEvent(object):
+    """
+    原来的事件实现方式：事件类型保存在实例的__dict__中，通过property读取
+    """
+
+    @property
+    def type_enum(self):
+        return self._type
+
+
+class DictMarketEvent(DictEvent):
+    def __init__(self):
+        self._type = EventType.MARKET
+
+
+class DictSignalEvent(DictEvent):
+    def __init__(self, symbol, datetime, signal_type, strength):
+        self._type = EventType.SIGNAL
+        self.symbol = symbol
+        self.datetime = datetime
+        self.signal_type = signal_type
+        self.strength = strength
+
+
+def dispatch_chain(event, counts):
+    """
+    原来event_loop中的if/elif分发
+    """
+    if event.type_enum == EventType.MARKET:
+        counts[0] += 1
+    elif event.type_enum == EventType.SIGNAL:
+        counts[1] += 1
+    elif event.type_enum == EventType.ORDER:
+        counts[2] += 1
+    elif event.type_enum == EventType.FILL:
+        counts[3] += 1
+
+
+def dispatch_table(event, counts, handlers):
+    """
+    BacktestEngine中的分发方式
+    """
+    for handler in handlers[event.type_enum]:
+        handler(counts)
+
+
+def run(number=200000, repeat=5):
+    """
+    :return:    {名字: 每次操作的纳秒数}
+    """
+    shared_market_event = MarketEvent()
+    handlers = [[lambda c, i=i: c.__setitem__(i, c[i] + 1)] for i in range(len(EventType))]
+    counts = [0, 0, 0, 0]
+    cases = {
+        "create MarketEvent (dict)": lambda: DictMarketEvent(),
+        "create MarketEvent (slots)": lambda: MarketEvent(),
+        "reuse MarketEvent": lambda: shared_market_event,
+        "create SignalEvent (dict)": lambda: DictSignalEvent("600348", 0, "LONG", 10),
+        "create SignalEvent (slots)": lambda: SignalEvent("600348", 0, "LONG", 10),
+        "create FillEvent (slots)": lambda: FillEvent(0, "600348", "SH", 1000, "BUY", None),
+        "dispatch if/elif (dict event)": lambda e=DictSignalEvent("600348", 0, "LONG", 10): dispatch_chain(e, counts),
+        "dispatch table (slots event)": lambda e=SignalEvent("600348", 0, "LONG", 10): dispatch_table(e, counts,
+                                                                                                        handlers),
+    }
+    results = {}
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=number, repeat=repeat))
+        results[name] = best / number * 1e9
+    return results
+
+
+if __name__ == "__main__":
+    for name, ns in run().items():
+        print("%-32s %8.1f ns" % (name, ns))
@@ -1,5 +1,10 @@
-import pandas as pd
+from bt.components.lazy import on_import
 
 
-pd.set_option('display.max_rows', 500)
-pd.set_option('display.width', 1000)
+def _set_display_options(pd):
+    pd.set_option('display.max_rows', 500)
+    pd.set_option('display.width', 1000)
+
+
+# pandas在第一次被用到时才import，显示选项也在那时设置
+on_import("pandas", _set_display_options)
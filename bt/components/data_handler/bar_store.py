@@ -0,0 +1,210 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# bar中各个价格字段的顺序，和原来tuple的格式保持一致：Open-Low-High-Close-Volume
+BAR_FIELDS = ("open", "low", "high", "close", "vol")
+
+# get_latest_bars返回的结构，字段的位置和原来的tuple一致：bars[1]是时间，bars[5]是收盘价
+Bars = namedtuple("Bars", ("symbol", "datetime") + BAR_FIELDS)
+
+
+def to_timestamp_array(index) -> np.ndarray:
+    """
+    把时间索引（DatetimeIndex、字符串list等）转换成int64的纳秒时间戳数组
+    :param index:   时间索引
+    :return:    int64的纳秒时间戳数组
+    """
+    return np.asarray(index, dtype="datetime64[ns]").view(np.int64)
+
+
+def frame_to_arrays(frame):
+    """
+    把以时间为索引、包含open/low/high/close/vol列的DataFrame转换成(时间戳数组, {字段: 数组})
+    :param frame:   DataFrame
+    :return:    (timestamps, columns)
+    """
+    frame = frame.sort_index()
+    timestamps = to_timestamp_array(frame.index)
+    columns = {f: np.asarray(frame[f].values, dtype=np.float64) for f in BAR_FIELDS}
+    return timestamps, columns
+
+
+def align_symbol_arrays(symbol_list, symbol_arrays):
+    """
+    把每个symbol各自的数据按照所有symbol时间的并集对齐，缺失的bar用前一个bar填充（和reindex(method="pad")一致），
+    只有成交量例外：填充出来的bar没有成交，vol是0，这样合成更大周期的bar时不会把同一笔成交量重复累加
+    :param symbol_list:     交易品种的代码
+    :param symbol_arrays:   {symbol: (timestamps, columns)}，timestamps必须是升序的
+    :return:    (对齐后的时间戳数组, {字段: 形状为(bar数, symbol数)的数组})
+    """
+    if len(symbol_list) == 0:
+        return np.empty(0, dtype=np.int64), {f: np.empty((0, 0)) for f in BAR_FIELDS}
+    comb_index = np.unique(np.concatenate([symbol_arrays[s][0] for s in symbol_list]))
+    aligned = {f: np.empty((len(comb_index), len(symbol_list)), dtype=np.float64) for f in BAR_FIELDS}
+    for j, s in enumerate(symbol_list):
+        timestamps, columns = symbol_arrays[s]
+        # 每个对齐后的时间点对应的，该symbol的最近一个bar的位置；-1表示这个时间点之前还没有数据
+        pos = np.searchsorted(timestamps, comb_index, side="right") - 1
+        missing = pos < 0
+        pos[missing] = 0
+        for f in BAR_FIELDS:
+            if len(timestamps) == 0:
+                aligned[f][:, j] = np.nan
+                continue
+            column = columns[f][pos]
+            column[missing] = np.nan
+            if f == "vol":
+                column[~missing & (timestamps[pos] != comb_index)] = 0.0
+            aligned[f][:, j] = column
+    return comb_index, aligned
+
+
+class BarStore(object):
+    """
+    按列存储的bar数据，每个字段是一个预先分配好的、形状为(bar数, symbol数)的numpy数组，再加上一个int64的时间戳列
+    1、所有symbol的数据都已经按照时间对齐，所以共用同一个时间戳列
+    2、cursor表示已经“发布”给回测的bar的个数，每次update_bars向前移动一个位置
+    3、get_latest_bars返回的是底层数组的视图，不会复制数据
+    4、指定max_history时只保留最近的max_history个bar，写满之后把它们搬到一块新的数组的开头，内存占用有上限
+    """
+
+    def __init__(self, symbol_list, capacity=1024, max_history=None):
+        """
+        初始化一个空的BarStore
+        :param symbol_list: 交易品种的代码
+        :param capacity:    预先分配的bar的个数，写满之后会按倍数增长
+        :param max_history: 至少保留的最近的bar的个数，None表示保留全部
+        """
+        self.symbol_list = list(symbol_list)
+        self.symbol_index = {s: i for i, s in enumerate(self.symbol_list)}
+        self.max_history = max_history
+        if max_history is not None:
+            capacity = max(capacity, 2 * max_history)
+        self.capacity = max(int(capacity), 1)
+        self.timestamp = np.zeros(self.capacity, dtype=np.int64)
+        self.fields = {f: np.full((self.capacity, len(self.symbol_list)), np.nan) for f in BAR_FIELDS}
+        self.length = 0     # 已经写入的bar的个数
+        self.cursor = 0     # 已经发布给回测的bar的个数
+
+    @classmethod
+    def from_arrays(cls, symbol_list, timestamps, fields):
+        """
+        直接用已经对齐好的数组构造BarStore，数组不会被复制
+        :param symbol_list: 交易品种的代码
+        :param timestamps:  int64时间戳数组
+        :param fields:      {字段: 形状为(bar数, symbol数)的数组}
+        :return:    BarStore
+        """
+        store = cls.__new__(cls)
+        store.symbol_list = list(symbol_list)
+        store.symbol_index = {s: i for i, s in enumerate(store.symbol_list)}
+        store.max_history = None
+        store.capacity = len(timestamps)
+        store.timestamp = timestamps
+        store.fields = {f: fields[f] for f in BAR_FIELDS}
+        store.length = len(timestamps)
+        store.cursor = 0
+        return store
+
+    @classmethod
+    def from_symbol_data(cls, symbol_list, symbol_data):
+        """
+        根据每个symbol各自的数据构造对齐后的BarStore
+        :param symbol_list: 交易品种的代码
+        :param symbol_data: {symbol: DataFrame 或者 (timestamps, columns)}
+        :return:    BarStore
+        """
+        symbol_arrays = {}
+        for s in symbol_list:
+            data = symbol_data[s]
+            symbol_arrays[s] = data if isinstance(data, tuple) else frame_to_arrays(data)
+        timestamps, fields = align_symbol_arrays(symbol_list, symbol_arrays)
+        return cls.from_arrays(symbol_list, timestamps, fields)
+
+    def _grow(self, min_capacity):
+        new_capacity = max(self.capacity * 2, min_capacity)
+        self._reallocate(new_capacity, 0)
+
+    def _compact(self):
+        """
+        只保留最近的max_history个bar，搬到新的数组里，这样之前返回的视图仍然有效
+        """
+        drop = max(min(self.length, self.cursor) - self.max_history, 0)
+        if drop == 0:
+            self._grow(self.length + 1)
+        else:
+            self._reallocate(self.capacity, drop)
+
+    def _reallocate(self, new_capacity, drop):
+        keep = self.length - drop
+        timestamp = np.zeros(new_capacity, dtype=np.int64)
+        timestamp[:keep] = self.timestamp[drop:self.length]
+        self.timestamp = timestamp
+        for f in BAR_FIELDS:
+            column = np.full((new_capacity, len(self.symbol_list)), np.nan)
+            column[:keep] = self.fields[f][drop:self.length]
+            self.fields[f] = column
+        self.capacity = new_capacity
+        self.length = keep
+        self.cursor -= drop
+
+    def append(self, timestamp, **values):
+        """
+        在末尾追加一个已经对齐的bar
+        :param timestamp:   int64时间戳
+        :param values:      {字段: 长度为symbol数的数组}，缺失的字段用nan填充
+        :return:
+        """
+        if self.length >= self.capacity:
+            if self.max_history is None:
+                self._grow(self.length + 1)
+            else:
+                self._compact()
+        row = self.length
+        self.timestamp[row] = timestamp
+        for f in BAR_FIELDS:
+            self.fields[f][row] = values.get(f, np.nan)
+        self.length += 1
+
+    def advance(self) -> bool:
+        """
+        把cursor向前移动一个bar
+        :return:    如果已经没有新的bar了，返回False
+        """
+        if self.cursor >= self.length:
+            return False
+        self.cursor += 1
+        return True
+
+    def latest_bars(self, symbol, n=1) -> Bars:
+        """
+        返回某个symbol最新的n个bars，返回的每个字段都是底层数组的视图
+        :param symbol:  交易品种的代码
+        :param n:   要返回的bars的个数
+        :return:    Bars
+        """
+        j = self.symbol_index[symbol]
+        start = max(self.cursor - n, 0)
+        end = self.cursor
+        return Bars(symbol, self.timestamp[start:end],
+                    *(self.fields[f][start:end, j] for f in BAR_FIELDS))
+
+    def latest_row(self, field):
+        """
+        返回最新的一个bar中所有symbol的某个字段，是一个长度为symbol数的视图
+        :param field:   字段名
+        :return:    numpy数组
+        """
+        return self.fields[field][self.cursor - 1]
+
+    def history(self, field):
+        """
+        返回截止到cursor的某个字段的全部历史，形状为(bar数, symbol数)
+        :param field:   字段名，"datetime"表示时间戳列
+        :return:    numpy数组的视图
+        """
+        if field == "datetime":
+            return self.timestamp[:self.cursor]
+        return self.fields[field][:self.cursor]
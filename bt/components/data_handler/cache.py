@@ -0,0 +1,161 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from bt.components.data_handler.bar_store import BAR_FIELDS
+
+
+class BarCacheMissError(LookupError):
+    """
+    离线模式下，本地缓存中没有所请求的数据时抛出
+    """
+    pass
+
+
+def to_ns(dt) -> int:
+    """
+    把"2017-09-05 09:30:00"这样的时间转换成int64的纳秒时间戳
+    """
+    return int(np.datetime64(dt, "ns").view(np.int64))
+
+
+def from_ns(ns) -> str:
+    """
+    把int64的纳秒时间戳转换成"2017-09-05 09:30:00"这样的字符串
+    """
+    return str(np.datetime64(int(ns), "ns").astype("datetime64[s]")).replace("T", " ")
+
+
+def merge_ranges(ranges):
+    """
+    合并有重叠或者首尾相接的闭区间
+    :param ranges:  [(lo, hi), ...]
+    :return:    排好序的、互不相交的区间list
+    """
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def subtract_ranges(lo, hi, covered):
+    """
+    计算闭区间[lo, hi]中没有被covered覆盖的部分
+    :param lo:  起始时间戳
+    :param hi:  结束时间戳
+    :param covered: merge_ranges之后的区间list
+    :return:    缺失的区间list
+    """
+    missing = []
+    cur = lo
+    for c_lo, c_hi in covered:
+        if c_hi < cur:
+            continue
+        if c_lo > hi:
+            break
+        if c_lo > cur:
+            missing.append((cur, c_lo - 1))
+        cur = max(cur, c_hi + 1)
+        if cur > hi:
+            break
+    if cur <= hi:
+        missing.append((cur, hi))
+    return missing
+
+
+class BarCache(object):
+    """
+    bar数据的本地磁盘缓存
+    1、每个(symbol, ktype)一个目录，每个字段存成一个.npy文件，读取时用memory map，不需要把数据全部读进内存
+    2、coverage.json中记录已经下载过的时间区间，所以对于一个新的时间范围，只需要下载缺失的那部分
+    3、offline模式下只从缓存读取，缺数据时抛出BarCacheMissError
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _symbol_dir(self, symbol, ktype):
+        return os.path.join(self.root, str(ktype), str(symbol))
+
+    def coverage(self, symbol, ktype):
+        """
+        返回某个symbol已经缓存的时间区间
+        """
+        path = os.path.join(self._symbol_dir(symbol, ktype), "coverage.json")
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [tuple(r) for r in json.load(f)]
+
+    def missing_ranges(self, symbol, ktype, start_datetime, end_datetime):
+        """
+        返回[start_datetime, end_datetime]中还没有缓存的时间区间
+        """
+        return subtract_ranges(to_ns(start_datetime), to_ns(end_datetime), self.coverage(symbol, ktype))
+
+    def _read_all(self, symbol, ktype, mmap_mode="r"):
+        path = self._symbol_dir(symbol, ktype)
+        if not os.path.exists(os.path.join(path, "datetime.npy")):
+            return np.empty(0, dtype=np.int64), {f: np.empty(0) for f in BAR_FIELDS}
+        timestamps = np.load(os.path.join(path, "datetime.npy"), mmap_mode=mmap_mode)
+        columns = {f: np.load(os.path.join(path, f + ".npy"), mmap_mode=mmap_mode) for f in BAR_FIELDS}
+        return timestamps, columns
+
+    def read(self, symbol, ktype, start_datetime, end_datetime):
+        """
+        从缓存中读取[start_datetime, end_datetime]的数据，返回的是memory map的切片
+        :return:    (timestamps, columns)
+        """
+        timestamps, columns = self._read_all(symbol, ktype)
+        lo = np.searchsorted(timestamps, to_ns(start_datetime), side="left")
+        hi = np.searchsorted(timestamps, to_ns(end_datetime), side="right")
+        return timestamps[lo:hi], {f: columns[f][lo:hi] for f in BAR_FIELDS}
+
+    def write(self, symbol, ktype, lo, hi, timestamps, columns):
+        """
+        把[lo, hi]这个区间下载到的数据合并到缓存中，同一个时间戳以新数据为准
+        :param lo:  区间的起始时间戳
+        :param hi:  区间的结束时间戳
+        :param timestamps:  新数据的时间戳
+        :param columns:     新数据的各个字段
+        """
+        path = self._symbol_dir(symbol, ktype)
+        os.makedirs(path, exist_ok=True)
+        old_timestamps, old_columns = self._read_all(symbol, ktype, mmap_mode=None)
+        all_timestamps = np.concatenate([np.asarray(timestamps, dtype=np.int64), old_timestamps])
+        all_timestamps, keep = np.unique(all_timestamps, return_index=True)
+        arrays = {"datetime": all_timestamps}
+        for f in BAR_FIELDS:
+            arrays[f] = np.concatenate([np.asarray(columns[f], dtype=np.float64), old_columns[f]])[keep]
+        # 先写临时文件再替换，这样别的进程正在memory map的旧文件不会被破坏
+        for name, array in arrays.items():
+            tmp = os.path.join(path, name + ".tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, os.path.join(path, name + ".npy"))
+        coverage = merge_ranges(self.coverage(symbol, ktype) + [(lo, hi)])
+        tmp = os.path.join(path, "coverage.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(coverage, f)
+        os.replace(tmp, os.path.join(path, "coverage.json"))
+
+    def load(self, symbol, ktype, start_datetime, end_datetime, fetch=None, offline=False):
+        """
+        读取[start_datetime, end_datetime]的数据，缺失的区间用fetch下载之后写入缓存
+        :param fetch:   fetch(symbol, start_datetime, end_datetime) -> (timestamps, columns)，时间是字符串
+        :param offline: 为True时不下载，缺数据直接抛出BarCacheMissError
+        :return:    (timestamps, columns)
+        """
+        # 还没有到来的时间不能算作已经缓存，否则以后就再也不会去下载了
+        now = time.time_ns()
+        for lo, hi in self.missing_ranges(symbol, ktype, start_datetime, end_datetime):
+            if offline or fetch is None:
+                raise BarCacheMissError("缓存中没有%s(%s)从%s到%s的数据" % (symbol, ktype, from_ns(lo), from_ns(hi)))
+            timestamps, columns = fetch(symbol, from_ns(lo), from_ns(hi))
+            if lo <= now:
+                self.write(symbol, ktype, lo, min(hi, now), timestamps, columns)
+        return self.read(symbol, ktype, start_datetime, end_datetime)
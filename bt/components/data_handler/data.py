@@ -1,9 +1,18 @@
-import tushare as ts
 from abc import ABCMeta, abstractmethod
+from itertools import chain
+import inspect
 import queue
-import pandas as pd
+
+import numpy as np
 
 from bt.components.event.event import MarketEvent
+from bt.components.logs import logger
+from bt.components.data_handler.bar_store import BarStore, Bars, BAR_FIELDS, frame_to_arrays
+from bt.components.data_handler.cache import BarCache
+from bt.components.data_handler.download import Downloader, DownloadError
+from bt.components.data_handler.resample import TimeframeAggregator
+from bt.components.data_handler.indicator import INDICATORS
+from bt.components.data_handler.merge import merge_bar_streams
 
 
 class DataHandler(metaclass=ABCMeta):
@@ -13,78 +22,350 @@ class DataHandler(metaclass=ABCMeta):
     bars的格式是：Open-Low-High-Close-Volume-OpenInterest
     """
 
+    # MarketEvent没有任何字段，默认每个bar都放同一个实例到队列中，不用每次都创建新的对象
+    reuse_market_event = True
+
     def __init__(self, events: queue.Queue, symbol_list, start_datetime, end_datetime):
         self.events = events
         self.symbol_list = symbol_list
         self.start_datetime = start_datetime
         self.end_datetime = end_datetime
 
-        self.latest_symbol_data = {}
         self.symbol_data = {}
         self.continue_backtest = True
+        self.market_event = MarketEvent()
+        self.timeframes = {}
+        self.indicators = {}
         self.get_data_from_external()
+        self.bar_store = self.build_bar_store()
+
+    def close(self):
+        """
+        释放数据源占用的线程、文件等资源，默认什么都不做
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     @abstractmethod
     def get_data_from_external(self):
+        """
+        子类在这里把每个symbol的数据放到self.symbol_data中，
+        每个symbol的数据是一个以时间为索引、包含open/low/high/close/vol列的DataFrame，或者是(timestamps, columns)
+        """
         raise NotImplementedError("Should implement get_data_from_external(self)")
 
-    def get_new_bar(self, symbol):
+    def build_bar_store(self) -> BarStore:
         """
-        返回一个生成器，可以用这个生成器每次获取一条数据
-        :param symbol:
+        把symbol_data中的数据对齐之后放到按列存储的BarStore中，之后symbol_data就不再需要了
+        :return:    BarStore
+        """
+        bar_store = BarStore.from_symbol_data(self.symbol_list, self.symbol_data)
+        self.symbol_data = {}
+        return bar_store
+
+    def add_timeframe(self, name, minutes=None, bars=None, offset_minutes=0, closed="right"):
+        """
+        增加一个更大的周期，它的bar由bar_store中的bar增量合成，之后可以用get_latest_bars(symbol, n, timeframe=name)读取
+        参数的含义见TimeframeAggregator；如果回测已经开始，会先用已经发布的bar补齐
+        :param name:    周期的名字，比如"60min"
         :return:
         """
-        for (index, row) in self.symbol_data[symbol]:
-            yield tuple([symbol, index, row["open"], row["low"],
-                         row["high"], row["close"], row["vol"]])
+        aggregator = TimeframeAggregator(self.symbol_list, minutes=minutes, bars=bars, offset_minutes=offset_minutes,
+                                         closed=closed)
+        for row in range(self.bar_store.cursor):
+            aggregator.update_from(self.bar_store, row)
+        self.timeframes[name] = aggregator
+
+    def add_indicator(self, kind, **params):
+        """
+        返回一个增量计算的技术指标，相同的kind和参数只会创建一次，所有策略共享同一个实例，每个bar只计算一次
+        如果回测已经开始，会先用已经发布的bar补齐
+        :param kind:    指标的名字，可选的见indicator.INDICATORS，比如"sma"、"ema"、"atr"
+        :param params:  指标的参数，比如window=20、field="close"
+        :return:    Indicator，用indicator.value(symbol)或者indicator.values读取最新的值
+        """
+        cls = INDICATORS[kind]
+        # 按构造函数的签名补上默认值，add_indicator("sma", window=20)和加上field="close"得到同一个实例
+        arguments = inspect.signature(cls).bind(self.symbol_list, **params)
+        arguments.apply_defaults()
+        key = (kind, tuple(sorted(list(arguments.arguments.items())[1:])))
+        indicator = self.indicators.get(key)
+        if indicator is None:
+            indicator = cls(self.symbol_list, **params)
+            for row in range(self.bar_store.cursor):
+                indicator.update(self.bar_store, row)
+            self.indicators[key] = indicator
+        return indicator
 
-    def get_latest_bars(self, symbol, n=1) -> list:
+    def get_latest_bars(self, symbol, n=1, timeframe=None) -> Bars:
         """
-        这个方法将会从latest_symbol list中返回最新的n个bars
+        这个方法将会从bar_store中返回最新的n个bars
         :param symbol:  交易品种的代码
         :param n:   要返回的bars的个数
-        :return:    所请求的bars的个数
+        :param timeframe:   用add_timeframe增加的周期的名字，None表示原始的周期；最新的一个bar可能还没有结束
+        :return:    Bars，每个字段都是长度不超过n的数组视图，比如bars.close[-1]是最新的收盘价；symbol不存在时返回None
         """
+        bar_store = self.bar_store if timeframe is None else self.timeframes[timeframe].store
         try:
-            bar_list = self.latest_symbol_data[symbol]
+            return bar_store.latest_bars(symbol, n)
         except KeyError:
-            print("get_latest_bars：给定的symbol不存在！")
-        else:
-            return bar_list[-n:]
+            logger.error("get_latest_bars：给定的symbol %s 不存在！", symbol)
+            return None
+
+    def get_latest_bar_value(self, symbol, field):
+        """
+        返回某个symbol最新的bar中某个字段的值
+        :param symbol:  交易品种的代码
+        :param field:   字段名，可选的有"open"、"low"、"high"、"close"、"vol"
+        :return:    字段的值，如果还没有bar则返回nan
+        """
+        if self.bar_store.cursor == 0:
+            return np.nan
+        return self.bar_store.fields[field][self.bar_store.cursor - 1, self.bar_store.symbol_index[symbol]]
+
+    def get_latest_bar_datetime(self):
+        """
+        返回最新的bar的时间，所有symbol已经对齐，所以共用一个时间
+        :return:    int64的纳秒时间戳，如果还没有bar则返回None
+        """
+        if self.bar_store.cursor == 0:
+            return None
+        return int(self.bar_store.timestamp[self.bar_store.cursor - 1])
+
+    def seek(self, timestamp):
+        """
+        把cursor移动到timestamp之后，也就是认为timestamp及之前的bar都已经发布过了，用于从快照恢复
+        :param timestamp:   int64纳秒时间戳
+        """
+        store = self.bar_store
+        store.cursor = int(np.searchsorted(store.timestamp[:store.length], timestamp, side="right"))
+
+    def get_state(self):
+        """
+        快照中保存的状态：最新发布的bar的时间，以及合成的周期和指标；bar数据本身不保存，恢复时由新的DataHandler重新加载
+        """
+        return {"timestamp": self.get_latest_bar_datetime(), "timeframes": self.timeframes,
+                "indicators": self.indicators}
+
+    def set_state(self, state):
+        self.timeframes = state["timeframes"]
+        self.indicators = state["indicators"]
+        if state["timestamp"] is not None:
+            self.seek(state["timestamp"])
 
     def update_bars(self):
         """
-        将每个symbol的最新的bars放置到latest symbol结构中
+        把bar_store的cursor向前移动一个bar，相当于把每个symbol的最新的bar发布出去
         :return:
         """
-        for s in self.symbol_list:
-            try:
-                new_bar = self.get_new_bar(s).__next__()
-            except StopIteration:
-                self.continue_backtest = False
-            else:
-                if new_bar is not None:
-                    self.latest_symbol_data[s].append(new_bar)
-        self.events.put(MarketEvent())
+        if not self.bar_store.advance():
+            self.continue_backtest = False
+        else:
+            if self.timeframes:
+                for aggregator in self.timeframes.values():
+                    aggregator.update_from(self.bar_store, self.bar_store.cursor - 1)
+            if self.indicators:
+                for indicator in self.indicators.values():
+                    indicator.update(self.bar_store, self.bar_store.cursor - 1)
+        self.events.put(self.market_event if self.reuse_market_event else MarketEvent())
 
 
 class TushareDataHandler(DataHandler):
-    def __init__(self, events: queue.Queue, symbol_list, start_datetime, end_datetime):
+    """
+    从tushare获取数据的DataHandler
+    1、如果给定了cache_dir，数据会缓存在本地磁盘上，之后只下载缓存中缺失的时间区间
+    2、offline为True时完全不访问网络，缓存中缺数据时抛出BarCacheMissError
+    3、只下载ktype这一种最细的周期，更大的周期用timeframes在本地合成，不需要重复下载
+    4、多个symbol用Downloader并发下载，限速并且失败重试；仍然失败的symbol默认抛出DownloadError，
+       allow_partial为True时从symbol_list中去掉这些symbol继续回测，结果在download_report中
+    """
+
+    def __init__(self, events: queue.Queue, symbol_list, start_datetime, end_datetime, cache_dir=None, offline=False,
+                 ktype="15min", timeframes=None, max_workers=8, rate=None, rate_limiter=None, retries=3,
+                 allow_partial=False):
+        """
+        :param ktype:   tushare的ktype，即下载的数据的周期
+        :param timeframes:  {周期的名字: add_timeframe的参数dict}，比如{"60min": {"bars": 4}}
+        :param max_workers: 同时下载的线程数
+        :param rate:    每秒最多的请求数，None表示不限速
+        :param rate_limiter:    多个DataHandler共用的RateLimiter，指定时忽略rate
+        :param retries: 每个请求失败之后重试的次数
+        :param allow_partial:   有symbol下载失败时是否继续
+        """
+        if offline and cache_dir is None:
+            raise ValueError("offline模式必须指定cache_dir")
+        self.ktype = ktype
+        self.cache = BarCache(cache_dir) if cache_dir is not None else None
+        self.offline = offline
+        self.downloader = Downloader(self.fetch_bars, max_workers=max_workers, rate=rate, rate_limiter=rate_limiter,
+                                     retries=retries)
+        self.allow_partial = allow_partial
+        self.download_report = None
         super(TushareDataHandler, self).__init__(events, symbol_list, start_datetime, end_datetime)
+        for name, spec in (timeframes or {}).items():
+            self.add_timeframe(name, **spec)
 
     def get_data_from_external(self):
         self.get_data_from_tushare()
 
+    def fetch_bars(self, symbol, start_datetime, end_datetime):
+        """
+        从tushare下载一个symbol的数据
+        :return:    (timestamps, columns)
+        """
+        import tushare as ts    # 只有真正下载时才需要tushare，读取缓存和其他数据源都不需要安装它
+        frame = ts.bar(symbol, start_date=start_datetime, end_date=end_datetime, ktype=self.ktype)
+        if frame is None or len(frame) == 0:
+            return np.empty(0, dtype=np.int64), {f: np.empty(0) for f in BAR_FIELDS}
+        return frame_to_arrays(frame)
+
     def get_data_from_tushare(self):
-        comb_index = None
-        for s in self.symbol_list:
-            self.symbol_data[s] = ts.bar(s, start_date=self.start_datetime,
-                                         end_date=self.end_datetime, ktype="15min")
-            self.symbol_data[s].sort_index(inplace=True)
-            if comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index = comb_index.union(self.symbol_data[s].index)
-            self.latest_symbol_data[s] = []
-        for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method="pad").iterrows()
+        if self.offline:
+            for s in self.symbol_list:
+                self.symbol_data[s] = self.cache.load(s, self.ktype, self.start_datetime, self.end_datetime,
+                                                      offline=True)
+            return
+        fetch = self.downloader.fetch_with_retry
+        if self.cache is None:
+            report = self.downloader.run(self.symbol_list, lambda s: fetch(s, self.start_datetime, self.end_datetime))
+        else:
+            report = self.downloader.run(self.symbol_list, lambda s: self.cache.load(
+                s, self.ktype, self.start_datetime, self.end_datetime, fetch=fetch))
+        self.download_report = report
+        if report.failures:
+            if not self.allow_partial:
+                raise DownloadError(report)
+            self.symbol_list = [s for s in self.symbol_list if s in report.results]
+        self.symbol_data.update(report.results)
+
+
+class BarStoreDataHandler(DataHandler):
+    """
+    直接使用一个已经加载好的BarStore的DataHandler，只是有自己独立的cursor
+    1、symbol_list和bar_store的symbol_list相同时不会复制数据，多个回测可以共享同一份（比如放在共享内存里的）数据
+    2、symbol_list是bar_store中的一部分symbol时，只复制这些symbol的列
+    """
+
+    def __init__(self, events: queue.Queue, symbol_list, start_datetime=None, end_datetime=None, bar_store=None):
+        self.source_store = bar_store
+        super(BarStoreDataHandler, self).__init__(events, symbol_list, start_datetime, end_datetime)
+
+    def get_data_from_external(self):
+        pass
+
+    def build_bar_store(self) -> BarStore:
+        source = self.source_store
+        n = source.length
+        if list(self.symbol_list) == source.symbol_list:
+            fields = {f: source.fields[f][:n] for f in BAR_FIELDS}
+        else:
+            columns = [source.symbol_index[s] for s in self.symbol_list]
+            fields = {f: source.fields[f][:n, columns] for f in BAR_FIELDS}
+        return BarStore.from_arrays(self.symbol_list, source.timestamp[:n], fields)
+
+
+class SyntheticDataHandler(DataHandler):
+    """
+    生成随机OHLCV数据的DataHandler，不需要网络，用固定的seed可以得到完全相同的数据，主要用于测试和benchmark
+    收盘价是几何随机游走，所有symbol的时间完全对齐，所以不需要再做对齐
+    """
+
+    def __init__(self, events: queue.Queue, symbol_list, start_datetime, end_datetime=None, n_bars=1000,
+                 freq_minutes=15, seed=0):
+        """
+        :param n_bars:  每个symbol的bar的个数
+        :param freq_minutes:    相邻两个bar之间的分钟数
+        :param seed:    随机数种子
+        """
+        self.n_bars = n_bars
+        self.freq_minutes = freq_minutes
+        self.seed = seed
+        super(SyntheticDataHandler, self).__init__(events, symbol_list, start_datetime, end_datetime)
+
+    def get_data_from_external(self):
+        pass
+
+    def build_bar_store(self) -> BarStore:
+        rng = np.random.RandomState(self.seed)
+        shape = (self.n_bars, len(self.symbol_list))
+        step = np.int64(self.freq_minutes * 60 * 10 ** 9)
+        timestamps = np.datetime64(self.start_datetime, "ns").view(np.int64) + np.arange(self.n_bars) * step
+        start_price = rng.uniform(5.0, 50.0, len(self.symbol_list))
+        close = start_price * np.exp(np.cumsum(rng.normal(0.0, 0.002, shape), axis=0))
+        open_ = np.vstack([start_price, close[:-1]])
+        spread = np.abs(rng.normal(0.0, 0.001, shape)) * close
+        fields = {"open": open_, "close": close,
+                  "high": np.maximum(open_, close) + spread, "low": np.minimum(open_, close) - spread,
+                  "vol": rng.randint(100, 100000, shape).astype(np.float64)}
+        return BarStore.from_arrays(self.symbol_list, timestamps, fields)
+
+
+class StreamingDataHandler(DataHandler):
+    """
+    流式的DataHandler：每个symbol提供一个按时间排好序的bar流，用k路归并对齐，每次update_bars只读取一个时间切片
+    1、不需要先把所有symbol的全部数据读进内存，第一个bar马上就可以发布
+    2、max_history指定bar_store最少保留的最近的bar的个数，内存占用只和symbol的个数以及max_history有关
+    """
+
+    def __init__(self, events: queue.Queue, symbol_list, start_datetime, end_datetime, max_history=1024):
+        """
+        :param max_history: bar_store最少保留的最近的bar的个数，也就是get_latest_bars的n的上限，None表示保留全部
+        """
+        self.max_history = max_history
+        super(StreamingDataHandler, self).__init__(events, symbol_list, start_datetime, end_datetime)
+
+    def get_data_from_external(self):
+        self.slices = merge_bar_streams(self.symbol_list, self.get_bar_streams())
+
+    @abstractmethod
+    def get_bar_streams(self):
+        """
+        :return:    {symbol: 迭代器}，每个元素是(timestamp, open, low, high, close, vol)，timestamp是int64纳秒
+        """
+        raise NotImplementedError("Should implement get_bar_streams(self)")
+
+    def build_bar_store(self) -> BarStore:
+        capacity = 1024 if self.max_history is None else 2 * self.max_history
+        return BarStore(self.symbol_list, capacity=capacity, max_history=self.max_history)
+
+    def seek(self, timestamp):
+        """
+        读取并发布timestamp及之前的全部时间切片，bar_store中保留最近的max_history个bar供get_latest_bars使用
+        """
+        for bar in self.slices:
+            if bar[0] > timestamp:
+                self.slices = chain([(bar[0], {f: v.copy() for f, v in bar[1].items()})], self.slices)
+                break
+            self.bar_store.append(bar[0], **bar[1])
+            self.bar_store.advance()
+
+    def update_bars(self):
+        """
+        从归并后的流中读取下一个时间切片放到bar_store中
+        """
+        bar = next(self.slices, None)
+        if bar is not None:
+            timestamp, values = bar
+            self.bar_store.append(timestamp, **values)
+        super(StreamingDataHandler, self).update_bars()
+
+
+class IterableDataHandler(StreamingDataHandler):
+    """
+    直接使用给定的bar流的StreamingDataHandler
+    """
+
+    def __init__(self, events: queue.Queue, symbol_list, start_datetime=None, end_datetime=None, streams=None,
+                 max_history=1024):
+        """
+        :param streams: {symbol: 可迭代对象}，格式见StreamingDataHandler.get_bar_streams
+        """
+        self.streams = streams
+        super(IterableDataHandler, self).__init__(events, symbol_list, start_datetime, end_datetime, max_history)
+
+    def get_bar_streams(self):
+        return self.streams
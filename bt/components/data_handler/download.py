@@ -0,0 +1,145 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DownloadError(RuntimeError):
+    """
+    有symbol下载失败时抛出，report中有成功的数据和每个失败的symbol的异常
+    """
+
+    def __init__(self, report):
+        self.report = report
+        super(DownloadError, self).__init__("%d个symbol下载失败：%s" % (
+            len(report.failures), ", ".join("%s(%r)" % (s, e) for s, e in report.failures.items())))
+
+
+class RateLimiter(object):
+    """
+    限速器，多个线程可以共用同一个实例，同一个数据源的所有请求应该共用一个
+    每个请求在加锁时预约一个发出的时间，然后在锁外等到这个时间，最多允许连续发出burst个请求
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param rate:    每秒最多的请求数
+        :param burst:   最多可以连续发出的请求数
+        """
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_time = clock()
+
+    def acquire(self):
+        """
+        等到可以发出下一个请求
+        """
+        with self.lock:
+            now = self.clock()
+            slot = max(self.next_time, now)
+            self.next_time = slot + self.interval
+        wait = slot - self.tolerance - now
+        if wait > 0:
+            self.sleep(wait)
+
+
+class DownloadReport(object):
+    """
+    一次批量下载的结果
+    results:    {symbol: 结果}，只包含成功的symbol
+    failures:   {symbol: 最后一次的异常}
+    attempts:   {symbol: 请求的次数}
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.failures = {}
+        self.attempts = {}
+
+    @property
+    def ok(self):
+        return not self.failures
+
+
+class Downloader(object):
+    """
+    并发地下载多个symbol的数据
+    1、用一个有上限的线程池，同时进行的请求数不超过max_workers
+    2、所有请求经过同一个RateLimiter，不会超过数据源的访问频率限制
+    3、失败的请求按指数退避重试retries次，仍然失败的symbol记录在DownloadReport.failures中，不影响其他symbol
+    """
+
+    def __init__(self, fetch, max_workers=8, rate=None, rate_limiter=None, retries=3, backoff=0.5, max_backoff=30.0,
+                 sleep=time.sleep):
+        """
+        :param fetch:   fetch(symbol, start_datetime, end_datetime) -> (timestamps, columns)
+        :param max_workers: 线程数
+        :param rate:    每秒最多的请求数，None表示不限速
+        :param rate_limiter:    共用的RateLimiter，指定时忽略rate
+        :param retries: 失败之后重试的次数
+        :param backoff: 第一次重试之前等待的秒数，之后每次翻倍
+        :param max_backoff: 等待的最长秒数
+        """
+        self.fetch = fetch
+        self.max_workers = max_workers
+        if rate_limiter is None and rate is not None:
+            rate_limiter = RateLimiter(rate, sleep=sleep)
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+        self.local = threading.local()
+
+    def fetch_with_retry(self, symbol, start_datetime, end_datetime):
+        """
+        限速并且带重试的fetch，签名和fetch相同，可以直接传给BarCache.load
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            self.local.attempts = getattr(self.local, "attempts", 0) + 1
+            try:
+                return self.fetch(symbol, start_datetime, end_datetime)
+            except Exception:
+                if attempt >= self.retries:
+                    raise
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            self.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+
+    def run(self, symbols, task):
+        """
+        在线程池中对每个symbol执行task
+        :param symbols: 交易品种的代码
+        :param task:    task(symbol) -> 结果，在task中应该用fetch_with_retry下载
+        :return:    DownloadReport
+        """
+        report = DownloadReport()
+
+        def run_one(symbol):
+            self.local.attempts = 0
+            try:
+                return symbol, task(symbol), None, self.local.attempts
+            except Exception as e:
+                return symbol, None, e, self.local.attempts
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for symbol, result, error, attempts in executor.map(run_one, symbols):
+                report.attempts[symbol] = attempts
+                if error is None:
+                    report.results[symbol] = result
+                else:
+                    report.failures[symbol] = error
+        return report
+
+    def download(self, symbols, start_datetime, end_datetime):
+        """
+        下载每个symbol在[start_datetime, end_datetime]的数据
+        :return:    DownloadReport，results是{symbol: (timestamps, columns)}
+        """
+        return self.run(symbols, lambda s: self.fetch_with_retry(s, start_datetime, end_datetime))
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bt.components.data_handler.bar_store import BAR_FIELDS, to_timestamp_array
+from bt.components.data_handler.cache import to_ns
+from bt.components.data_handler.data import StreamingDataHandler
+from bt.components.data_handler.merge import arrays_to_stream
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+CSV_COLUMNS = ("datetime",) + BAR_FIELDS
+
+
+def write_binary_bars(root, symbol, timestamps, columns):
+    """
+    把一个symbol的数据写成按列存储的二进制格式：root/symbol/目录下每个字段一个.npy文件，和BarCache的格式相同
+    :param timestamps:  升序的int64纳秒时间戳
+    :param columns:     {字段: 数组}
+    """
+    path = os.path.join(root, str(symbol))
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "datetime.npy"), np.asarray(timestamps, dtype=np.int64))
+    for f in BAR_FIELDS:
+        np.save(os.path.join(path, f + ".npy"), np.asarray(columns[f], dtype=np.float64))
+
+
+def binary_chunks(path, start_ns, end_ns, chunk_size):
+    """
+    按块读取二进制格式的数据，所有文件都是memory map的，用时间戳二分查找直接定位到start_ns
+    :return:    生成器，每次产生(timestamps, columns)，是memory map的切片
+    """
+    timestamps = np.load(os.path.join(path, "datetime.npy"), mmap_mode="r")
+    columns = {f: np.load(os.path.join(path, f + ".npy"), mmap_mode="r") for f in BAR_FIELDS}
+    lo = np.searchsorted(timestamps, start_ns, side="left")
+    hi = np.searchsorted(timestamps, end_ns, side="right")
+    for i in range(lo, hi, chunk_size):
+        j = min(i + chunk_size, hi)
+        yield timestamps[i:j], {f: columns[f][i:j] for f in BAR_FIELDS}
+
+
+def build_csv_index(csv_path, stride=4096, index_dir=None):
+    """
+    为CSV文件建立稀疏的时间索引：每stride行记录一次(时间戳, 这一行在文件中的字节偏移)
+    索引保存在csv_path + ".idx.npy"中（给出index_dir时保存在index_dir中），CSV文件比索引新时会重建
+    数据目录是只读的、不能写入索引时只在内存中使用这次建立的索引
+    :return:    形状为(k, 2)的int64数组
+    """
+    if index_dir is None:
+        index_path = csv_path + ".idx.npy"
+    else:
+        index_path = os.path.join(index_dir, os.path.basename(csv_path) + ".idx.npy")
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(csv_path):
+        return np.load(index_path)
+    entries = []
+    with open(csv_path, "rb") as f:
+        f.readline()  # 表头
+        row = 0
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if row % stride == 0 and line.strip():
+                entries.append((to_ns(line.split(b",", 1)[0].decode().strip()), offset))
+            row += 1
+    index = np.array(entries, dtype=np.int64).reshape(-1, 2)
+    try:
+        if index_dir is not None:
+            os.makedirs(index_dir, exist_ok=True)
+        np.save(index_path, index)
+    except OSError:
+        pass
+    return index
+
+
+def csv_chunks(csv_path, start_ns, end_ns, chunk_size, index_stride=4096, index_dir=None):
+    """
+    按块读取CSV格式的数据，用稀疏时间索引跳到start_ns附近再开始解析
+    CSV的列依次是datetime、open、low、high、close、vol，第一行是表头，行按时间升序排列
+    :param index_dir:   保存索引的目录，见build_csv_index
+    :return:    生成器，每次产生(timestamps, columns)
+    """
+    index = build_csv_index(csv_path, index_stride, index_dir)
+    if len(index) == 0:
+        return
+    k = max(np.searchsorted(index[:, 0], start_ns, side="right") - 1, 0)
+    with open(csv_path, "rb") as f:
+        f.seek(index[k, 1])
+        reader = pd.read_csv(f, header=None, names=list(CSV_COLUMNS), chunksize=chunk_size,
+                             float_precision="round_trip")
+        for frame in reader:
+            timestamps = to_timestamp_array(pd.to_datetime(frame["datetime"]))
+            lo = np.searchsorted(timestamps, start_ns, side="left")
+            hi = np.searchsorted(timestamps, end_ns, side="right")
+            if lo < hi:
+                yield timestamps[lo:hi], {f: frame[f].values[lo:hi].astype(np.float64) for f in BAR_FIELDS}
+            if hi < len(timestamps):
+                break
+
+
+class Prefetcher(object):
+    """
+    在后台线程中提前读取下一个块，当前块被消费的同时下一个块已经在读了
+    对于memory map的数据，预读就是在后台把下一块复制到内存里，让缺页发生在后台线程
+    """
+
+    def __init__(self, chunks, executor: ThreadPoolExecutor):
+        self.chunks = chunks
+        self.executor = executor
+        self.future = executor.submit(self._read_next)
+
+    def _read_next(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return None
+        timestamps, columns = chunk
+        return np.array(timestamps), {f: np.array(columns[f]) for f in BAR_FIELDS}
+
+    def __iter__(self):
+        while True:
+            chunk = self.future.result()
+            if chunk is None:
+                return
+            self.future = self.executor.submit(self._read_next)
+            yield chunk
+
+    def close(self):
+        """
+        等正在进行的预读结束，然后关闭块的生成器（和它打开的文件）
+        """
+        if not self.future.cancel():
+            try:
+                self.future.result()
+            except Exception:
+                pass
+        self.chunks.close()
+
+
+class FileDataHandler(StreamingDataHandler):
+    """
+    从本地文件按块读取数据的DataHandler，适合放不进内存的大量分钟线数据
+    1、每个symbol一个文件：fmt为"csv"时是root/symbol.csv，fmt为"binary"时是root/symbol/目录（见write_binary_bars）
+    2、用时间索引直接定位到start_datetime，每次只读chunk_size行，并且在后台线程中预读下一块
+    3、各个symbol的数据流用StreamingDataHandler的k路归并对齐
+    """
+
+    def __init__(self, events: queue.Queue, symbol_list, start_datetime, end_datetime, root=None, fmt="binary",
+                 chunk_size=65536, max_history=1024, prefetch_workers=4, index_dir=None):
+        """
+        :param root:    数据所在的目录
+        :param fmt:     "csv"或者"binary"
+        :param chunk_size:  每次读取的行数
+        :param max_history: bar_store最少保留的最近的bar的个数
+        :param prefetch_workers:    预读所用的线程数
+        :param index_dir:   保存CSV时间索引的目录，默认和CSV文件放在一起，root是只读的时候可以指定一个可写的目录
+        """
+        if fmt not in ("csv", "binary"):
+            raise ValueError("fmt只能是csv或者binary")
+        self.root = root
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.index_dir = index_dir
+        self.executor = ThreadPoolExecutor(max_workers=prefetch_workers)
+        self.prefetchers = []
+        super(FileDataHandler, self).__init__(events, symbol_list, start_datetime, end_datetime, max_history)
+
+    def symbol_chunks(self, symbol):
+        start_ns = to_ns(self.start_datetime) if self.start_datetime is not None else np.iinfo(np.int64).min
+        end_ns = to_ns(self.end_datetime) if self.end_datetime is not None else np.iinfo(np.int64).max
+        if self.fmt == "csv":
+            return csv_chunks(os.path.join(self.root, "%s.csv" % symbol), start_ns, end_ns, self.chunk_size,
+                              index_dir=self.index_dir)
+        return binary_chunks(os.path.join(self.root, str(symbol)), start_ns, end_ns, self.chunk_size)
+
+    def get_bar_streams(self):
+        self.prefetchers = [Prefetcher(self.symbol_chunks(s), self.executor) for s in self.symbol_list]
+        return {s: self.symbol_stream(prefetcher) for s, prefetcher in zip(self.symbol_list, self.prefetchers)}
+
+    @staticmethod
+    def symbol_stream(chunks):
+        for timestamps, columns in chunks:
+            yield from arrays_to_stream(timestamps, columns)
+
+    def update_bars(self):
+        super(FileDataHandler, self).update_bars()
+        if not self.continue_backtest:
+            self.close()
+
+    def close(self):
+        """
+        停止预读，关闭打开的文件，结束预读的线程；数据读完时会自动调用，中途放弃的回测需要自己调用
+        """
+        for prefetcher in self.prefetchers:
+            prefetcher.close()
+        self.prefetchers = []
+        self.executor.shutdown(wait=True)
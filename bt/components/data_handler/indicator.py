@@ -0,0 +1,279 @@
+from collections import deque
+
+import numpy as np
+
+from bt.components.data_handler.bar_store import BarStore
+from bt.components.data_handler.resample import NS_PER_DAY
+
+
+class Indicator(object):
+    """
+    增量计算的技术指标，所有symbol的值放在一个长度为symbol数的数组values中
+    1、每来一个bar调用一次update，代价和窗口的长度无关
+    2、窗口还没有填满或者还没有数据的symbol，值是nan
+    3、输入是nan（比如这个symbol还没有开始交易）时不更新这个symbol
+    """
+
+    def __init__(self, symbol_list):
+        self.symbol_list = list(symbol_list)
+        self.symbol_index = {s: i for i, s in enumerate(self.symbol_list)}
+        self.values = np.full(len(self.symbol_list), np.nan)
+
+    def update(self, bar_store: BarStore, row):
+        """
+        用bar_store中的第row个bar更新
+        """
+        raise NotImplementedError("Should implement update(self, bar_store, row)")
+
+    def value(self, symbol):
+        """
+        返回某个symbol的最新的值
+        """
+        return self.values[self.symbol_index[symbol]]
+
+
+class RollingWindow(Indicator):
+    """
+    固定长度的滑动窗口，用环形数组保存窗口中的值，count是每个symbol窗口中有效值的个数
+    """
+
+    def __init__(self, symbol_list, window, field="close"):
+        super(RollingWindow, self).__init__(symbol_list)
+        if window < 1:
+            raise ValueError("window必须大于0")
+        self.window = window
+        self.field = field
+        self.buffer = np.zeros((window, len(self.symbol_list)))
+        self.valid = np.zeros((window, len(self.symbol_list)), dtype=bool)
+        self.position = 0
+        self.count = np.zeros(len(self.symbol_list), dtype=np.int64)
+
+    def push(self, x):
+        """
+        把x放进窗口，返回被挤出窗口的(旧值, 旧值是否有效, 新值是否有效)
+        """
+        valid = ~np.isnan(x)
+        old = self.buffer[self.position].copy()
+        old_valid = self.valid[self.position].copy()
+        self.buffer[self.position] = np.where(valid, x, 0.0)
+        self.valid[self.position] = valid
+        self.position = (self.position + 1) % self.window
+        self.count += valid.astype(np.int64) - old_valid
+        return old, old_valid, valid
+
+    def update(self, bar_store: BarStore, row):
+        self.push(bar_store.fields[self.field][row])
+
+
+class RollingMoments(RollingWindow):
+    """
+    窗口内的均值和离差平方和，用Welford算法增量地加入新值、去掉旧值，不会像sum和sum of squares那样损失精度
+    """
+
+    def __init__(self, symbol_list, window, field="close"):
+        super(RollingMoments, self).__init__(symbol_list, window, field)
+        self.mean = np.zeros(len(self.symbol_list))
+        self.m2 = np.zeros(len(self.symbol_list))
+
+    def update(self, bar_store: BarStore, row):
+        x = bar_store.fields[self.field][row]
+        old, old_valid, valid = self.push(x)
+        # 先去掉旧值（此时count已经是新的个数，去掉旧值之后的个数要扣掉新值）
+        n = self.count - valid
+        remaining = np.maximum(n, 1)
+        delta = np.where(old_valid, old - self.mean, 0.0)
+        mean = np.where(old_valid, np.where(n > 0, self.mean - delta / remaining, 0.0), self.mean)
+        m2 = np.where(old_valid, np.where(n > 0, self.m2 - delta * (old - mean), 0.0), self.m2)
+        # 再加入新值
+        total = np.maximum(self.count, 1)
+        delta = np.where(valid, np.nan_to_num(x) - mean, 0.0)
+        self.mean = np.where(valid, mean + delta / total, mean)
+        self.m2 = np.where(valid, m2 + delta * (np.nan_to_num(x) - self.mean), m2)
+        self.compute_values()
+
+    def compute_values(self):
+        raise NotImplementedError("Should implement compute_values(self)")
+
+
+class SMA(RollingMoments):
+    """
+    简单移动平均，和pandas的rolling(window).mean()一致
+    """
+
+    def compute_values(self):
+        self.values = np.where(self.count == self.window, self.mean, np.nan)
+
+
+class RollingVariance(RollingMoments):
+    """
+    滑动窗口的方差，和pandas的rolling(window).var(ddof=ddof)一致
+    """
+
+    def __init__(self, symbol_list, window, field="close", ddof=1):
+        super(RollingVariance, self).__init__(symbol_list, window, field)
+        self.ddof = ddof
+
+    def compute_values(self):
+        full = (self.count == self.window) & (self.window > self.ddof)
+        self.values = np.where(full, np.maximum(self.m2, 0.0) / max(self.window - self.ddof, 1), np.nan)
+
+
+class RollingStd(RollingVariance):
+    """
+    滑动窗口的标准差
+    """
+
+    def compute_values(self):
+        super(RollingStd, self).compute_values()
+        self.values = np.sqrt(self.values)
+
+
+class RollingExtreme(RollingWindow):
+    """
+    滑动窗口的最大值（或最小值），每个symbol用一个单调队列，每个bar的均摊代价是O(1)
+    """
+    take_max = True
+
+    def __init__(self, symbol_list, window, field="close"):
+        super(RollingExtreme, self).__init__(symbol_list, window, field)
+        self.queues = [deque() for _ in self.symbol_list]
+        self.n_updates = 0
+
+    def update(self, bar_store: BarStore, row):
+        x = bar_store.fields[self.field][row]
+        self.push(x)
+        t = self.n_updates
+        self.n_updates += 1
+        values = self.values
+        for j, q in enumerate(self.queues):
+            v = x[j]
+            if v == v:
+                if self.take_max:
+                    while q and q[-1][1] <= v:
+                        q.pop()
+                else:
+                    while q and q[-1][1] >= v:
+                        q.pop()
+                q.append((t, v))
+            while q and q[0][0] <= t - self.window:
+                q.popleft()
+            values[j] = q[0][1] if q and self.count[j] == self.window else np.nan
+
+
+class RollingMax(RollingExtreme):
+    """
+    滑动窗口的最大值，和pandas的rolling(window).max()一致
+    """
+    take_max = True
+
+
+class RollingMin(RollingExtreme):
+    """
+    滑动窗口的最小值，和pandas的rolling(window).min()一致
+    """
+    take_max = False
+
+
+class EMA(Indicator):
+    """
+    指数移动平均，和pandas的ewm(span=window, adjust=False).mean()一致，第一个值就是第一个bar的值
+    """
+
+    def __init__(self, symbol_list, window, field="close"):
+        super(EMA, self).__init__(symbol_list)
+        self.window = window
+        self.field = field
+        self.alpha = 2.0 / (window + 1)
+
+    def update(self, bar_store: BarStore, row):
+        x = bar_store.fields[self.field][row]
+        values = self.values
+        first = np.isnan(values) & ~np.isnan(x)
+        np.copyto(values, x, where=first)
+        later = ~first & ~np.isnan(x)
+        values[later] += self.alpha * (x[later] - values[later])
+
+
+class ATR(Indicator):
+    """
+    平均真实波幅，使用Wilder的平滑方法：前window个真实波幅的简单平均作为第一个值，之后ATR = (ATR * (window - 1) + TR) / window
+    第一个bar的真实波幅是high - low
+    """
+
+    def __init__(self, symbol_list, window=14):
+        super(ATR, self).__init__(symbol_list)
+        self.window = window
+        self.previous_close = np.full(len(self.symbol_list), np.nan)
+        self.tr_sum = np.zeros(len(self.symbol_list))
+        self.count = np.zeros(len(self.symbol_list), dtype=np.int64)
+
+    def update(self, bar_store: BarStore, row):
+        fields = bar_store.fields
+        high, low, close = fields["high"][row], fields["low"][row], fields["close"][row]
+        tr = np.fmax(high - low, np.fmax(np.abs(high - self.previous_close), np.abs(low - self.previous_close)))
+        valid = ~np.isnan(tr)
+        self.count += valid
+        warming = valid & (self.count <= self.window)
+        self.tr_sum[warming] += tr[warming]
+        seeded = valid & (self.count == self.window)
+        self.values[seeded] = self.tr_sum[seeded] / self.window
+        smoothing = valid & (self.count > self.window)
+        self.values[smoothing] = (self.values[smoothing] * (self.window - 1) + tr[smoothing]) / self.window
+        np.copyto(self.previous_close, close, where=~np.isnan(close))
+
+
+class VWAP(Indicator):
+    """
+    成交量加权平均价，价格使用典型价格(high + low + close) / 3
+    1、window为None时是当天的VWAP，每天的第一个bar重新开始累计
+    2、指定window时是最近window个bar的VWAP
+    """
+
+    def __init__(self, symbol_list, window=None):
+        super(VWAP, self).__init__(symbol_list)
+        self.window = window
+        n = len(self.symbol_list)
+        self.pv_sum = np.zeros(n)
+        self.vol_sum = np.zeros(n)
+        self.day = None
+        if window is not None:
+            self.pv_buffer = np.zeros((window, n))
+            self.vol_buffer = np.zeros((window, n))
+            self.position = 0
+
+    def update(self, bar_store: BarStore, row):
+        fields = bar_store.fields
+        price = (fields["high"][row] + fields["low"][row] + fields["close"][row]) / 3.0
+        vol = fields["vol"][row]
+        valid = ~np.isnan(price) & ~np.isnan(vol)
+        pv = np.where(valid, price * vol, 0.0)
+        vol = np.where(valid, vol, 0.0)
+        if self.window is None:
+            day = int(bar_store.timestamp[row]) // NS_PER_DAY
+            if day != self.day:
+                self.day = day
+                self.pv_sum[:] = 0.0
+                self.vol_sum[:] = 0.0
+        else:
+            self.pv_sum -= self.pv_buffer[self.position]
+            self.vol_sum -= self.vol_buffer[self.position]
+            self.pv_buffer[self.position] = pv
+            self.vol_buffer[self.position] = vol
+            self.position = (self.position + 1) % self.window
+        self.pv_sum += pv
+        self.vol_sum += vol
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.values = np.where(self.vol_sum > 0, self.pv_sum / self.vol_sum, np.nan)
+
+
+# add_indicator中可以使用的指标的名字
+INDICATORS = {
+    "sma": SMA,
+    "ema": EMA,
+    "var": RollingVariance,
+    "std": RollingStd,
+    "max": RollingMax,
+    "min": RollingMin,
+    "atr": ATR,
+    "vwap": VWAP,
+}
@@ -0,0 +1,49 @@
+import heapq
+
+import numpy as np
+
+from bt.components.data_handler.bar_store import BAR_FIELDS
+
+
+def arrays_to_stream(timestamps, columns):
+    """
+    把(timestamps, columns)转换成逐个bar的迭代器，每个元素是(timestamp, open, low, high, close, vol)
+    """
+    return zip(np.asarray(timestamps).tolist(), *(np.asarray(columns[f]).tolist() for f in BAR_FIELDS))
+
+
+def merge_bar_streams(symbol_list, streams):
+    """
+    用堆对每个symbol按时间排好序的bar流做k路归并，每次产生一个对齐之后的时间切片
+    1、没有在这个时间出现的symbol沿用它上一个bar的值（和reindex(method="pad")一致），但是vol是0，
+       还没有出现过的symbol是nan，和align_symbol_arrays的结果相同
+    2、任意时刻只保存每个symbol的一个bar，内存只和symbol的个数有关，第一个切片也不需要等所有数据都读完
+    :param symbol_list: 交易品种的代码
+    :param streams:     {symbol: 迭代器}，每个元素是(timestamp, open, low, high, close, vol)，timestamp是int64纳秒
+    :return:    生成器，每次产生(timestamp, {字段: 长度为symbol数的数组})；这些数组会被下一次的切片复用，需要的话请复制
+    """
+    latest = {f: np.full(len(symbol_list), np.nan) for f in BAR_FIELDS}
+    columns = [latest[f] for f in BAR_FIELDS]
+    iterators = [iter(streams[s]) for s in symbol_list]
+    heap = []
+    for j, it in enumerate(iterators):
+        bar = next(it, None)
+        if bar is not None:
+            heap.append((bar[0], j, bar))
+    heapq.heapify(heap)
+
+    vol = latest["vol"]
+    while heap:
+        timestamp = heap[0][0]
+        # 上一个切片之后没有新bar的symbol在这个切片中没有成交
+        np.copyto(vol, 0.0, where=~np.isnan(vol))
+        while heap and heap[0][0] == timestamp:
+            _, j, bar = heap[0]
+            for column, value in zip(columns, bar[1:]):
+                column[j] = value
+            bar = next(iterators[j], None)
+            if bar is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (bar[0], j, bar))
+        yield timestamp, latest
@@ -0,0 +1,64 @@
+import importlib
+
+ENTRY_POINT_GROUP = "bt.data_sources"
+
+# 名字 -> "模块:类名"，只有用到时才import对应的模块，模块依赖的tushare、pandas等也是那时才import
+_sources = {
+    "tushare": "bt.components.data_handler.data:TushareDataHandler",
+    "bar_store": "bt.components.data_handler.data:BarStoreDataHandler",
+    "synthetic": "bt.components.data_handler.data:SyntheticDataHandler",
+    "iterable": "bt.components.data_handler.data:IterableDataHandler",
+    "file": "bt.components.data_handler.file_data:FileDataHandler",
+}
+_entry_points_loaded = False
+
+
+def register_data_source(name, target):
+    """
+    注册一个数据源
+    :param name:    数据源的名字，BacktestEngine的data_handler_cls可以直接使用这个名字
+    :param target:  DataHandler的子类，或者"模块:类名"形式的字符串（用到时才import）
+    """
+    _sources[name] = target
+
+
+def _load_entry_points():
+    """
+    第三方的包可以在bt.data_sources这个entry point group中声明自己的数据源，第一次查找不到名字时才扫描
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    from importlib.metadata import entry_points
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        _sources.setdefault(entry_point.name, entry_point.value)
+
+
+def get_data_source(name):
+    """
+    :return:    名字对应的DataHandler的子类
+    """
+    if name not in _sources:
+        _load_entry_points()
+    try:
+        target = _sources[name]
+    except KeyError:
+        raise KeyError("未知的数据源%r，可用的数据源：%s" % (name, ", ".join(data_source_names()))) from None
+    if isinstance(target, str):
+        module_name, _, attr = target.partition(":")
+        target = getattr(importlib.import_module(module_name), attr)
+        _sources[name] = target
+    return target
+
+
+def data_source_names():
+    _load_entry_points()
+    return sorted(_sources)
+
+
+def resolve_data_handler(data_handler):
+    """
+    data_handler可以是DataHandler的子类，也可以是注册过的数据源的名字
+    """
+    return get_data_source(data_handler) if isinstance(data_handler, str) else data_handler
@@ -0,0 +1,75 @@
+import numpy as np
+
+from bt.components.data_handler.bar_store import BarStore
+
+NS_PER_MINUTE = 60 * 10 ** 9
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+
+
+class TimeframeAggregator(object):
+    """
+    把最细粒度的bar增量地合成为更大周期的bar，每来一个细粒度的bar，更新的代价是O(1)（对所有symbol做一次向量运算）
+    1、minutes模式：按照固定的时间网格分桶，桶的边界是offset_minutes加上minutes的整数倍，
+       closed为"right"时桶是左开右闭的（适合tushare这种用结束时间标记bar的数据）
+    2、bars模式：每bars个细粒度的bar合成一个，每天重新计数，适合有午休的A股，比如4个15分钟bar合成一个60分钟bar
+    3、合成的bar的时间是它包含的最后一个细粒度bar的时间，最新的一个合成bar可能还没有结束，会随着新的细粒度bar继续更新
+    4、vol是细粒度bar的vol之和；对齐时填充出来的bar的vol是0（见align_symbol_arrays），停牌的symbol不会重复累加成交量
+    """
+
+    def __init__(self, symbol_list, minutes=None, bars=None, offset_minutes=0, closed="right"):
+        if (minutes is None) == (bars is None):
+            raise ValueError("minutes和bars必须指定其中一个")
+        self.minutes = minutes
+        self.bars = bars
+        self.offset = offset_minutes * NS_PER_MINUTE
+        self.closed = closed
+        self.store = BarStore(symbol_list)
+        self.bucket = None
+        self.count = 0
+
+    def bucket_of(self, timestamp):
+        """
+        计算一个细粒度bar所属的桶
+        """
+        if self.bars is not None:
+            day = (timestamp - self.offset) // NS_PER_DAY
+            if self.bucket is not None and day == self.bucket[0] and self.count < self.bars:
+                return self.bucket
+            return day, timestamp
+        period = self.minutes * NS_PER_MINUTE
+        if self.closed == "right":
+            return (timestamp - self.offset - 1) // period
+        return (timestamp - self.offset) // period
+
+    def update(self, timestamp, open_, low, high, close, vol):
+        """
+        输入一个细粒度的bar，每个价格参数都是长度为symbol数的数组
+        """
+        timestamp = int(timestamp)
+        bucket = self.bucket_of(timestamp)
+        store = self.store
+        if bucket != self.bucket:
+            self.bucket = bucket
+            self.count = 1
+            store.append(timestamp, open=open_, low=low, high=high, close=close, vol=vol)
+            store.cursor = store.length
+            return
+        self.count += 1
+        row = store.length - 1
+        fields = store.fields
+        store.timestamp[row] = timestamp
+        # 对于还没有数据的symbol（nan），fmax/fmin会直接取新的值
+        np.fmax(fields["high"][row], high, out=fields["high"][row])
+        np.fmin(fields["low"][row], low, out=fields["low"][row])
+        previous_open = fields["open"][row]
+        np.copyto(previous_open, open_, where=np.isnan(previous_open))
+        np.copyto(fields["close"][row], close, where=~np.isnan(close))
+        fields["vol"][row] = np.nansum([fields["vol"][row], vol], axis=0)
+
+    def update_from(self, bar_store: BarStore, row):
+        """
+        用bar_store中的第row个bar更新
+        """
+        fields = bar_store.fields
+        self.update(bar_store.timestamp[row], fields["open"][row], fields["low"][row], fields["high"][row],
+                    fields["close"][row], fields["vol"][row])
@@ -0,0 +1,58 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bt.components.data_handler.bar_store import BarStore, BAR_FIELDS
+
+
+class SharedBarStore(object):
+    """
+    把一个BarStore的全部数据复制到一块共享内存中，其他进程可以通过handle直接映射这块内存，不需要再加载和对齐数据
+    1、创建SharedBarStore的进程负责调用close()释放共享内存
+    2、handle是一个很小的可以pickle的dict，传给子进程之后用attach_bar_store(handle)得到BarStore
+    """
+
+    def __init__(self, bar_store: BarStore):
+        n, m = bar_store.length, len(bar_store.symbol_list)
+        size = max(8 * n + 8 * n * m * len(BAR_FIELDS), 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.handle = {"name": self.shm.name, "symbol_list": list(bar_store.symbol_list), "length": n}
+        timestamps, fields = _map_arrays(self.shm.buf, n, m)
+        timestamps[:] = bar_store.timestamp[:n]
+        for f in BAR_FIELDS:
+            fields[f][:] = bar_store.fields[f][:n]
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _map_arrays(buf, n, m):
+    timestamps = np.ndarray((n,), dtype=np.int64, buffer=buf, offset=0)
+    offset = 8 * n
+    fields = {}
+    for f in BAR_FIELDS:
+        fields[f] = np.ndarray((n, m), dtype=np.float64, buffer=buf, offset=offset)
+        offset += 8 * n * m
+    return timestamps, fields
+
+
+_attached = {}
+
+
+def attach_bar_store(handle) -> BarStore:
+    """
+    在当前进程中映射SharedBarStore的共享内存，同一个进程对同一个handle只会映射一次
+    :param handle:  SharedBarStore.handle
+    :return:    只读的BarStore，数据不会被复制
+    """
+    name = handle["name"]
+    if name not in _attached:
+        shm = shared_memory.SharedMemory(name=name)
+        timestamps, fields = _map_arrays(shm.buf, handle["length"], len(handle["symbol_list"]))
+        timestamps.flags.writeable = False
+        for f in BAR_FIELDS:
+            fields[f].flags.writeable = False
+        _attached[name] = (shm, timestamps, fields)
+    shm, timestamps, fields = _attached[name]
+    return BarStore.from_arrays(handle["symbol_list"], timestamps, fields)
@@ -1,8 +1,10 @@
-from enum import Enum, unique
+from enum import IntEnum, unique
+
+from bt.components.logs import logger
 
 
 @unique
-class EventType(Enum):
+class EventType(IntEnum):
     MARKET = 0
     SIGNAL = 1
     ORDER = 2
@@ -12,27 +14,27 @@ class EventType(Enum):
 class Event(object):
     """
     Event类是为其子类提供接口的
+    1、事件类型type_enum是一个普通的类属性，不需要每个实例都保存一份
+    2、所有子类都使用__slots__，没有实例的__dict__，创建更快，占用的内存也更少
     """
-
-    @property
-    def type_enum(self):
-        return self._type
-    pass
+    __slots__ = ()
+    type_enum = None
 
 
 class MarketEvent(Event):
     """
-    用来驱动市场数据的更新
+    用来驱动市场数据的更新，它没有任何字段，所以可以只创建一个实例反复使用（见DataHandler.reuse_market_event）
     """
-
-    def __init__(self):
-        self._type = EventType.MARKET
+    __slots__ = ()
+    type_enum = EventType.MARKET
 
 
 class SignalEvent(Event):
     """
     它是来自strategy的event，将要被portfolio接受，portfolio会在之上做出反应
     """
+    __slots__ = ("symbol", "datetime", "signal_type", "strength")
+    type_enum = EventType.SIGNAL
 
     def __init__(self, symbol, datetime, signal_type, strength):
         """
@@ -42,7 +44,6 @@ class SignalEvent(Event):
         :param signal_type: 这个参数的可选有"SHORT"和"LONG"和"EXIT"
         :param strength: 对持仓数量的控制，感觉有点像“手”的意思
         """
-        self._type = EventType.SIGNAL
         self.symbol = symbol
         self.datetime = datetime
         self.signal_type = signal_type
@@ -53,43 +54,47 @@ class OrderEvent(Event):
     """
     OrderEvent将被发送给execution handler处理
     """
+    __slots__ = ("symbol", "quantity", "direction", "order_type", "price")
+    type_enum = EventType.ORDER
 
-    def __init__(self, symbol, quantity, direction, order_type):
+    def __init__(self, symbol, quantity, direction, order_type, price=None):
         """
         初始化OrderEvent
         :param symbol:  交易品种的代码
         :param quantity:    交易的数量
         :param direction:   交易的方向，可选的有"BUY"和"SELL"
         :param order_type:  订单的类型，可选的有："MKT"，表示Market；"LMT"：表示Limit
+        :param price:   限价单的价格，市价单为None
         """
-        self._type = EventType.ORDER
         self.symbol = symbol
         self.quantity = quantity
         self.direction = direction
         self.order_type = order_type
+        self.price = price
 
     def print_order(self):
-        print("Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s" % (self.symbol, self.type_enum,
-                                                                        self.quantity, self.direction))
+        logger.info("Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s", self.symbol, self.order_type,
+                    self.quantity, self.direction)
 
 
 class FillEvent(Event):
     """
     一个FillEvent里面包含了这个订单被执行之后的详细信息，包括佣金，交易数量什么的
     """
+    __slots__ = ("time_index", "symbol", "exchange", "quantity", "direction", "fill_cost", "commission")
+    type_enum = EventType.FILL
 
     def __init__(self, time_index, symbol, exchange, quantity, direction, fill_cost, commission=None):
         """
         初始化
-        :param time_index:  The bar-resolution when the order was filled.
+        :param time_index:  成交的时间，回测中是成交的bar的int64纳秒时间戳
         :param symbol:      交易品种的代码
         :param exchange:    交易所
         :param quantity:    交易的量
         :param direction:   交易的方向，可选的有："BUY"和"SELL"
-        :param fill_cost:   交易后的持仓
+        :param fill_cost:   成交的均价，None表示按最新的收盘价计算
         :param commission:  An optional commission sent from IB.
         """
-        self._type = EventType.FILL
         self.time_index = time_index
         self.symbol = symbol
         self.exchange = exchange
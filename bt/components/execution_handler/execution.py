@@ -9,10 +9,23 @@ from bt.components.event.event import OrderEvent, FillEvent, EventType
 class ExecutionHandler(metaclass=ABCMeta):
     """
     ExecutionHandler是用来处理portfolio和市场数据的相互交互的，填充FillEvent
+    on_market不为None时，回测引擎会在每个MarketEvent上最先调用它，用于按bar撮合挂着的订单
     """
+    on_market = None
 
-    def __init__(self, events: Queue):
+    def __init__(self, events: Queue, data_handler=None):
+        """
+        :param events:  消息队列
+        :param data_handler:    DataHandler，用于取得成交的时间和价格，可以不传
+        """
         self.events = events
+        self.data_handler = data_handler
+
+    def bind(self, data_handler):
+        """
+        回测引擎在构造之后调用，把data_handler交给broker；只接受events的子类也会得到data_handler
+        """
+        self.data_handler = data_handler
 
     @abstractclassmethod
     def execute_order(self, event: OrderEvent):
@@ -28,14 +41,20 @@ class SimulatedExecutionHandler(ExecutionHandler):
     """
     1、SimulatedExecutionHandler只是把一个OrderEvent转化成了FillEvent，这只是简单的转化，本类中没有考虑延迟、滑点和填充率的问题
     2、在实现一个复杂的执行系统之前，这个简单的ExecutionHandler对任何一个策略都是到来就立即执行
+    3、给了data_handler时按最新的bar的时间和收盘价成交，否则成交时间是当前时间，价格由portfolio按收盘价计算
+    4、需要考虑部分成交、滑点和延迟时请使用matching.MatchingExecutionHandler
     """
 
-    def __init__(self, events: Queue):
-        super(SimulatedExecutionHandler, self).__init__(events)
+    def __init__(self, events: Queue, data_handler=None):
+        super(SimulatedExecutionHandler, self).__init__(events, data_handler)
 
     def execute_order(self, event: OrderEvent):
         if event.type_enum == EventType.ORDER:
-            fill_event = FillEvent(datetime.datetime.utcnow(), event.symbol, "SH", event.quantity, event.direction,
-                                   None)
+            if self.data_handler is None:
+                time_index, fill_cost = datetime.datetime.utcnow(), None
+            else:
+                time_index = self.data_handler.get_latest_bar_datetime()
+                fill_cost = self.data_handler.get_latest_bar_value(event.symbol, "close")
+            fill_event = FillEvent(time_index, event.symbol, "SH", event.quantity, event.direction, fill_cost)
             self.events.put(fill_event)
         pass
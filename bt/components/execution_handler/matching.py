@@ -0,0 +1,313 @@
+import heapq
+from bisect import insort
+from collections import deque
+from queue import Queue
+
+import numpy as np
+
+from bt.components.event.event import OrderEvent, FillEvent, EventType, MarketEvent
+from bt.components.execution_handler.execution import ExecutionHandler
+
+
+class FixedSlippage(object):
+    """
+    固定比例的滑点，买入价格上浮、卖出价格下浮bps个基点
+    """
+
+    def __init__(self, bps=0.0):
+        self.rate = bps / 10000.0
+
+    def __call__(self, price, direction, quantity, volume):
+        return price * (1 + self.rate) if direction == "BUY" else price * (1 - self.rate)
+
+
+class VolumeSlippage(object):
+    """
+    和成交量占bar成交量的比例成正比的滑点，冲击成本 = impact * quantity / volume
+    """
+
+    def __init__(self, impact=0.1):
+        self.impact = impact
+
+    def __call__(self, price, direction, quantity, volume):
+        rate = self.impact * quantity / volume
+        return price * (1 + rate) if direction == "BUY" else price * (1 - rate)
+
+
+class FixedLatency(object):
+    """
+    固定的延迟，单位是纳秒
+    """
+
+    def __init__(self, ns=0):
+        self.ns = int(ns)
+
+    def __call__(self, order):
+        return self.ns
+
+
+class RandomLatency(object):
+    """
+    服从指数分布的随机延迟，mean_ns是平均延迟，单位是纳秒
+    """
+
+    def __init__(self, mean_ns, seed=0):
+        self.mean_ns = mean_ns
+        self.rng = np.random.RandomState(seed)
+
+    def __call__(self, order):
+        return int(self.rng.exponential(self.mean_ns))
+
+
+class Order(object):
+    """
+    订单簿中的一个订单，remaining是还没有成交的数量，price为None表示市价单
+    """
+    __slots__ = ("order_id", "symbol", "direction", "quantity", "remaining", "price", "arrival")
+
+    def __init__(self, order_id, symbol, direction, quantity, price, arrival):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.direction = direction
+        self.quantity = quantity
+        self.remaining = quantity
+        self.price = price
+        self.arrival = arrival
+
+
+class BookSide(object):
+    """
+    订单簿的一边：市价单一个FIFO队列，限价单按价格分档，每一档一个FIFO队列，prices是升序排列的价格
+    """
+    __slots__ = ("market", "levels", "prices")
+
+    def __init__(self):
+        self.market = deque()
+        self.levels = {}
+        self.prices = []
+
+
+class OrderBook(object):
+    """
+    一个symbol的订单簿
+    """
+    __slots__ = ("bids", "asks")
+
+    def __init__(self):
+        self.bids = BookSide()
+        self.asks = BookSide()
+
+
+class MatchingExecutionHandler(ExecutionHandler):
+    """
+    按bar撮合的模拟交易所
+    1、订单经过latency的延迟之后才进入订单簿，每个新的bar到来时（on_market），用这个bar的数据撮合所有已经到达的订单，
+       所以在某个bar上下的单最早在下一个bar成交
+    2、市价单按bar的开盘价成交；限价买单在bar的最低价不高于限价时成交，价格是限价和开盘价中较低的一个，限价卖单相反
+    3、每个bar每一边最多成交participation * bar成交量，按价格优先、时间优先（FIFO）的顺序分配，没有成交完的部分留到下一个bar，
+       participation为None表示不限制
+    4、成交价格再经过slippage调整，限价单调整之后的价格不会比限价更差
+    """
+
+    def __init__(self, events: Queue, data_handler=None, slippage=None, latency=None, participation=0.1,
+                 exchange="SH"):
+        """
+        :param slippage:    slippage(price, direction, quantity, volume) -> 价格，默认没有滑点
+        :param latency:     latency(order) -> 纳秒，默认没有延迟
+        :param participation:   每个bar最多成交的数量占bar成交量的比例
+        :param exchange:    FillEvent中的交易所
+        """
+        super(MatchingExecutionHandler, self).__init__(events, data_handler)
+        self.slippage = slippage
+        self.latency = latency or FixedLatency()
+        self.participation = participation
+        self.exchange = exchange
+        self.books = {}
+        self.active = {}        # 订单簿不为空的symbol，用dict保证撮合的顺序是确定的（按订单到达的先后）
+        # 还没有到达的订单：按到达时间递增提交的订单（比如固定延迟）放在FIFO队列中，其余的放在按到达时间排序的堆中
+        self.incoming = deque()
+        self.delayed = []
+        self.orders = {}        # 还没有完成的订单
+        self.next_id = 0
+
+    def submit(self, symbol, quantity, direction, price=None, timestamp=None):
+        """
+        提交一个订单
+        :param price:   限价，None表示市价单
+        :param timestamp:   提交的时间，默认是最新的bar的时间
+        :return:    订单号
+        """
+        if timestamp is None:
+            timestamp = self.data_handler.get_latest_bar_datetime() if self.data_handler is not None else None
+        order_id = self.next_id
+        self.next_id += 1
+        order = Order(order_id, symbol, direction, quantity, price, timestamp or 0)
+        latency = self.latency
+        order.arrival += latency.ns if type(latency) is FixedLatency else latency(order)
+        self.orders[order_id] = order
+        incoming = self.incoming
+        if not incoming or incoming[-1].arrival <= order.arrival:
+            incoming.append(order)
+        else:
+            heapq.heappush(self.delayed, (order.arrival, order_id, order))
+        return order_id
+
+    def cancel(self, order_id):
+        """
+        撤销一个订单还没有成交的部分
+        :return:    撤销的数量
+        """
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return 0
+        remaining = order.remaining
+        order.remaining = 0
+        return remaining
+
+    def execute_order(self, event: OrderEvent):
+        if event.type_enum == EventType.ORDER:
+            price = event.price if event.order_type == "LMT" else None
+            self.submit(event.symbol, event.quantity, event.direction, price)
+
+    def on_market(self, event: MarketEvent = None):
+        bar_store = self.data_handler.bar_store
+        # 数据结束时的MarketEvent没有新的bar，不能用最后一个bar再撮合一次
+        if bar_store.cursor == 0 or not self.data_handler.continue_backtest:
+            return
+        row = bar_store.cursor - 1
+        fields = bar_store.fields
+        self.match(int(bar_store.timestamp[row]), bar_store.symbol_index, fields["open"][row], fields["low"][row],
+                   fields["high"][row], fields["vol"][row])
+
+    def _arrive(self, orders):
+        """
+        把已经到达的订单放进订单簿
+        """
+        books = self.books
+        active = self.active
+        for order in orders:
+            if order.remaining <= 0:
+                continue
+            symbol = order.symbol
+            book = books.get(symbol)
+            if book is None:
+                book = books[symbol] = OrderBook()
+            side = book.bids if order.direction == "BUY" else book.asks
+            price = order.price
+            if price is None:
+                side.market.append(order)
+            else:
+                level = side.levels.get(price)
+                if level is None:
+                    level = side.levels[price] = deque()
+                    insort(side.prices, price)
+                level.append(order)
+            active[symbol] = None
+
+    def match(self, timestamp, symbol_index, open_, low, high, vol):
+        """
+        用一个bar的数据撮合所有的订单簿
+        :param timestamp:   bar的时间
+        :param symbol_index:    {symbol: 列}
+        :param open_, low, high, vol:   长度为symbol数的数组
+        """
+        incoming = self.incoming
+        if incoming and incoming[0].arrival < timestamp:
+            if incoming[-1].arrival < timestamp:
+                self._arrive(incoming)
+                incoming.clear()
+            else:
+                arrived = []
+                while incoming[0].arrival < timestamp:
+                    arrived.append(incoming.popleft())
+                self._arrive(arrived)
+        delayed = self.delayed
+        if delayed and delayed[0][0] < timestamp:
+            arrived = []
+            while delayed and delayed[0][0] < timestamp:
+                arrived.append(heapq.heappop(delayed)[2])
+            self._arrive(arrived)
+        if not self.active:
+            return
+
+        open_, low, high, vol = open_.tolist(), low.tolist(), high.tolist(), vol.tolist()
+        books = self.books
+        participation = self.participation
+        finished = []
+        for symbol in self.active:
+            j = symbol_index[symbol]
+            bar_open, bar_vol = open_[j], vol[j]
+            if bar_open != bar_open or not bar_vol > 0:
+                continue
+            book = books[symbol]
+            capacity = bar_vol if participation is None else bar_vol * participation
+            bids, asks = book.bids, book.asks
+            if bids.market or bids.prices:
+                self._match_side(timestamp, bids, "BUY", capacity, bar_open, low[j], bar_vol)
+            if asks.market or asks.prices:
+                self._match_side(timestamp, asks, "SELL", capacity, bar_open, high[j], bar_vol)
+            if not (bids.market or bids.prices or asks.market or asks.prices):
+                finished.append(symbol)
+        for symbol in finished:
+            del self.active[symbol]
+
+    def _match_side(self, timestamp, side: BookSide, direction, capacity, bar_open, bar_extreme, bar_vol):
+        """
+        撮合订单簿的一边，bar_extreme对于买单是最低价，对于卖单是最高价
+        """
+        buy = direction == "BUY"
+        if side.market:
+            capacity = self._fill_queue(timestamp, side.market, None, direction, capacity, bar_open, bar_vol)
+        prices = side.prices
+        levels = side.levels
+        while capacity >= 1 and prices:
+            if buy:
+                price = prices[-1]
+                if price < bar_extreme:
+                    break
+                fill_price = price if price < bar_open else bar_open
+            else:
+                price = prices[0]
+                if price > bar_extreme:
+                    break
+                fill_price = price if price > bar_open else bar_open
+            level = levels[price]
+            capacity = self._fill_queue(timestamp, level, price, direction, capacity, fill_price, bar_vol)
+            if level:
+                break
+            del levels[price]
+            if buy:
+                prices.pop()
+            else:
+                del prices[0]
+
+    def _fill_queue(self, timestamp, queue, limit, direction, capacity, price, bar_vol):
+        """
+        按FIFO的顺序成交一个队列中的订单，返回剩余的可成交数量
+        """
+        put = self.events.put
+        orders = self.orders
+        slippage = self.slippage
+        exchange = self.exchange
+        buy = direction == "BUY"
+        fill_price = price
+        while queue and capacity >= 1:
+            order = queue[0]
+            remaining = order.remaining
+            if remaining <= 0:
+                queue.popleft()
+                continue
+            quantity = remaining if remaining <= capacity else int(capacity)
+            if slippage is not None:
+                fill_price = slippage(price, direction, quantity, bar_vol)
+                if limit is not None:
+                    fill_price = min(fill_price, limit) if buy else max(fill_price, limit)
+            put(FillEvent(timestamp, order.symbol, exchange, quantity, direction, fill_price))
+            capacity -= quantity
+            if quantity == remaining:
+                order.remaining = 0
+                queue.popleft()
+                del orders[order.order_id]
+            else:
+                order.remaining = remaining - quantity
+        return capacity
@@ -0,0 +1,43 @@
+import importlib
+import sys
+import types
+
+_proxies = {}
+_hooks = {}
+
+
+class LazyModule(types.ModuleType):
+    """
+    一个还没有真正import的模块的代理，第一次读取它的属性时才import
+    import之后模块的属性会复制到代理的__dict__中，之后的读取和直接使用模块一样快
+    """
+
+    def __getattr__(self, attr):
+        name = self.__name__
+        module = importlib.import_module(name)
+        self.__dict__.update(module.__dict__)
+        for hook in _hooks.pop(name, ()):
+            hook(module)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    代替import name，比如pd = lazy_import("pandas")，模块在第一次被使用时才import
+    同一个模块的所有调用共用一个代理
+    """
+    proxy = _proxies.get(name)
+    if proxy is None:
+        proxy = _proxies[name] = LazyModule(name)
+    return proxy
+
+
+def on_import(name, hook):
+    """
+    lazy_import(name)的模块第一次被使用时调用hook(module)；已经被使用过时立即调用
+    """
+    proxy = lazy_import(name)
+    if proxy.__dict__.get("__spec__") is not None:     # import之后__spec__才会从模块复制过来
+        hook(sys.modules[name])
+    else:
+        _hooks.setdefault(name, []).append(hook)
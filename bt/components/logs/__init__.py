@@ -1,6 +1,49 @@
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
-logging.basicConfig(format="%(levelname)s: %(asctime)s %(filename)s line-%(lineno)d:  %(message)s",
-                    datefmt="%H:%M:%S")
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+LOG_FORMAT = "%(levelname)s: %(asctime)s %(filename)s line-%(lineno)d:  %(message)s"
+
+# 只使用自己的"bt"logger，不修改root logger，不影响其他库的日志
+logger = logging.getLogger("bt")
+logger.addHandler(logging.NullHandler())
+
+_console = None     # (QueueHandler, QueueListener)
+
+
+def set_log_level(level):
+    """
+    设置bt的日志级别，比如logging.DEBUG或者"INFO"
+    """
+    logger.setLevel(level)
+
+
+def enable_console_logging(level=logging.INFO, fmt=LOG_FORMAT):
+    """
+    把bt的日志输出到控制台：回测线程只是把日志放进队列，由后台线程写控制台，控制台的I/O不会阻塞回测
+    """
+    global _console
+    disable_console_logging()
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(fmt, datefmt="%H:%M:%S"))
+    listener = QueueListener(records, stream)
+    listener.start()
+    handler = QueueHandler(records)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    _console = (handler, listener)
+
+
+def disable_console_logging():
+    """
+    停止输出到控制台，队列中剩下的日志会先写完
+    """
+    global _console
+    if _console is not None:
+        handler, listener = _console
+        logger.removeHandler(handler)
+        listener.stop()
+        logger.propagate = True
+        _console = None
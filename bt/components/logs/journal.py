@@ -0,0 +1,195 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from bt.components.event.event import EventType, SignalEvent, OrderEvent, FillEvent, MarketEvent
+
+# 每种记录的固定格式，symbol是它在symbol_list中的下标，时间是int64纳秒时间戳
+RECORD_DTYPES = {
+    "signal": np.dtype([("time", "<i8"), ("symbol", "<i4"), ("signal_type", "i1"), ("strength", "<f8")]),
+    "order": np.dtype([("time", "<i8"), ("symbol", "<i4"), ("direction", "i1"), ("order_type", "i1"),
+                       ("quantity", "<f8"), ("price", "<f8")]),
+    "fill": np.dtype([("time", "<i8"), ("symbol", "<i4"), ("direction", "i1"), ("quantity", "<f8"),
+                      ("price", "<f8"), ("commission", "<f8")]),
+    "holdings": np.dtype([("time", "<i8"), ("cash", "<f8"), ("commission", "<f8"), ("total", "<f8")]),
+}
+
+SIGNAL_TYPES = {"LONG": 1, "SHORT": -1, "EXIT": 0}
+DIRECTIONS = {"BUY": 1, "SELL": -1}
+ORDER_TYPES = {"MKT": 0, "LMT": 1}
+
+
+class Journal(object):
+    """
+    二进制的交易日志，记录signal、order、fill和每个bar的资金快照
+    1、每种记录写进一个预先分配好的numpy结构化数组，写满之后整块交给后台线程追加到文件，回测线程中没有任何I/O
+    2、path是一个目录，每种记录一个.bin文件（固定格式的二进制行），header.json中是格式和symbol_list
+    3、用attach注册到BacktestEngine上，用read_journal读回来
+    """
+
+    def __init__(self, path, symbol_list, buffer_size=4096):
+        """
+        :param path:    日志的目录
+        :param symbol_list: 交易品种的代码
+        :param buffer_size: 每种记录的缓冲区的行数
+        """
+        self.path = path
+        self.symbol_list = list(symbol_list)
+        self.symbol_index = {s: i for i, s in enumerate(self.symbol_list)}
+        self.buffer_size = buffer_size
+        self.buffers = {kind: np.empty(buffer_size, dtype=dtype) for kind, dtype in RECORD_DTYPES.items()}
+        self.counts = {kind: 0 for kind in RECORD_DTYPES}
+        self.data_handler = None
+        self.portfolio = None
+
+        os.makedirs(path, exist_ok=True)
+        for kind in RECORD_DTYPES:
+            open(os.path.join(path, kind + ".bin"), "wb").close()
+        with open(os.path.join(path, "header.json"), "w") as f:
+            json.dump({"symbol_list": self.symbol_list,
+                       "dtypes": {kind: dtype.descr for kind, dtype in RECORD_DTYPES.items()}}, f)
+
+        self.pending = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self._write_loop, name="bt-journal", daemon=True)
+        self.writer.start()
+        self.closed = False
+
+    def _write_loop(self):
+        files = {kind: open(os.path.join(self.path, kind + ".bin"), "ab") for kind in RECORD_DTYPES}
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None:
+                    break
+                kind, block = item
+                block.tofile(files[kind])
+                files[kind].flush()
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _append(self, kind, record):
+        i = self.counts[kind]
+        self.buffers[kind][i] = record
+        i += 1
+        if i == self.buffer_size:
+            self.pending.put((kind, self.buffers[kind]))
+            self.buffers[kind] = np.empty(self.buffer_size, dtype=RECORD_DTYPES[kind])
+            i = 0
+        self.counts[kind] = i
+
+    def _now(self):
+        if self.data_handler is None:
+            return 0
+        return self.data_handler.get_latest_bar_datetime() or 0
+
+    def record_signal(self, event: SignalEvent):
+        time = event.datetime if isinstance(event.datetime, (int, np.integer)) else self._now()
+        self._append("signal", (time, self.symbol_index[event.symbol], SIGNAL_TYPES.get(event.signal_type, 0),
+                                event.strength))
+
+    def record_order(self, event: OrderEvent):
+        price = event.price if event.price is not None else np.nan
+        self._append("order", (self._now(), self.symbol_index[event.symbol], DIRECTIONS.get(event.direction, 0),
+                               ORDER_TYPES.get(event.order_type, -1), event.quantity, price))
+
+    def record_fill(self, event: FillEvent):
+        time = event.time_index if isinstance(event.time_index, (int, np.integer)) else self._now()
+        price = event.fill_cost if event.fill_cost is not None else np.nan
+        self._append("fill", (time, self.symbol_index[event.symbol], DIRECTIONS.get(event.direction, 0),
+                              event.quantity, price, event.commission))
+
+    def record_holdings(self, event: MarketEvent = None):
+        """
+        记录portfolio最新一期的资金快照，要在portfolio.update_timeindex之后调用
+        """
+        if not self.data_handler.continue_backtest:
+            return
+        holdings = self.portfolio.current_holdings
+        self._append("holdings", (self._now(), holdings["cash"], holdings["commission"],
+                                  self.portfolio.tracker.last_total))
+
+    def attach(self, engine):
+        """
+        注册到BacktestEngine上，记录所有的signal、order、fill，以及每个bar的资金快照
+        :return:    self
+        """
+        self.data_handler = engine.data_handler
+        self.portfolio = engine.portfolio
+        engine.register(EventType.SIGNAL, self.record_signal)
+        engine.register(EventType.ORDER, self.record_order)
+        engine.register(EventType.FILL, self.record_fill)
+        engine.register(EventType.MARKET, self.record_holdings)
+        return self
+
+    def flush(self):
+        """
+        把缓冲区中还没有写出的记录交给后台线程
+        """
+        for kind, n in self.counts.items():
+            if n:
+                self.pending.put((kind, self.buffers[kind][:n].copy()))
+                self.counts[kind] = 0
+
+    def close(self):
+        """
+        写出全部记录并等待后台线程结束
+        """
+        if self.closed:
+            return
+        self.flush()
+        self.pending.put(None)
+        self.writer.join()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JournalData(object):
+    """
+    read_journal读回来的日志，每种记录是一个numpy结构化数组，比如data["fill"]["price"]
+    """
+
+    def __init__(self, symbol_list, records):
+        self.symbol_list = symbol_list
+        self.records = records
+
+    def __getitem__(self, kind):
+        return self.records[kind]
+
+    def frame(self, kind):
+        """
+        转换成DataFrame，时间转换成datetime64，symbol转换成代码
+        """
+        import pandas as pd
+        frame = pd.DataFrame(self.records[kind])
+        frame["time"] = frame["time"].values.view("datetime64[ns]")
+        if "symbol" in frame:
+            frame["symbol"] = np.asarray(self.symbol_list, dtype=object)[frame["symbol"].values]
+        return frame
+
+
+def read_journal(path, mmap=True) -> JournalData:
+    """
+    读取Journal写出的日志
+    :param mmap:    为True时用memory map读取，不把整个文件读进内存
+    :return:    JournalData
+    """
+    with open(os.path.join(path, "header.json")) as f:
+        header = json.load(f)
+    records = {}
+    for kind, descr in header["dtypes"].items():
+        dtype = np.dtype([tuple(field) for field in descr])
+        file = os.path.join(path, kind + ".bin")
+        if mmap and os.path.getsize(file) > 0:
+            records[kind] = np.memmap(file, dtype=dtype, mode="r")
+        else:
+            records[kind] = np.fromfile(file, dtype=dtype)
+    return JournalData(header["symbol_list"], records)
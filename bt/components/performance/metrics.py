@@ -0,0 +1,212 @@
+"""
+批量计算绩效指标，输入是很多条曲线组成的二维数组，每一行是一次回测（run），每一列是一期
+所有函数都是沿着axis=1向量化计算的，一次调用就可以处理成千上万条曲线
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+PERIODS = 250 * 4 * 15  # 和create_sharp_ratio的默认值一致：15分钟的bar，每天16个，一年250天
+
+
+def _as_2d(values) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    return values[None, :] if values.ndim == 1 else values
+
+
+def returns_from_equity(equity) -> np.ndarray:
+    """
+    根据净值（或者总资产）计算每期的收益率，结果比输入少一列
+    :param equity:  形状为(run数, 期数)的净值
+    :return:    形状为(run数, 期数-1)的收益率
+    """
+    equity = _as_2d(equity)
+    return equity[:, 1:] / equity[:, :-1] - 1.0
+
+
+def sharpe_ratio(returns, periods=PERIODS) -> np.ndarray:
+    """
+    年化夏普比率，假设无风险收益率为0，忽略nan
+    :param returns: 形状为(run数, 期数)的收益率
+    :param periods: 一年的期数
+    :return:    长度为run数的数组
+    """
+    returns = _as_2d(returns)
+    # 没有nan时用mean和std，比nanmean和nanstd快得多
+    mean, std = (np.nanmean, np.nanstd) if np.isnan(returns).any() else (np.mean, np.std)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(periods) * mean(returns, axis=1) / std(returns, axis=1)
+
+
+def sortino_ratio(returns, periods=PERIODS, target=0.0) -> np.ndarray:
+    """
+    年化索提诺比率，分母是低于target的那部分收益率的下行标准差
+    :param returns: 形状为(run数, 期数)的收益率
+    :param periods: 一年的期数
+    :param target:  目标收益率
+    :return:    长度为run数的数组
+    """
+    returns = _as_2d(returns)
+    downside = np.minimum(returns - target, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        downside_dev = np.sqrt(np.nanmean(downside * downside, axis=1))
+        return np.sqrt(periods) * (np.nanmean(returns, axis=1) - target) / downside_dev
+
+
+def drawdowns(equity):
+    """
+    每期的回撤和回撤的持续期数，规则和create_drawdowns一致：回撤是最高水位线减去当前净值
+    :param equity:  形状为(run数, 期数)的净值，不能有nan
+    :return:    (drawdown, duration)，形状都和equity一样
+    """
+    equity = _as_2d(equity)
+    hwm = np.maximum.accumulate(np.maximum(equity, 0.0), axis=1)
+    drawdown = hwm - equity
+    index = np.broadcast_to(np.arange(equity.shape[1]), equity.shape)
+    last_zero = np.maximum.accumulate(np.where(drawdown == 0, index, 0), axis=1)
+    return drawdown, index - last_zero
+
+
+def max_drawdowns(equity):
+    """
+    :param equity:  形状为(run数, 期数)的净值
+    :return:    (最大回撤, 最长回撤持续期数)，都是长度为run数的数组
+    """
+    equity = _as_2d(equity)
+    runs, n = equity.shape
+    hwm = np.maximum.accumulate(np.maximum(equity, 0.0), axis=1)
+    # 和drawdowns的结果相同，但是不生成每期的回撤持续期数：标出回撤为0的期（第0期总是算作回撤为0），
+    # 再在末尾加一列，相邻两个标记之间的间隔减1就是这一段回撤的持续期数
+    at_hwm = np.empty((runs, n + 1), dtype=bool)
+    np.equal(hwm, equity, out=at_hwm[:, :n])
+    at_hwm[:, 0] = True
+    at_hwm[:, n] = True
+    max_drawdown = np.subtract(hwm, equity, out=hwm).max(axis=1)
+    positions = np.flatnonzero(at_hwm)
+    # 每个run的第一个标记在positions中的下标；从上一个run的末尾到下一个run开头的间隔是1，不影响最大值
+    firsts = np.searchsorted(positions, np.arange(runs) * (n + 1))
+    return max_drawdown, np.maximum.reduceat(np.diff(positions), firsts) - 1
+
+
+def annualized_returns(equity, periods=PERIODS) -> np.ndarray:
+    """
+    年化收益率
+    :param equity:  形状为(run数, 期数)的净值
+    :param periods: 一年的期数
+    :return:    长度为run数的数组
+    """
+    equity = _as_2d(equity)
+    years = (equity.shape[1] - 1) / periods
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (equity[:, -1] / equity[:, 0]) ** (1.0 / years) - 1.0
+
+
+def calmar_ratio(equity, periods=PERIODS) -> np.ndarray:
+    """
+    卡玛比率：年化收益率除以最大回撤
+    :param equity:  形状为(run数, 期数)的净值
+    :param periods: 一年的期数
+    :return:    长度为run数的数组
+    """
+    max_drawdown, _ = max_drawdowns(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return annualized_returns(equity, periods) / max_drawdown
+
+
+def rolling_volatility(returns, window, periods=PERIODS) -> np.ndarray:
+    """
+    年化的滚动波动率，用累加和计算，每个窗口的复杂度是O(1)
+    :param returns: 形状为(run数, 期数)的收益率，不能有nan
+    :param window:  窗口大小
+    :param periods: 一年的期数
+    :return:    形状和returns一样，前window-1期是nan
+    """
+    returns = _as_2d(returns)
+    result = np.full(returns.shape, np.nan)
+    if returns.shape[1] < window:
+        return result
+    # 先减去每行的均值，减小累加和相减时的精度损失
+    centered = returns - returns.mean(axis=1, keepdims=True)
+    s1 = np.cumsum(np.pad(centered, ((0, 0), (1, 0))), axis=1)
+    s2 = np.cumsum(np.pad(centered * centered, ((0, 0), (1, 0))), axis=1)
+    win_sum = s1[:, window:] - s1[:, :-window]
+    win_sq = s2[:, window:] - s2[:, :-window]
+    variance = np.maximum(win_sq / window - (win_sum / window) ** 2, 0.0)
+    result[:, window - 1:] = np.sqrt(variance * periods)
+    return result
+
+
+def turnover(positions, prices, total, periods=PERIODS) -> np.ndarray:
+    """
+    年化换手率：每期成交金额除以当期总资产，再按期数年化
+    :param positions:   形状为(run数, 期数, symbol数)的持仓
+    :param prices:      形状为(期数, symbol数)或者(run数, 期数, symbol数)的成交价格
+    :param total:       形状为(run数, 期数)的总资产
+    :param periods:     一年的期数
+    :return:    长度为run数的数组
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions.ndim == 2:
+        positions = positions[None]
+    total = _as_2d(total)
+    traded = np.abs(np.diff(positions, axis=1, prepend=0.0)) * np.nan_to_num(prices)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_period = traded.sum(axis=2) / total
+    return per_period.sum(axis=1) * periods / positions.shape[1]
+
+
+def drawdown_episodes(equity) -> pd.DataFrame:
+    """
+    列出每条曲线的每一次回撤
+    :param equity:  形状为(run数, 期数)的净值
+    :return:    每次回撤一行的DataFrame，列有：run、start（回撤开始的期）、trough（最低点的期）、
+                end（恢复到最高水位线的期，没有恢复的话是期数）、depth（回撤的深度）、length（end - start）、recovered
+    """
+    drawdown, _ = drawdowns(equity)
+    runs, n = drawdown.shape
+    in_drawdown = np.zeros((runs, n + 2), dtype=np.int8)
+    in_drawdown[:, 1:-1] = drawdown > 0
+    change = np.diff(in_drawdown, axis=1)
+    start_run, start = np.nonzero(change == 1)
+    _, end = np.nonzero(change == -1)   # 按行优先的顺序，每个开始都对应同一行中的下一个结束
+    if len(start) == 0:
+        return pd.DataFrame({"run": [], "start": [], "trough": [], "end": [], "depth": [], "length": [],
+                             "recovered": []})
+
+    # 在每个回撤区间内找最深的那一期：把所有区间拼起来，按(区间编号, -回撤)排序之后取每个区间的第一个
+    lengths = end - start
+    episode = np.repeat(np.arange(len(start)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    position = np.repeat(start, lengths) + offsets
+    values = drawdown[np.repeat(start_run, lengths), position]
+    order = np.lexsort((-values, episode))
+    first = np.cumsum(lengths) - lengths
+    trough = position[order][first]
+    depth = values[order][first]
+    return pd.DataFrame({"run": start_run, "start": start, "trough": trough, "end": end, "depth": depth,
+                         "length": lengths, "recovered": end < n})
+
+
+def summary_metrics(equity, periods=PERIODS) -> pd.DataFrame:
+    """
+    一次性计算所有曲线的主要指标
+    :param equity:  形状为(run数, 期数)的净值
+    :param periods: 一年的期数
+    :return:    每条曲线一行的DataFrame
+    """
+    equity = _as_2d(equity)
+    returns = returns_from_equity(equity)
+    max_drawdown, duration = max_drawdowns(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        calmar = annualized_returns(equity, periods) / max_drawdown
+    return pd.DataFrame({"total return": equity[:, -1] / equity[:, 0] - 1.0,
+                         "annualized return": annualized_returns(equity, periods),
+                         "sharp ratio": sharpe_ratio(returns, periods),
+                         "sortino ratio": sortino_ratio(returns, periods),
+                         "calmar ratio": calmar,
+                         "max drawdown": max_drawdown,
+                         "drawdown duration": duration})
@@ -1,6 +1,11 @@
-import pandas as pd
+from __future__ import annotations
+
 import numpy as np
 
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
 
 def create_sharp_ratio(returns: pd.Series, periods=250 * 4 * 15):
     """
@@ -19,18 +24,58 @@ def create_sharp_ratio(returns: pd.Series, periods=250 * 4 * 15):
 
 def create_drawdowns(equity_curve: pd.Series):
     """
-    计算股票或者投资组合的最大回撤
+    计算股票或者投资组合的最大回撤，用累计最大值向量化计算，复杂度是O(n)
+    1、第0期不参与计算（它是pct_change产生的nan），最高水位线从0开始，nan不会更新最高水位线
+    2、回撤是最高水位线减去当前值；回撤为0时持续期数清零，否则加1
     :param equity_curve:    每期的收益率百分比，是一个pandas series
     :return:    最大回撤和连续发生最大回的期数
     """
-    hwm = [0]
-    equity_index = equity_curve.index
-    drawdown = pd.Series(index=equity_index)  # 存放每个期的回撤
-    duration = pd.Series(index=equity_index)  # 存放连续发生回撤
-
-    for i in range(1, len(equity_index)):
-        curr_hwm = max(hwm[i - 1], equity_curve.values[i])
-        hwm.append(curr_hwm)
-        drawdown[i] = hwm[i] - equity_curve.values[i]  # drawdown 中存放的总是直到当前位置的最大值，是一个百分比的小数形式
-        duration[i] = 0 if drawdown[i] == 0 else duration[i - 1] + 1  # drawdown[i] 永远都是大于等于0的，不可能小于0
-    return drawdown.max(), duration.max()
+    values = np.asarray(equity_curve.values, dtype=np.float64)[1:]
+    if len(values) == 0:
+        return np.nan, np.nan
+    hwm = np.fmax.accumulate(np.fmax(values, 0.0))
+    drawdown = hwm - values  # drawdown 中存放的总是直到当前位置的最大值，是一个百分比的小数形式
+
+    # 每一期距离上一次回撤为0的期数；在第一次回撤为0之前持续期数是nan
+    index = np.arange(1, len(values) + 1)
+    last_zero = np.maximum.accumulate(np.where(drawdown == 0, index, 0))
+    duration = np.where(last_zero == 0, np.nan, index - last_zero)
+    return _nanmax(drawdown), _nanmax(duration)
+
+
+def _nanmax(values: np.ndarray):
+    """
+    和pd.Series.max一样忽略nan，全部是nan时返回nan
+    """
+    values = values[~np.isnan(values)]
+    return values.max() if len(values) > 0 else np.nan
+
+
+def create_numeric_summary_stats(equity_curve: pd.DataFrame, periods=250 * 4 * 15):
+    """
+    和create_summary_stats相同的统计信息，但是保留为float，不格式化成字符串，可以用来排序、比较和保存
+    :param equity_curve:    create_equity_curve_dataframe返回的dataframe，需要有returns和equity_curve两列
+    :param periods: 一年的期数，用来计算夏普比率
+    :return: {"total return": 小数形式的总收益率, "sharp ratio": ..., "max drawdown": 小数形式, "drawdown duration": 期数}
+    """
+    total_return_and_capital = equity_curve["equity_curve"].values[-1]
+    returns = equity_curve["returns"]
+    pnl = equity_curve["equity_curve"]
+
+    sharp_ratio = create_sharp_ratio(returns, periods)
+    max_drawdown, duration = create_drawdowns(pnl)
+    return {"total return": float(total_return_and_capital - 1), "sharp ratio": float(sharp_ratio),
+            "max drawdown": float(max_drawdown), "drawdown duration": float(duration)}
+
+
+def create_summary_stats(equity_curve: pd.DataFrame, periods=250 * 4 * 15):
+    """
+    根据净值曲线创建一个包含统计信息的dict，包括夏普比率和最大回撤等
+    :param equity_curve:    create_equity_curve_dataframe返回的dataframe，需要有returns和equity_curve两列
+    :param periods: 一年的期数，用来计算夏普比率
+    :return: 一个包含了统计信息的dict，数值都已经格式化成字符串
+    """
+    stats = create_numeric_summary_stats(equity_curve, periods)
+    return {"total return": "%0.2f%%" % (stats["total return"] * 100),
+            "sharp ratio": "%0.2f" % stats["sharp ratio"], "max drawdown": '%0.2f%%' % (stats["max drawdown"] * 100.0),
+            "drawdown duration": "%d" % int(stats["drawdown duration"])}
@@ -0,0 +1,177 @@
+"""
+用重采样评估绩效指标的稳定性：对收益率序列做成千上万次block bootstrap或者打乱顺序，
+每次重采样都计算夏普比率、最大回撤和最长回撤持续期数，得到它们的分布和置信区间
+1、重采样按块（chunk）批量生成，每块是一个最多chunk_elements个元素的二维数组，指标用metrics中的向量化函数一次算完，
+   内存占用由chunk_elements决定
+2、每SEED_BLOCK次重采样共用一个由seed派生的随机数种子，一组的随机数总是按同样的顺序生成，不管这一组分成几块，
+   所以结果只取决于seed，和chunk_elements、是否使用进程池、用几个进程都无关
+"""
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bt.components.performance.metrics import PERIODS, sharpe_ratio, max_drawdowns
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+STATS = ("sharp ratio", "max drawdown", "drawdown duration")
+METHODS = ("block", "shuffle")
+# 每多少次重采样使用一个独立的随机数种子，它决定了结果，不能随意修改
+SEED_BLOCK = 64
+
+
+def default_block_size(n):
+    """
+    block bootstrap的默认块长度，取n的立方根
+    """
+    return max(1, int(round(n ** (1.0 / 3.0))))
+
+
+def _block_starts(n, n_samples, block_size, rng):
+    return rng.integers(0, n, size=(n_samples, -(-n // block_size)))
+
+
+def _take_blocks(returns, starts, block_size):
+    n = len(returns)
+    # 第i行是从第i期开始的一个块，选中的块整块复制，比逐个元素按下标取快
+    blocks = sliding_window_view(np.concatenate([returns, returns[:block_size - 1]]), block_size)
+    return blocks[starts].reshape(len(starts), -1)[:, :n]
+
+
+def block_bootstrap(returns, n_samples, block_size, rng) -> np.ndarray:
+    """
+    circular moving block bootstrap：随机选择起点，每次取连续的block_size期，超过末尾时从头接上，
+    保留了块内收益率的自相关和波动率聚集
+    :param returns: 长度为n的收益率
+    :return:    形状为(n_samples, n)的重采样
+    """
+    return _take_blocks(returns, _block_starts(len(returns), n_samples, block_size, rng), block_size)
+
+
+def shuffle(returns, n_samples, rng) -> np.ndarray:
+    """
+    把收益率的顺序随机打乱（不放回），夏普比率不变，回撤只取决于顺序，用来看回撤有多少是运气
+    returns也可以是每笔交易的收益率，这时就是打乱交易的顺序
+    每行依次用rng生成一个排列，所以分几次生成和一次生成的结果相同
+    :return:    形状为(n_samples, n)的重采样
+    """
+    samples = np.empty((n_samples, len(returns)))
+    for row in samples:
+        row[:] = rng.permutation(returns)
+    return samples
+
+
+def resample_stats(samples, periods=PERIODS, overwrite=False):
+    """
+    :param samples: 形状为(重采样次数, 期数)的收益率
+    :param overwrite:   为True时直接在samples上计算净值，少分配一个同样大小的数组
+    :return:    {统计量: 长度为重采样次数的数组}
+    """
+    sharpe = sharpe_ratio(samples, periods)
+    equity = samples if overwrite else samples.copy()
+    equity += 1.0
+    np.cumprod(equity, axis=1, out=equity)
+    max_drawdown, duration = max_drawdowns(equity)
+    return {"sharp ratio": sharpe, "max drawdown": max_drawdown, "drawdown duration": duration.astype(np.float64)}
+
+
+def _group_pieces(returns, method, size, block_size, seed, rows):
+    """
+    用一组的种子生成这一组的重采样，每次最多产生rows行，结果和rows无关
+    block bootstrap的起点（size * 块数个整数）一次生成，打乱顺序时每行依次生成
+    """
+    rng = np.random.default_rng(seed)
+    if method == "block":
+        starts = _block_starts(len(returns), size, block_size, rng)
+        for i in range(0, size, rows):
+            yield _take_blocks(returns, starts[i:i + rows], block_size)
+    else:
+        for i in range(0, size, rows):
+            yield shuffle(returns, min(rows, size - i), rng)
+
+
+def _run_chunk(returns, method, groups, block_size, periods, rows):
+    """
+    :param groups:  [(重采样次数, 种子), ...]，每组用自己的种子生成，和它们怎么分块无关
+    :param rows:    每次最多生成并计算多少行重采样，决定了内存占用
+    """
+    stats = [resample_stats(piece, periods, overwrite=True) for size, seed in groups
+             for piece in _group_pieces(returns, method, size, block_size, seed, rows)]
+    return {name: np.concatenate([chunk[name] for chunk in stats]) for name in STATS}
+
+
+class ResampleResult(object):
+    """
+    重采样的结果
+    actual: 原始收益率序列的统计量
+    samples:    {统计量: 每次重采样的值的数组}
+    """
+
+    def __init__(self, actual, samples, method):
+        self.actual = actual
+        self.samples = samples
+        self.method = method
+
+    def confidence_intervals(self, confidence=0.95):
+        """
+        percentile置信区间
+        :return:    {统计量: (下限, 上限)}
+        """
+        tail = (1.0 - confidence) / 2.0 * 100.0
+        return {name: tuple(np.nanpercentile(values, [tail, 100.0 - tail])) for name, values in self.samples.items()}
+
+    def summary(self, confidence=0.95):
+        """
+        每个统计量一行的DataFrame：原始值、重采样的均值和置信区间
+        """
+        intervals = self.confidence_intervals(confidence)
+        return pd.DataFrame({"actual": [self.actual[name] for name in STATS],
+                             "mean": [np.nanmean(self.samples[name]) for name in STATS],
+                             "lower": [intervals[name][0] for name in STATS],
+                             "upper": [intervals[name][1] for name in STATS]}, index=list(STATS))
+
+
+def resample(returns, n_samples=10000, method="block", block_size=None, seed=None, periods=PERIODS,
+             chunk_elements=1 << 22, processes=0) -> ResampleResult:
+    """
+    对收益率序列做n_samples次重采样，计算每次的夏普比率、最大回撤和最长回撤持续期数
+    :param returns: create_equity_curve_dataframe()["returns"]（开头的nan会被去掉），或者任何一维的收益率
+    :param n_samples:   重采样次数
+    :param method:  "block"是block bootstrap，"shuffle"是打乱顺序
+    :param block_size:  block bootstrap的块长度，默认是default_block_size
+    :param seed:    随机数种子，相同的seed总是得到相同的结果
+    :param periods: 一年的期数，用来计算夏普比率
+    :param chunk_elements:  每块重采样的元素个数的上限（至少一行），决定了内存占用
+    :param processes:   为0时在当前进程中计算，否则用这么多个进程，None表示cpu的个数
+    :return:    ResampleResult
+    """
+    if method not in METHODS:
+        raise ValueError("method必须是%s之一" % ", ".join(METHODS))
+    returns = np.asarray(returns, dtype=np.float64)
+    returns = np.ascontiguousarray(returns[~np.isnan(returns)])
+    n = len(returns)
+    if n < 2:
+        raise ValueError("收益率至少需要2期")
+    block_size = block_size or default_block_size(n)
+
+    group_sizes = [min(SEED_BLOCK, n_samples - start) for start in range(0, n_samples, SEED_BLOCK)]
+    groups = list(zip(group_sizes, np.random.SeedSequence(seed).spawn(len(group_sizes))))
+    rows = max(1, chunk_elements // n)
+    # 每个任务包含的组数，只影响任务的粒度，不影响内存占用
+    per_task = max(1, rows // SEED_BLOCK)
+    args = [(returns, method, groups[i:i + per_task], block_size, periods, rows)
+            for i in range(0, len(groups), per_task)]
+    if processes == 0:
+        chunks = [_run_chunk(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+            chunks = list(executor.map(_run_chunk, *zip(*args)))
+
+    samples = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in STATS}
+    actual = {name: values[0] for name, values in resample_stats(returns[None, :], periods).items()}
+    return ResampleResult(actual, samples, method)
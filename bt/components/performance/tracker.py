@@ -0,0 +1,83 @@
+from math import sqrt, nan
+
+
+class PerformanceTracker(object):
+    """
+    在回测过程中逐期更新的绩效统计，每期的更新都是O(1)的，不需要保存全部历史，随时可以读取当前的夏普比率和回撤
+    1、收益率的均值和方差用Welford算法在线计算
+    2、口径和create_summary_stats一致：净值是总资产除以初始资金；最高水位线从0开始；
+       夏普比率和create_sharp_ratio一样不包含最后一期的收益率，所以最新的一期收益率要等到下一期才会被计入
+    """
+
+    def __init__(self, initial_capital, periods=250 * 4 * 15):
+        """
+        :param initial_capital: 初始资金
+        :param periods: 一年的期数，用来计算夏普比率
+        """
+        self.initial_capital = initial_capital
+        self.periods = periods
+
+        self.last_total = initial_capital
+        self.equity = 1.0
+        self.pending_return = None  # 最新一期的收益率，还没有计入均值和方差
+        self.count = 0              # 已经计入均值和方差的收益率的个数
+        self.mean = 0.0
+        self.m2 = 0.0
+
+        self.hwm = 0.0
+        self.drawdown = 0.0
+        self.max_drawdown = nan
+        self.duration = 0
+        self.max_duration = nan
+
+    def update(self, total):
+        """
+        输入新的一期的总资产
+        :param total:   总资产
+        :return:
+        """
+        if self.pending_return is not None:
+            self.count += 1
+            delta = self.pending_return - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (self.pending_return - self.mean)
+        self.pending_return = total / self.last_total - 1.0
+        self.last_total = total
+
+        self.equity = total / self.initial_capital
+        if self.equity > self.hwm:
+            self.hwm = self.equity
+        self.drawdown = self.hwm - self.equity
+        self.duration = 0 if self.drawdown == 0 else self.duration + 1
+        if not self.drawdown <= self.max_drawdown:  # max_drawdown的初始值是nan
+            self.max_drawdown = self.drawdown
+        if not self.duration <= self.max_duration:
+            self.max_duration = self.duration
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count > 0 else nan
+
+    @property
+    def sharp_ratio(self):
+        """
+        当前的年化夏普比率，假设无风险收益率为0
+        """
+        if self.count == 0:
+            return nan
+        std = sqrt(self.variance)
+        if std == 0:
+            return nan
+        return sqrt(self.periods) * self.mean / std
+
+    @property
+    def total_return(self):
+        return self.equity - 1.0
+
+    def summary_stats(self):
+        """
+        :return:    和create_summary_stats格式相同的dict
+        """
+        return {"total return": "%0.2f%%" % (self.total_return * 100),
+                "sharp ratio": "%0.2f" % self.sharp_ratio, "max drawdown": '%0.2f%%' % (self.max_drawdown * 100.0),
+                "drawdown duration": "%d" % int(self.max_duration)}
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import numpy as np
+
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def create_equity_curve(symbol_list, datetime, holdings, cash, commission, total) -> pd.DataFrame:
+    """
+    根据持有资金量的各个数组创建可以画出净值曲线的dataframe，各个symbol的持有资金量那部分不会被复制
+    :param symbol_list: 交易品种的代码
+    :param datetime:    datetime64[ns]数组
+    :param holdings:    形状为(期数, symbol数)的持有资金量
+    :param cash:    每期的现金
+    :param commission:  每期的累计佣金
+    :param total:   每期的总资产
+    :return:    dataframe，列依次是各个symbol、cash、commission、total、returns、equity_curve
+    """
+    index = pd.DatetimeIndex(datetime, name="datetime")
+    curve = pd.DataFrame(holdings, index=index, columns=list(symbol_list), copy=False)
+    curve["cash"] = cash
+    curve["commission"] = commission
+    curve["total"] = total
+    curve["returns"] = curve["total"].pct_change()  # 计算相邻两个数之间的变化百分比，(next - pre) / pre
+    curve["equity_curve"] = (1.0 + curve["returns"]).cumprod()  # 将这个数组的每个数连乘起来
+    return curve
+
+
+class HistoryRecords(object):
+    """
+    把PortfolioHistory中的某一行按需转换成原来all_positions/all_holdings中的dict格式，只是为了兼容，不要在循环中使用
+    """
+
+    def __init__(self, history, with_holdings):
+        self.history = history
+        self.with_holdings = with_holdings
+
+    def __len__(self):
+        return self.history.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("history index out of range")
+        h = self.history
+        values = h.holdings[i] if self.with_holdings else h.positions[i]
+        dic = {s: values[j].item() for j, s in enumerate(h.symbol_list)}
+        dic["datetime"] = h.datetime[i].view("datetime64[ns]")
+        if self.with_holdings:
+            dic["cash"] = h.cash[i].item()
+            dic["commission"] = h.commission[i].item()
+            dic["total"] = h.total[i].item()
+        return dic
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class PortfolioHistory(object):
+    """
+    按期保存portfolio的持仓和持有资金量，所有数据都放在按块增长的numpy数组中，第i行是第i期
+    1、positions和holdings的形状是(期数, symbol数)，列的顺序和symbol_list一致
+    2、cash、commission、total是长度为期数的数组，datetime是int64的纳秒时间戳
+    """
+
+    def __init__(self, symbol_list, capacity=1024):
+        self.symbol_list = list(symbol_list)
+        self.capacity = max(int(capacity), 1)
+        self.length = 0
+        n = len(self.symbol_list)
+        self.datetime = np.zeros(self.capacity, dtype=np.int64)
+        self.positions = np.zeros((self.capacity, n))
+        self.holdings = np.zeros((self.capacity, n))
+        self.cash = np.zeros(self.capacity)
+        self.commission = np.zeros(self.capacity)
+        self.total = np.zeros(self.capacity)
+
+    def _grow(self):
+        self.capacity *= 2
+        for name in ("datetime", "positions", "holdings", "cash", "commission", "total"):
+            old = getattr(self, name)
+            new = np.zeros((self.capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.length] = old[:self.length]
+            setattr(self, name, new)
+
+    def append(self, datetime, positions, holdings, cash, commission, total):
+        """
+        追加一期的数据
+        :param datetime:    int64的纳秒时间戳
+        :param positions:   长度为symbol数的持仓
+        :param holdings:    长度为symbol数的持有资金量
+        :param cash:    现金
+        :param commission:  累计佣金
+        :param total:   总资产
+        :return:
+        """
+        if self.length >= self.capacity:
+            self._grow()
+        i = self.length
+        self.datetime[i] = datetime
+        self.positions[i] = positions
+        self.holdings[i] = holdings
+        self.cash[i] = cash
+        self.commission[i] = commission
+        self.total[i] = total
+        self.length += 1
+
+    def create_equity_curve_dataframe(self) -> pd.DataFrame:
+        n = self.length
+        return create_equity_curve(self.symbol_list, self.datetime[:n].view("datetime64[ns]"), self.holdings[:n],
+                                   self.cash[:n], self.commission[:n], self.total[:n])
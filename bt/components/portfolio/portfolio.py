@@ -1,12 +1,19 @@
-import pandas as pd
+from __future__ import annotations
+
+import numpy as np
 
 from abc import ABCMeta, abstractmethod
 from math import floor
 from queue import Queue
 
-from bt.components.event.event import OrderEvent, FillEvent, SignalEvent, EventType
+from bt.components.event.event import OrderEvent, FillEvent, SignalEvent, MarketEvent, EventType
 from bt.components.data_handler.data import DataHandler
-from bt.components.performance.performance import create_drawdowns, create_sharp_ratio
+from bt.components.performance.performance import create_summary_stats
+from bt.components.performance.tracker import PerformanceTracker
+from bt.components.portfolio.history import PortfolioHistory, HistoryRecords
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
 
 
 class Portfolio(metaclass=ABCMeta):
@@ -14,38 +21,62 @@ class Portfolio(metaclass=ABCMeta):
     这个类处理所有股票的持仓，处理的形式是秒级，分钟级，5分钟级，30分钟级。。。。。
     """
 
-    def __init__(self, data_handler: DataHandler, events: Queue, start_datetime, initial_capital):
+    def __init__(self, data_handler: DataHandler, events: Queue, start_datetime, initial_capital, store_history=True,
+                 sparse_valuation=False):
         """
         通过DataHandler（bars）和一个event queue来初始化一个NavePortfolio，还有一个开始日期
         :param data_handler:    DataHandler
         :param events:
         :param start_datetime:
         :param initial_capital:
+        :param store_history:   为False时不保存每期的持仓和持有资金量，只用tracker在线统计绩效，内存占用不随回测长度增长
+        :param sparse_valuation:    为True时每期只对有持仓的symbol做市值计算，适合symbol很多但持仓很少的情况；
+                                    没有持仓的symbol的市值总是0，即使它的价格是nan
         """
         self.data_handler = data_handler
         self.symbol_list = self.data_handler.symbol_list
         self.events: Queue = events
         self.start_datetime = start_datetime
         self.initial_capital = initial_capital
+        self.store_history = store_history
+        self.sparse_valuation = sparse_valuation
+        self.symbol_index = {s: i for i, s in enumerate(self.symbol_list)}
 
-        self.all_positions = self.construct_all_positions()
+        self.tracker = PerformanceTracker(initial_capital)
+        self.history = self.construct_history()
         self.current_positions = {symbol: 0 for symbol in self.symbol_list}
-
-        self.all_holdings = self.construct_all_holdings()
         self.current_holdings = self.construct_current_holdings()
 
-    def construct_all_positions(self):
-        dic = {symbol: 0 for symbol in self.symbol_list}
-        dic["datetime"] = self.start_datetime
-        return [dic]
+        # 和symbol_list对齐的持仓向量和市值向量，每期的市值计算直接和最新的收盘价向量做向量运算
+        self.position_vector = np.zeros(len(self.symbol_list))
+        self.market_value_vector = np.zeros(len(self.symbol_list))
+        self.held_index = np.empty(0, dtype=np.intp)  # 有持仓的symbol的下标，只在成交时更新
 
-    def construct_all_holdings(self):
-        dic = {symbol: 0.0 for symbol in self.symbol_list}
-        dic["datetime"] = self.start_datetime
-        dic["cash"] = self.initial_capital
-        dic["commission"] = 0.0
-        dic["total"] = self.initial_capital
-        return [dic]
+    def construct_history(self) -> PortfolioHistory:
+        """
+        创建保存每期持仓和持有资金量的PortfolioHistory，第0期是初始状态
+        :return:
+        """
+        capacity = self.data_handler.bar_store.length + 1 if self.store_history else 1
+        history = PortfolioHistory(self.symbol_list, capacity=capacity)
+        zeros = np.zeros(len(self.symbol_list))
+        history.append(np.datetime64(self.start_datetime, "ns").view(np.int64), zeros, zeros,
+                       self.initial_capital, 0.0, self.initial_capital)
+        return history
+
+    @property
+    def all_positions(self):
+        """
+        以原来的list of dict的格式按需读取每期的持仓，只用于兼容和调试
+        """
+        return HistoryRecords(self.history, with_holdings=False)
+
+    @property
+    def all_holdings(self):
+        """
+        以原来的list of dict的格式按需读取每期的持有资金量，只用于兼容和调试
+        """
+        return HistoryRecords(self.history, with_holdings=True)
 
     def construct_current_holdings(self):
         dic = {symbol: 0.0 for symbol in self.symbol_list}
@@ -66,6 +97,11 @@ class Portfolio(metaclass=ABCMeta):
         if fill.direction == "SELL":
             fill_direction = -1
         self.current_positions[fill.symbol] += fill_direction * fill.quantity
+        j = self.symbol_index[fill.symbol]
+        self.position_vector[j] = self.current_positions[fill.symbol]
+        if self.sparse_valuation:
+            self.market_value_vector[j] = 0.0
+            self.held_index = np.flatnonzero(self.position_vector)
         pass
 
     def update_holdings_from_fill(self, fill: FillEvent):
@@ -77,10 +113,12 @@ class Portfolio(metaclass=ABCMeta):
         fill_direction = 0
         if fill.direction == "BUY":
             fill_direction = 1
-        if fill_direction == "SELL":
+        if fill.direction == "SELL":
             fill_direction = -1
-        close_price = self.data_handler.get_latest_bars(fill.symbol)[0][5]
-        cost = fill_direction * fill.quantity * close_price
+        price = fill.fill_cost
+        if price is None:
+            price = self.data_handler.get_latest_bar_value(fill.symbol, "close")
+        cost = fill_direction * fill.quantity * price
         self.current_holdings[fill.symbol] += cost
         self.current_holdings["commission"] += fill.commission
         self.current_holdings["cash"] -= (cost + fill.commission)
@@ -103,66 +141,53 @@ class Portfolio(metaclass=ABCMeta):
     def generate_order(self, event: SignalEvent) -> OrderEvent:
         raise NotImplementedError("Should implement generate_naive_order(self, event)")
 
-    def update_timeindex(self):
+    def update_timeindex(self, event: MarketEvent = None):
         """
         1、每次价格变化都会导致持仓资金量的变化，进而导致收益率的变化
-        2、将1中每次变化后的内容追加到all_positions和all_holdings这两个list中，形成了两个根据时间变化的list
+        2、将1中每次变化后的内容追加到history中，形成了根据时间变化的持仓和持有资金量
+        :param event:   触发这次更新的MarketEvent，可以不传
         :return:
         """
-        if self.data_handler.continue_backtest:  # 由于外层的loop机制，如果这里不判断的话会导致最后all_holding的最后一条记录重复
-            latest_bar_of_every_symbol = {}
-            for symbol in self.symbol_list:
-                latest_bar_of_every_symbol[symbol] = self.data_handler.get_latest_bars(symbol, n=1)
-
-            # 1、更新positions
-            dic_position_new = {symbol: 0 for symbol in self.symbol_list}
-            dic_position_new["datetime"] = latest_bar_of_every_symbol[self.symbol_list[0]][0][1]
-            for s in self.symbol_list:
-                dic_position_new[s] = self.current_positions[s]
-            # 把current_positions更新到all_positions中
-            self.all_positions.append(dic_position_new)
-
-            # 2、更新holdings
-            dic_holding_new = {symbol: 0.0 for symbol in self.symbol_list}
-            dic_holding_new["datetime"] = latest_bar_of_every_symbol[self.symbol_list[0]][0][1]
-            dic_holding_new["cash"] = self.current_holdings["cash"]
-            dic_holding_new["commission"] = self.current_holdings["commission"]
-            dic_holding_new["total"] = self.current_holdings["cash"]
-            for s in self.symbol_list:
-                market_value = self.current_positions[s] * latest_bar_of_every_symbol[s][0][5]
-                dic_holding_new[s] = market_value
-                dic_holding_new["total"] += market_value
-            # 把current_holdings更新到all_holdings中
-            self.all_holdings.append(dic_holding_new)
+        if self.data_handler.continue_backtest:  # 由于外层的loop机制，如果这里不判断的话会导致history的最后一条记录重复
+            latest_datetime = self.data_handler.get_latest_bar_datetime()
+            latest_close = self.data_handler.bar_store.latest_row("close")
+
+            positions = self.position_vector
+            cash = self.current_holdings["cash"]
+            if self.sparse_valuation:
+                held = self.held_index
+                holdings = self.market_value_vector
+                market_value = positions[held] * latest_close[held]
+                holdings[held] = market_value
+                total = cash + market_value.sum()
+            elif self.store_history:
+                holdings = positions * latest_close
+                total = cash + holdings.sum()
+            else:
+                holdings = None
+                total = cash + positions.dot(latest_close)
+            self.tracker.update(total)
+            if self.store_history:
+                self.history.append(latest_datetime, positions, holdings, cash, self.current_holdings["commission"],
+                                    total)
 
     def create_equity_curve_dataframe(self) -> pd.DataFrame:
         """
-        根据当前持有资金量创建可以画出净值曲线的dataframe
+        根据当前持有资金量创建可以画出净值曲线的dataframe，各个symbol的持有资金量直接使用history中的数组，不会复制
         :return:
         """
-        curve = pd.DataFrame(self.all_holdings)
-        curve.set_index("datetime", inplace=True)
-        curve["returns"] = curve["total"].pct_change()  # 计算相邻两个数之间的变化百分比，(next - pre) / pre
-        curve["equity_curve"] = (1.0 + curve["returns"]).cumprod()  # 将这个数组的每个数连乘起来
-        return curve
+        if not self.store_history:
+            raise ValueError("store_history为False时没有保存净值曲线")
+        return self.history.create_equity_curve_dataframe()
 
     def output_summary_stats(self):
         """
         为portfolio创建一个包含统计信息的list，包括夏普比率和最大回撤等
         :return: 一个包含了统计信息的list
         """
-        equity_curve = self.create_equity_curve_dataframe()
-        total_return_and_capital = equity_curve["equity_curve"].values[-1]
-        returns = equity_curve["returns"]
-        pnl = equity_curve["equity_curve"]
-
-        sharp_ratio = create_sharp_ratio(returns)
-        max_drawdown, duration = create_drawdowns(pnl)
-
-        stats = {"total return": "%0.2f%%" % ((total_return_and_capital - 1) * 100),
-                 "sharp ratio": "%0.2f" % sharp_ratio, "max drawdown": '%0.2f%%' % (max_drawdown * 100.0),
-                 "drawdown duration": "%d" % int(duration)}
-        return stats
+        if not self.store_history:
+            return self.tracker.summary_stats()
+        return create_summary_stats(self.create_equity_curve_dataframe())
 
 
 class NaivePortfolio(Portfolio):
@@ -171,15 +196,19 @@ class NaivePortfolio(Portfolio):
     目的是用来测试一些简单的策略，比如BuyAndHoldStrategy这样的
     """
 
-    def __init__(self, data_handler: DataHandler, events: Queue, start_datetime, initial_capital=100000.0):
+    def __init__(self, data_handler: DataHandler, events: Queue, start_datetime, initial_capital=100000.0,
+                 store_history=True, sparse_valuation=False):
         """
         通过DataHandler（bars）和一个event queue来初始化一个NavePortfolio，还有一个开始日期
         :param data_handler:    DataHandler
         :param events:
         :param start_datetime:
         :param initial_capital:
+        :param store_history:
+        :param sparse_valuation:
         """
-        super(NaivePortfolio, self).__init__(data_handler, events, start_datetime, initial_capital)
+        super(NaivePortfolio, self).__init__(data_handler, events, start_datetime, initial_capital, store_history,
+                                             sparse_valuation)
 
     def generate_order(self, event: SignalEvent) -> OrderEvent:
         return self.generate_naive_order(event)
@@ -40,13 +40,15 @@ class BuyAndHoldStrategy(Strategy):
     2、作用是：这个策略所持有的股票可以作为benchmark，用来跟其他策略做比较
     """
 
-    def __init__(self, data_handler: DataHandler, events: queue.Queue):
+    def __init__(self, data_handler: DataHandler, events: queue.Queue, strength=10):
         """
         用来初始化BuyAndHoldStrategy这个类的
         :param data_handler:    DataHandler类的实例
         :param events:  消息队列
+        :param strength:    买入signal的strength
         """
         super(BuyAndHoldStrategy, self).__init__(data_handler, events)
+        self.strength = strength
 
     def calculate_signals(self, event: MarketEvent):
         """
@@ -56,10 +58,10 @@ class BuyAndHoldStrategy(Strategy):
         """
         if event.type_enum == EventType.MARKET:
             for s in self.symbol_list:
-                bar = self.data_handler.get_latest_bars(s)
-                if bar is not None and bar != []:
+                bars = self.data_handler.get_latest_bars(s)
+                if bars is not None and len(bars.datetime) > 0:
                     if self.bought[s] is False:
-                        signal = SignalEvent(bar[0][0], bar[0][1], "LONG", 10)
+                        signal = SignalEvent(bars.symbol, bars.datetime[-1], "LONG", self.strength)
                         self.events.put(signal)
                         self.bought[s] = True
         pass
@@ -0,0 +1,26 @@
+from bt.components.event.event import EventType
+from bt.components.execution_handler.execution import SimulatedExecutionHandler
+from bt.components.portfolio.portfolio import NaivePortfolio
+from bt.event_loop.engine import BacktestEngine
+
+
+def run_backtest(data_handler, strategy_cls, start_datetime, strategy_params=None, portfolio_cls=NaivePortfolio,
+                 execution_cls=SimulatedExecutionHandler, initial_capital=100000.0, print_orders=False):
+    """
+    用一个已经构造好的data_handler跑一遍回测，事件循环就是BacktestEngine.run
+    :param data_handler:    DataHandler，它的events必须是EventBus
+    :param strategy_cls:    Strategy的子类，用strategy_cls(data_handler, events, **strategy_params)来构造
+    :param start_datetime:  开始时间
+    :param strategy_params: 策略的参数
+    :param portfolio_cls:   Portfolio的子类
+    :param execution_cls:   ExecutionHandler的子类
+    :param initial_capital: 初始资金
+    :param print_orders:    是否用bt的logger记录每一个订单
+    :return:    回测结束之后的portfolio
+    """
+    engine = BacktestEngine(data_handler.symbol_list, start_datetime, data_handler.end_datetime, None, strategy_cls,
+                            portfolio_cls=portfolio_cls, execution_cls=execution_cls, initial_capital=initial_capital,
+                            strategy_params=strategy_params, data_handler=data_handler)
+    if print_orders:
+        engine.register(EventType.ORDER, lambda event: event.print_order(), first=True)
+    return engine.run()
@@ -0,0 +1,139 @@
+import io
+import os
+import pickle
+import time
+
+CHECKPOINT_VERSION = 1
+
+# 这些组件在恢复时由新的engine提供，快照中只保存对它们的引用
+COMPONENTS = ("data_handler", "events", "strategy", "portfolio", "broker")
+
+
+def _components(engine):
+    components = {name: getattr(engine, name) for name in COMPONENTS}
+    components["bar_store"] = engine.data_handler.bar_store
+    return components
+
+
+class _Pickler(pickle.Pickler):
+    """
+    遇到engine的组件时只写下它的名字，这样策略、portfolio中对data_handler等的引用不会把整个组件（包括全部bar数据）写进快照
+    """
+
+    def __init__(self, file, components):
+        super(_Pickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.names = {id(obj): name for name, obj in components.items()}
+
+    def persistent_id(self, obj):
+        return self.names.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, file, components):
+        super(_Unpickler, self).__init__(file)
+        self.components = components
+
+    def persistent_load(self, pid):
+        return self.components[pid]
+
+
+def component_state(component):
+    """
+    组件需要保存的状态，默认是它的全部属性；组件可以定义get_state/set_state来自定义
+    """
+    if hasattr(component, "get_state"):
+        return component.get_state()
+    return dict(vars(component))
+
+
+def restore_component(component, state):
+    if hasattr(component, "set_state"):
+        component.set_state(state)
+    else:
+        vars(component).update(state)
+
+
+def save_checkpoint(engine, path):
+    """
+    把engine的完整状态写到path：data handler已经发布到哪个bar、合成的周期和指标、策略的状态、portfolio的持仓和history、
+    broker中挂着的订单和还没有处理的事件
+    先写临时文件再替换，写到一半崩溃也不会破坏之前的快照
+    :return:    快照的字节数
+    """
+    state = {
+        "version": CHECKPOINT_VERSION,
+        "classes": {name: type(getattr(engine, name)).__name__ for name in ("data_handler", "strategy", "portfolio",
+                                                                             "broker")},
+        "symbol_list": list(engine.symbol_list),
+        "data_handler": engine.data_handler.get_state(),
+        "strategy": component_state(engine.strategy),
+        "portfolio": component_state(engine.portfolio),
+        "broker": component_state(engine.broker),
+        "events": list(engine.events),
+    }
+    buffer = io.BytesIO()
+    _Pickler(buffer, _components(engine)).dump(state)
+    data = buffer.getvalue()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+def restore_checkpoint(engine, path):
+    """
+    用path中的快照恢复一个新建的engine，之后engine.run()只会处理快照之后的bar
+    engine要用和原来相同的symbol_list和组件类来构造，data handler中的数据可以比原来更多（比如end_datetime更晚），
+    也可以从更晚的start_datetime开始，只要包含快照中最后一个bar之后的数据
+    :return:    engine
+    """
+    with open(path, "rb") as f:
+        state = _Unpickler(f, _components(engine)).load()
+    if state["version"] != CHECKPOINT_VERSION:
+        raise ValueError("不支持的快照版本：%s" % state["version"])
+    if state["symbol_list"] != list(engine.symbol_list):
+        raise ValueError("快照的symbol_list和engine不一致")
+    for name, cls_name in state["classes"].items():
+        if type(getattr(engine, name)).__name__ != cls_name:
+            raise ValueError("快照中的%s是%s，engine中是%s" % (name, cls_name, type(getattr(engine, name)).__name__))
+    engine.data_handler.set_state(state["data_handler"])
+    restore_component(engine.strategy, state["strategy"])
+    restore_component(engine.portfolio, state["portfolio"])
+    restore_component(engine.broker, state["broker"])
+    engine.events.clear()
+    engine.events.extend(state["events"])
+    return engine
+
+
+class Checkpointer(object):
+    """
+    在回测过程中定期保存快照，传给BacktestEngine之后，每个bar的事件都处理完之后检查一次
+    """
+
+    def __init__(self, path, every_bars=None, every_seconds=None):
+        """
+        :param path:    快照的文件名，每次覆盖
+        :param every_bars:  每隔多少个bar保存一次
+        :param every_seconds:   每隔多少秒保存一次
+        """
+        self.path = path
+        self.every_bars = every_bars
+        self.every_seconds = every_seconds
+        self.bars = 0
+        self.last_saved = time.monotonic()
+        self.saved = 0
+
+    def after_bar(self, engine):
+        self.bars += 1
+        due = self.every_bars is not None and self.bars % self.every_bars == 0
+        if not due and self.every_seconds is not None:
+            due = time.monotonic() - self.last_saved >= self.every_seconds
+        if due or not engine.data_handler.continue_backtest:
+            self.save(engine)
+
+    def save(self, engine):
+        save_checkpoint(engine, self.path)
+        self.last_saved = time.monotonic()
+        self.saved += 1
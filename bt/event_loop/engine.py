@@ -0,0 +1,214 @@
+import queue
+from collections import deque
+
+from bt.components.data_handler.registry import resolve_data_handler
+from bt.components.event.event import EventType
+from bt.components.execution_handler.execution import SimulatedExecutionHandler
+from bt.components.portfolio.portfolio import NaivePortfolio
+from bt.event_loop.checkpoint import save_checkpoint, restore_checkpoint
+
+
+class EventBus(deque):
+    """
+    单线程的事件队列，代替queue.Queue，put和get都不需要加锁
+    为了兼容各个组件中的events.put(...)，提供了和queue.Queue相同名字的方法
+    单线程中没有别人会放入事件，所以get不会等待，队列为空时和queue.Queue.get(False)一样抛出queue.Empty
+    """
+
+    put = deque.append
+
+    def get(self, block=True, timeout=None):
+        try:
+            return self.popleft()
+        except IndexError:
+            raise queue.Empty from None
+
+    def empty(self):
+        return not self
+
+    def qsize(self):
+        return len(self)
+
+
+class BacktestEngine(object):
+    """
+    事件驱动的回测引擎，它拥有data handler、strategy、portfolio和broker，在一个单线程的EventBus上运行
+    1、每种EventType对应一个handler的list，事件按照注册的顺序依次交给这些handler处理
+    2、可以用register给某种事件再注册其他的handler，比如记录日志、风控等
+    """
+
+    def __init__(self, symbol_list, start_datetime, end_datetime, data_handler_cls, strategy_cls,
+                 portfolio_cls=NaivePortfolio, execution_cls=SimulatedExecutionHandler, initial_capital=100000.0,
+                 data_handler_kwargs=None, strategy_params=None, portfolio_kwargs=None, execution_kwargs=None,
+                 instrumentation=None, checkpointer=None, data_handler=None):
+        """
+        :param symbol_list:     交易品种的代码
+        :param start_datetime:  开始时间
+        :param end_datetime:    结束时间
+        :param data_handler_cls:    DataHandler的子类，或者注册过的数据源的名字，比如"tushare"
+        :param strategy_cls:    Strategy的子类，用strategy_cls(data_handler, events, **strategy_params)来构造
+        :param portfolio_cls:   Portfolio的子类
+        :param execution_cls:   ExecutionHandler的子类，用execution_cls(events, **execution_kwargs)来构造，
+                                之后用broker.bind(data_handler)把data_handler交给它
+        :param initial_capital: 初始资金
+        :param data_handler_kwargs: 传给data_handler_cls的其他参数
+        :param strategy_params: 策略的参数
+        :param portfolio_kwargs:    传给portfolio_cls的其他参数，比如store_history
+        :param execution_kwargs:    传给execution_cls的其他参数，比如滑点和延迟模型
+        :param instrumentation: Instrumentation，不为None时统计每个handler的耗时，为None时没有任何额外开销
+        :param checkpointer:    checkpoint.Checkpointer，不为None时在每个bar处理完之后按需保存快照
+        :param data_handler:    已经构造好的DataHandler，它的events必须是EventBus；给出时不再用data_handler_cls构造
+        """
+        self.symbol_list = symbol_list
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.initial_capital = initial_capital
+        self.instrumentation = instrumentation
+        self.checkpointer = checkpointer
+
+        if data_handler is None:
+            self.events = EventBus()
+            data_handler_cls = resolve_data_handler(data_handler_cls)
+            self.data_handler = data_handler_cls(self.events, symbol_list, start_datetime, end_datetime,
+                                                 **(data_handler_kwargs or {}))
+        else:
+            if not isinstance(data_handler.events, EventBus):
+                raise TypeError("data_handler的events必须是EventBus")
+            self.events = data_handler.events
+            self.data_handler = data_handler
+        self.strategy = strategy_cls(self.data_handler, self.events, **(strategy_params or {}))
+        self.portfolio = portfolio_cls(self.data_handler, self.events, start_datetime, initial_capital,
+                                       **(portfolio_kwargs or {}))
+        self.broker = execution_cls(self.events, **(execution_kwargs or {}))
+        # data_handler在构造之后通过bind交给broker，只接受events的ExecutionHandler子类也可以使用
+        bind = getattr(self.broker, "bind", None)
+        if bind is not None:
+            bind(self.data_handler)
+
+        # 下标是EventType的值，比用if/elif逐个比较事件类型要快
+        self.handlers = [[] for _ in EventType]
+        if getattr(self.broker, "on_market", None) is not None:
+            self.register(EventType.MARKET, self.broker.on_market)
+        self.register(EventType.MARKET, self.strategy.calculate_signals)
+        self.register(EventType.MARKET, self.portfolio.update_timeindex)
+        self.register(EventType.SIGNAL, self.portfolio.update_from_signal)
+        self.register(EventType.ORDER, self.broker.execute_order)
+        self.register(EventType.FILL, self.portfolio.update_from_fill)
+
+    def register(self, event_type: EventType, handler, first=False):
+        """
+        给某种事件注册一个handler
+        :param event_type:  EventType
+        :param handler:     handler(event)
+        :param first:       为True时放在已有的handler之前
+        :return:
+        """
+        if first:
+            self.handlers[event_type].insert(0, handler)
+        else:
+            self.handlers[event_type].append(handler)
+
+    def unregister(self, event_type: EventType, handler):
+        self.handlers[event_type].remove(handler)
+
+    def dispatch(self, event):
+        for handler in self.handlers[event.type_enum]:
+            handler(event)
+
+    def run(self):
+        """
+        运行回测直到数据结束
+        :return:    portfolio
+        """
+        if self.instrumentation is not None or self.checkpointer is not None:
+            return self._run_with_hooks()
+        data_handler = self.data_handler
+        events = self.events
+        handlers = self.handlers
+        while data_handler.continue_backtest:
+            # Update the bars (specific backtest code, as opposed to live trading)
+            data_handler.update_bars()
+
+            # Handle the events
+            while events:
+                event = events.popleft()
+                if event is not None:
+                    for handler in handlers[event.type_enum]:
+                        handler(event)
+        return self.portfolio
+
+    def run_bars(self, n_bars):
+        """
+        最多运行n_bars个bar就返回，之后可以继续调用，用于分批运行回测（见shard.py）
+        :return:    实际运行的bar数，数据结束之后返回0
+        """
+        data_handler = self.data_handler
+        events = self.events
+        handlers = self.handlers
+        count = 0
+        while count < n_bars and data_handler.continue_backtest:
+            data_handler.update_bars()
+            while events:
+                event = events.popleft()
+                if event is not None:
+                    for handler in handlers[event.type_enum]:
+                        handler(event)
+            if data_handler.continue_backtest:
+                count += 1
+        return count
+
+    def _run_with_hooks(self):
+        """
+        和run一样，只是有instrumentation时每个handler都包装成了会记录耗时的版本，有checkpointer时每个bar之后检查是否要保存快照
+        """
+        instrumentation = self.instrumentation
+        checkpointer = self.checkpointer
+        data_handler = self.data_handler
+        events = self.events
+        if instrumentation is None:
+            update_bars = data_handler.update_bars
+            handlers = self.handlers
+        else:
+            update_bars = instrumentation.wrap(data_handler.update_bars)
+            handlers = [[instrumentation.wrap(handler, event_type=event_type)
+                         for handler in self.handlers[event_type]] for event_type in EventType]
+        while data_handler.continue_backtest:
+            update_bars()
+            while events:
+                depth = len(events)
+                event = events.popleft()
+                if event is not None:
+                    if instrumentation is not None:
+                        instrumentation.record_event(event, depth)
+                    for handler in handlers[event.type_enum]:
+                        handler(event)
+            if checkpointer is not None:
+                checkpointer.after_bar(self)
+        return self.portfolio
+
+    def save_checkpoint(self, path):
+        """
+        立即保存一个快照，见checkpoint.save_checkpoint
+        """
+        return save_checkpoint(self, path)
+
+    def restore_checkpoint(self, path):
+        """
+        从快照恢复，之后run只处理快照之后的bar，见checkpoint.restore_checkpoint
+        """
+        return restore_checkpoint(self, path)
+
+    def close(self):
+        """
+        释放data handler占用的资源（比如FileDataHandler的预读线程和文件），中途放弃的回测也可以用with来保证调用
+        """
+        self.data_handler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def output_summary_stats(self):
+        return self.portfolio.output_summary_stats()
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from time import perf_counter_ns
+
+from bt.components.event.event import EventType
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def handler_name(handler):
+    """
+    handler的可读名字，比如"BuyAndHoldStrategy.calculate_signals"
+    """
+    owner = getattr(handler, "__self__", None)
+    if owner is not None:
+        return "%s.%s" % (type(owner).__name__, handler.__name__)
+    return getattr(handler, "__qualname__", repr(handler))
+
+
+class HandlerStats(object):
+    """
+    一个handler的统计：调用次数、累计耗时和耗时的直方图
+    直方图的第k个桶统计耗时在[2^(k-1), 2^k)纳秒之间的调用次数
+    """
+    __slots__ = ("name", "calls", "total_ns", "histogram")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_ns = 0
+        self.histogram = [0] * 64
+
+    def percentile_ns(self, q):
+        """
+        根据直方图估计耗时的分位数，返回所在桶的上界
+        """
+        if self.calls == 0:
+            return 0
+        rank = q * self.calls
+        seen = 0
+        for k, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank:
+                return 1 << k
+        return 1 << 63
+
+
+class Instrumentation(object):
+    """
+    事件循环的性能统计，只有传给BacktestEngine时才会生效，不使用时事件循环没有任何额外开销
+    1、每个handler（包括update_bars）的调用次数、累计耗时和耗时直方图
+    2、每种EventType的事件个数，以及每次取事件时队列的长度
+    3、trace为True时记录每一次调用，可以导出成Chrome trace格式（chrome://tracing、Perfetto、speedscope都能打开），
+       或者flamegraph.pl使用的collapsed stack格式
+    """
+
+    def __init__(self, trace=False, max_trace_events=1000000):
+        """
+        :param trace:   是否记录每一次调用
+        :param max_trace_events:    最多记录的调用次数，超过之后不再记录，防止内存无限增长
+        """
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self.handlers = {}
+        self.event_counts = [0] * len(EventType)
+        self.queue_depth_max = 0
+        self.queue_depth_sum = 0
+        self.queue_depth_samples = 0
+        self.trace_events = []  # (名字, 开始时间ns, 耗时ns, 事件类型)
+        self.origin_ns = perf_counter_ns()
+
+    def wrap(self, handler, name=None, event_type=None):
+        """
+        返回一个会记录耗时的handler
+        :param handler: 原来的handler
+        :param name:    统计中使用的名字，默认是handler_name(handler)
+        :param event_type:  这个handler所处理的事件类型，用于trace中的调用栈
+        :return:    包装之后的handler
+        """
+        name = name or handler_name(handler)
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats(name)
+        histogram = stats.histogram
+        trace_events = self.trace_events if self.trace else None
+        max_trace_events = self.max_trace_events
+
+        def timed(*args):
+            started = perf_counter_ns()
+            result = handler(*args)
+            elapsed = perf_counter_ns() - started
+            stats.calls += 1
+            stats.total_ns += elapsed
+            histogram[elapsed.bit_length()] += 1
+            if trace_events is not None and len(trace_events) < max_trace_events:
+                trace_events.append((name, started, elapsed, event_type))
+            return result
+        return timed
+
+    def record_event(self, event, queue_depth):
+        self.event_counts[event.type_enum] += 1
+        self.queue_depth_sum += queue_depth
+        self.queue_depth_samples += 1
+        if queue_depth > self.queue_depth_max:
+            self.queue_depth_max = queue_depth
+
+    def summary(self) -> pd.DataFrame:
+        """
+        :return:    每个handler一行的统计表，按累计耗时从大到小排序
+        """
+        total_ns = sum(s.total_ns for s in self.handlers.values()) or 1
+        rows = []
+        for s in self.handlers.values():
+            rows.append({"handler": s.name, "calls": s.calls, "total_ms": s.total_ns / 1e6,
+                         "mean_us": s.total_ns / s.calls / 1e3 if s.calls else 0.0,
+                         "p50_us": s.percentile_ns(0.5) / 1e3, "p99_us": s.percentile_ns(0.99) / 1e3,
+                         "share": s.total_ns / total_ns})
+        table = pd.DataFrame(rows, columns=["handler", "calls", "total_ms", "mean_us", "p50_us", "p99_us", "share"])
+        return table.sort_values("total_ms", ascending=False).reset_index(drop=True)
+
+    def event_summary(self):
+        """
+        :return:    每种事件的个数和队列长度的统计
+        """
+        stats = {t.name: self.event_counts[t] for t in EventType}
+        stats["queue_depth_max"] = self.queue_depth_max
+        stats["queue_depth_mean"] = self.queue_depth_sum / self.queue_depth_samples if self.queue_depth_samples else 0
+        return stats
+
+    def export_chrome_trace(self, path):
+        """
+        导出Chrome trace格式（JSON）的文件
+        """
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = [{"name": name, "cat": EventType(t).name if t is not None else "loop", "ph": "X", "pid": pid,
+                   "tid": tid, "ts": (started - self.origin_ns) / 1e3, "dur": elapsed / 1e3}
+                  for name, started, elapsed, t in self.trace_events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ns"}, f)
+
+    def export_collapsed(self, path):
+        """
+        导出flamegraph.pl/speedscope使用的collapsed stack格式，每一行是"调用栈 耗时(微秒)"
+        没有开启trace时使用累计耗时
+        """
+        totals = {}
+        if self.trace_events:
+            for name, _, elapsed, t in self.trace_events:
+                stack = "run;%s;%s" % (EventType(t).name if t is not None else "loop", name)
+                totals[stack] = totals.get(stack, 0) + elapsed
+        else:
+            for s in self.handlers.values():
+                totals["run;%s" % s.name] = s.total_ns
+        with open(path, "w") as f:
+            for stack, ns in totals.items():
+                f.write("%s %d\n" % (stack, ns // 1000))
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import queue
+import traceback
+from math import inf
+
+import numpy as np
+
+from bt.components.data_handler.data import BarStoreDataHandler
+from bt.components.data_handler.registry import resolve_data_handler
+from bt.components.data_handler.shared import SharedBarStore, attach_bar_store
+from bt.components.event.event import EventType, OrderEvent
+from bt.components.execution_handler.execution import SimulatedExecutionHandler
+from bt.components.performance.performance import create_summary_stats
+from bt.components.portfolio.history import create_equity_curve
+from bt.components.portfolio.portfolio import NaivePortfolio
+from bt.event_loop.engine import BacktestEngine, EventBus
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def split_symbols(symbol_list, n_shards):
+    """
+    把symbol_list按顺序分成n_shards份，每份的个数最多相差1
+    """
+    n_shards = max(1, min(int(n_shards), len(symbol_list)))
+    bounds = np.linspace(0, len(symbol_list), n_shards + 1).astype(int)
+    return [list(symbol_list[bounds[i]:bounds[i + 1]]) for i in range(n_shards)]
+
+
+class CapitalBudget(object):
+    """
+    shard中的下单额度，代替broker.execute_order注册在ORDER事件上
+    1、会增加总敞口（各个symbol持仓市值的绝对值之和）的订单要占用额度，额度不够时拒绝这个订单
+    2、减少敞口的订单总是放行，它释放的额度要等coordinator下一次分配时才能使用
+    """
+
+    def __init__(self, portfolio, data_handler, execute_order):
+        self.portfolio = portfolio
+        self.data_handler = data_handler
+        self.execute_order = execute_order
+        self.buying_power = inf
+        self.rejected = 0
+
+    def on_order(self, event: OrderEvent):
+        position = self.portfolio.current_positions[event.symbol]
+        quantity = event.quantity if event.direction == "BUY" else -event.quantity
+        added = abs(position + quantity) - abs(position)
+        if added > 0:
+            price = event.price
+            if price is None:
+                price = self.data_handler.get_latest_bar_value(event.symbol, "close")
+            cost = added * price
+            if not cost <= self.buying_power:
+                self.rejected += 1
+                return
+            self.buying_power -= cost
+        self.execute_order(event)
+
+
+class Shard(object):
+    """
+    一个shard：在一部分symbol上运行完整的事件驱动回测（data handler、strategy、portfolio、broker都只看到这些symbol），
+    分批运行，每批之后把这批bar的cash、commission、total交给coordinator
+    """
+
+    def __init__(self, handle, symbol_list, start_datetime, strategy_cls, initial_capital, strategy_params=None,
+                 portfolio_cls=NaivePortfolio, portfolio_kwargs=None, execution_cls=SimulatedExecutionHandler,
+                 execution_kwargs=None):
+        """
+        :param handle:  SharedBarStore.handle，全部symbol的数据
+        :param symbol_list: 这个shard的symbol
+        :param initial_capital: 分配给这个shard的初始资金
+        """
+        if not (portfolio_kwargs or {}).get("store_history", True):
+            raise ValueError("shard需要store_history为True，coordinator要用每一期的资金")
+        self.engine = BacktestEngine(symbol_list, start_datetime, None, BarStoreDataHandler, strategy_cls,
+                                     portfolio_cls=portfolio_cls, execution_cls=execution_cls,
+                                     initial_capital=initial_capital, strategy_params=strategy_params,
+                                     portfolio_kwargs=portfolio_kwargs, execution_kwargs=execution_kwargs,
+                                     data_handler_kwargs={"bar_store": attach_bar_store(handle)})
+        broker = self.engine.broker
+        self.budget = CapitalBudget(self.engine.portfolio, self.engine.data_handler, broker.execute_order)
+        self.engine.unregister(EventType.ORDER, broker.execute_order)
+        self.engine.register(EventType.ORDER, self.budget.on_order)
+        self.reported = 0   # 已经交给coordinator的history的行数
+
+    def run_batch(self, n_bars, buying_power):
+        """
+        :param n_bars:  这一批最多运行的bar数
+        :param buying_power:    这一批可以新增的敞口
+        :return:    dict，包含这一批的每期资金、当前的敞口，以及是否已经结束
+        """
+        self.budget.buying_power = buying_power
+        self.engine.run_bars(n_bars)
+        portfolio = self.engine.portfolio
+        history = portfolio.history
+        start, end = self.reported, history.length
+        self.reported = end
+        done = not self.engine.data_handler.continue_backtest
+        return {"datetime": history.datetime[start:end].copy(), "cash": history.cash[start:end].copy(),
+                "commission": history.commission[start:end].copy(), "total": history.total[start:end].copy(),
+                "exposure": float(np.nansum(np.abs(history.holdings[end - 1]))), "rejected": self.budget.rejected,
+                "done": done, "positions": dict(portfolio.current_positions) if done else None}
+
+
+def shard_worker(tasks, results):
+    """
+    worker的主循环：从tasks中读取命令，把结果放进results
+    1、命令是("init", shard_id, Shard的参数dict)、("run", shard_id, (n_bars, buying_power))，None表示退出
+    2、结果是(shard_id, "ok"或"error", 结果或者traceback)
+    3、tasks和results只需要有put和get，把它们换成跨机器的任务队列，shard就可以分布在多个节点上
+    """
+    shards = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        command, shard_id, args = task
+        try:
+            if command == "init":
+                shards[shard_id] = Shard(**args)
+                result = None
+            else:
+                result = shards[shard_id].run_batch(*args)
+        except Exception:
+            results.put((shard_id, "error", traceback.format_exc()))
+        else:
+            results.put((shard_id, "ok", result))
+
+
+class LocalWorkers(object):
+    """
+    在当前进程中依次运行所有shard，结果和ProcessWorkers完全相同，用于调试和测试
+    """
+
+    def __init__(self):
+        self.shards = {}
+
+    def init(self, shards):
+        for shard_id, kwargs in shards.items():
+            self.shards[shard_id] = Shard(**kwargs)
+
+    def run(self, batch):
+        return {shard_id: self.shards[shard_id].run_batch(*args) for shard_id, args in batch.items()}
+
+    def close(self):
+        self.shards.clear()
+
+
+class ProcessWorkers(object):
+    """
+    每个worker进程运行shard_worker，shard固定分配给shard_id % processes这个进程，它的状态一直留在那个进程里
+    """
+
+    def __init__(self, processes, context=None, poll_interval=1.0):
+        """
+        :param poll_interval:   等待结果时每隔这么多秒检查一次worker进程是否还活着
+        """
+        context = context or multiprocessing.get_context()
+        self.poll_interval = poll_interval
+        self.results = context.Queue()
+        self.tasks = [context.Queue() for _ in range(processes)]
+        self.processes = [context.Process(target=shard_worker, args=(tasks, self.results), daemon=True)
+                          for tasks in self.tasks]
+        for process in self.processes:
+            process.start()
+
+    def _collect(self, n):
+        collected = {}
+        errors = []
+        while len(collected) < n:
+            try:
+                shard_id, status, result = self.results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                # worker被kill或者崩溃时不会再有结果，直接抛出异常，调用方的finally才能释放共享内存
+                dead = [(i, process.exitcode) for i, process in enumerate(self.processes) if not process.is_alive()]
+                if dead:
+                    raise RuntimeError("worker进程意外退出：%s" % ", ".join("worker %d (exitcode %s)" % d
+                                                                     for d in dead)) from None
+                continue
+            if status == "error":
+                errors.append("shard %d:\n%s" % (shard_id, result))
+            collected[shard_id] = result
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return collected
+
+    def _send(self, command, tasks):
+        for shard_id, args in tasks.items():
+            self.tasks[shard_id % len(self.tasks)].put((command, shard_id, args))
+        return self._collect(len(tasks))
+
+    def init(self, shards):
+        """
+        :param shards:  {shard_id: Shard的参数dict}
+        """
+        self._send("init", shards)
+
+    def run(self, batch):
+        """
+        :param batch:   {shard_id: (n_bars, buying_power)}
+        :return:    {shard_id: Shard.run_batch的结果}
+        """
+        return self._send("run", batch)
+
+    def close(self, timeout=5.0):
+        """
+        通知所有worker退出，timeout秒之后还没有退出的（比如出错时还在运行的）直接terminate
+        """
+        for tasks in self.tasks:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+
+class ShardedResult(object):
+    """
+    coordinator合并之后的结果：和单个Portfolio的history一样，第0期是初始状态，之后每期一行
+    positions是回测结束时每个symbol的持仓，rejected是因为额度不够被拒绝的订单数
+    """
+
+    def __init__(self, datetime, cash, commission, total, positions, rejected):
+        self.datetime = datetime
+        self.cash = cash
+        self.commission = commission
+        self.total = total
+        self.positions = positions
+        self.rejected = rejected
+
+    def create_equity_curve_dataframe(self) -> pd.DataFrame:
+        """
+        和Portfolio.create_equity_curve_dataframe格式相同，只是没有每个symbol的持有资金量
+        """
+        n = len(self.total)
+        return create_equity_curve([], self.datetime.view("datetime64[ns]"), np.empty((n, 0)), self.cash,
+                                   self.commission, self.total)
+
+    def output_summary_stats(self):
+        return create_summary_stats(self.create_equity_curve_dataframe())
+
+
+def run_sharded(strategy_cls, symbol_list, data_handler_cls, start_datetime, end_datetime, data_handler_kwargs=None,
+                strategy_params=None, portfolio_cls=NaivePortfolio, portfolio_kwargs=None,
+                execution_cls=SimulatedExecutionHandler, execution_kwargs=None, initial_capital=100000.0,
+                n_shards=None, processes=None, batch_bars=256, max_leverage=None) -> ShardedResult:
+    """
+    把一次回测的symbol分成多个shard并行运行，由coordinator（当前进程）合并成一个portfolio的净值曲线
+    1、数据只在当前进程中加载、对齐一次，然后放到共享内存中，每个shard映射共享内存之后复制出自己的symbol的列
+    2、每个shard分到和symbol个数成比例的初始资金，在自己的symbol上产生信号、下单和成交；
+       coordinator每batch_bars个bar把所有shard的cash、commission、total逐期相加
+    3、max_leverage是组合层面的资金限制：总敞口不超过max_leverage倍的总资产。每批开始前coordinator用所有shard
+       最新的总资产和敞口算出可以新增的敞口，按symbol个数分给各个shard，超出额度的订单被拒绝。
+       额度只在每批之间重新分配，batch_bars越小，限制越精确，同步的开销也越大
+    4、策略只能看到自己shard中的symbol，需要在所有symbol之间横向比较的策略不能这样拆分
+    :param n_shards:    shard的个数，默认和processes相同
+    :param processes:   worker进程数，默认是cpu的个数；为0时所有shard在当前进程中依次运行
+    :param batch_bars:  coordinator每次同步之间的bar数
+    :param max_leverage:    总敞口/总资产的上限，None表示不限制
+    :return:    ShardedResult
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    data_handler_cls = resolve_data_handler(data_handler_cls)
+    data_handler = data_handler_cls(EventBus(), symbol_list, start_datetime, end_datetime,
+                                    **(data_handler_kwargs or {}))
+    # data handler可能去掉了下载失败的symbol（比如allow_partial=True），只拆分它实际加载的symbol
+    symbol_list = list(data_handler.symbol_list)
+    shards = split_symbols(symbol_list, n_shards or max(processes, 1))
+    shared = SharedBarStore(data_handler.bar_store)
+    n_symbols = len(symbol_list)
+    del data_handler
+
+    workers = ProcessWorkers(min(processes, len(shards))) if processes > 0 else LocalWorkers()
+    try:
+        workers.init({i: {"handle": shared.handle, "symbol_list": symbols, "start_datetime": start_datetime,
+                          "strategy_cls": strategy_cls, "strategy_params": strategy_params,
+                          "initial_capital": initial_capital * len(symbols) / n_symbols,
+                          "portfolio_cls": portfolio_cls, "portfolio_kwargs": portfolio_kwargs,
+                          "execution_cls": execution_cls, "execution_kwargs": execution_kwargs}
+                      for i, symbols in enumerate(shards)})
+
+        parts = {name: [[] for _ in shards] for name in ("datetime", "cash", "commission", "total")}
+        totals = [initial_capital * len(symbols) / n_symbols for symbols in shards]
+        exposures = [0.0] * len(shards)
+        running = set(range(len(shards)))
+        results = {}
+        while running:
+            if max_leverage is None:
+                budgets = [inf] * len(shards)
+            else:
+                headroom = max(max_leverage * sum(totals) - sum(exposures), 0.0)
+                budgets = [headroom * len(symbols) / n_symbols for symbols in shards]
+            batch = workers.run({i: (batch_bars, budgets[i]) for i in sorted(running)})
+            for i, result in batch.items():
+                for name in parts:
+                    parts[name][i].append(result[name])
+                if len(result["total"]):
+                    totals[i] = result["total"][-1]
+                exposures[i] = result["exposure"]
+                if result["done"]:
+                    running.discard(i)
+                results[i] = result
+    finally:
+        workers.close()
+        shared.close()
+
+    merged = {name: [np.concatenate(chunks) for chunks in parts[name]] for name in parts}
+    positions = {}
+    for i in range(len(shards)):
+        positions.update(results[i]["positions"])
+    return ShardedResult(merged["datetime"][0], np.sum(merged["cash"], axis=0), np.sum(merged["commission"], axis=0),
+                         np.sum(merged["total"], axis=0), positions, sum(r["rejected"] for r in results.values()))
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from abc import ABCMeta, abstractmethod
+from math import floor
+
+import numpy as np
+
+from bt.components.data_handler.bar_store import BarStore
+from bt.components.performance.performance import create_summary_stats
+from bt.components.portfolio.history import create_equity_curve
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def calculate_commissions(quantity: np.ndarray) -> np.ndarray:
+    """
+    和FillEvent.calculate_commission同样的规则，对一个数组批量计算佣金，没有交易的地方佣金为0
+    :param quantity:    每一笔交易的数量，正负表示方向
+    :return:    每一笔交易的佣金
+    """
+    commission_fee_rate = 0.0002
+    full_cost = np.maximum(np.abs(quantity) * commission_fee_rate, 5.0)
+    return np.where(quantity != 0, full_cost, 0.0)
+
+
+def positions_from_signals(signals: np.ndarray, quantity) -> np.ndarray:
+    """
+    把signal矩阵转换成目标持仓矩阵
+    :param signals: 形状为(bar数, symbol数)，1表示"LONG"，-1表示"SHORT"，0表示"EXIT"，nan表示没有signal，保持之前的持仓
+    :param quantity:    每个signal对应的交易数量，可以是标量或者长度为symbol数的数组
+    :return:    目标持仓矩阵
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    rows = np.arange(len(signals))[:, None]
+    # 每个位置上最近一次出现signal的行号，然后用它做前向填充
+    last = np.maximum.accumulate(np.where(np.isnan(signals), -1, rows), axis=0)
+    filled = np.take_along_axis(signals, np.maximum(last, 0), axis=0)
+    filled[last < 0] = 0.0
+    return filled * quantity
+
+
+class VectorizedStrategy(metaclass=ABCMeta):
+    """
+    向量化回测所用的strategy的父类
+    和Strategy不同，它不是逐个bar地处理MarketEvent，而是一次性根据对齐后的整个价格矩阵算出每个bar之后的目标持仓
+    """
+
+    def __init__(self, symbol_list, **params):
+        """
+        :param symbol_list: 交易品种的代码
+        :param params:  策略的参数
+        """
+        self.symbol_list = symbol_list
+        self.params = params
+
+    @abstractmethod
+    def generate_positions(self, timestamps: np.ndarray, bars: dict) -> np.ndarray:
+        """
+        计算目标持仓
+        :param timestamps:  int64的纳秒时间戳，长度为bar数
+        :param bars:    {字段: 形状为(bar数, symbol数)的数组}
+        :return:    形状为(bar数, symbol数)的目标持仓，第t行表示在第t个bar以收盘价成交之后的持仓
+        """
+        raise NotImplementedError("Should implement generate_positions()")
+
+
+class VectorizedBuyAndHoldStrategy(VectorizedStrategy):
+    """
+    BuyAndHoldStrategy的向量化版本：在第一个bar为每个symbol买入，然后一直持有
+    """
+
+    def __init__(self, symbol_list, strength=10):
+        super(VectorizedBuyAndHoldStrategy, self).__init__(symbol_list, strength=strength)
+
+    def generate_positions(self, timestamps: np.ndarray, bars: dict) -> np.ndarray:
+        signals = np.full((len(timestamps), len(self.symbol_list)), np.nan)
+        signals[:1] = 1.0
+        return positions_from_signals(signals, floor(100 * self.params["strength"]))
+
+
+class VectorizedResult(object):
+    """
+    向量化回测的结果，各个数组的第0行是初始状态，第t行是第t个bar更新之后的状态，和Portfolio.all_holdings一一对应
+    """
+
+    def __init__(self, symbol_list, datetime, positions, holdings, cash, commission, total):
+        self.symbol_list = symbol_list
+        self.datetime = datetime
+        self.positions = positions
+        self.holdings = holdings
+        self.cash = cash
+        self.commission = commission
+        self.total = total
+
+    def create_equity_curve_dataframe(self) -> pd.DataFrame:
+        """
+        创建和Portfolio.create_equity_curve_dataframe格式相同的dataframe
+        :return:
+        """
+        return create_equity_curve(self.symbol_list, self.datetime, self.holdings, self.cash, self.commission,
+                                   self.total)
+
+    def output_summary_stats(self):
+        return create_summary_stats(self.create_equity_curve_dataframe())
+
+
+def run_vectorized_backtest(bar_store: BarStore, strategy: VectorizedStrategy, start_datetime,
+                            initial_capital=100000.0) -> VectorizedResult:
+    """
+    向量化的回测引擎，所有bar一次性用numpy计算，结果和事件驱动的回测（SimulatedExecutionHandler + Portfolio）一致：
+    1、第t个bar的目标持仓以第t个bar的收盘价成交，佣金按FillEvent.calculate_commission的规则计算
+    2、第t个bar的快照和Portfolio.update_timeindex一样，是在第t个bar的成交之前做的
+    :param bar_store:   对齐后的bar数据，使用全部已经写入的bar
+    :param strategy:    VectorizedStrategy
+    :param start_datetime:  开始时间，作为初始状态那一行的时间
+    :param initial_capital: 初始资金
+    :return:    VectorizedResult
+    """
+    n = bar_store.length
+    timestamps = bar_store.timestamp[:n]
+    bars = {f: bar_store.fields[f][:n] for f in bar_store.fields}
+    close = bars["close"]
+
+    target = np.asarray(strategy.generate_positions(timestamps, bars), dtype=np.float64)
+    before = np.zeros_like(target)  # 第t个bar成交之前的持仓
+    before[1:] = target[:-1]
+    quantity = target - before
+
+    commission = calculate_commissions(quantity)
+    cost = np.where(quantity != 0, quantity * close, 0.0)
+    cash_flow = (cost + commission).sum(axis=1)
+
+    # 加上第0行的初始状态
+    positions = np.vstack([np.zeros((1, target.shape[1])), before])
+    cash = np.empty(n + 1)
+    cash[0] = initial_capital
+    cash[1:] = initial_capital - np.concatenate([[0.0], np.cumsum(cash_flow)[:-1]])
+    cum_commission = np.zeros(n + 1)
+    cum_commission[2:] = np.cumsum(commission.sum(axis=1))[:-1]
+    holdings = np.zeros_like(positions)
+    holdings[1:] = before * close
+    total = cash + holdings.sum(axis=1)
+
+    datetime = np.empty(n + 1, dtype="datetime64[ns]")
+    datetime[0] = np.datetime64(start_datetime, "ns")
+    datetime[1:] = timestamps.view("datetime64[ns]")
+    return VectorizedResult(bar_store.symbol_list, datetime, positions, holdings, cash, cum_commission, total)
@@ -0,0 +1,279 @@
+import datetime
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import time
+import types
+from enum import Enum
+
+import numpy as np
+
+from bt.components.data_handler.bar_store import BAR_FIELDS, BarStore
+from bt.components.data_handler.registry import resolve_data_handler
+from bt.components.execution_handler.execution import SimulatedExecutionHandler
+from bt.components.portfolio.portfolio import NaivePortfolio
+from bt.event_loop.engine import BacktestEngine
+
+# 回测结果依赖的核心模块，这些模块的代码变化时所有缓存都会失效
+CORE_MODULES = ("bt.event_loop.engine", "bt.components.event.event", "bt.components.portfolio.portfolio",
+                "bt.components.portfolio.history", "bt.components.performance.performance",
+                "bt.components.performance.tracker", "bt.components.data_handler.data",
+                "bt.components.data_handler.bar_store", "bt.components.data_handler.indicator",
+                "bt.components.data_handler.resample")
+
+
+def fingerprint_bar_store(bar_store: BarStore):
+    """
+    已经对齐好的数据的指纹，包括symbol、时间戳和所有字段
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    n = bar_store.length
+    digest.update(json.dumps(list(bar_store.symbol_list)).encode())
+    digest.update(bar_store.timestamp[:n].tobytes())
+    for f in BAR_FIELDS:
+        digest.update(bar_store.fields[f][:n].tobytes())
+    return digest.hexdigest()
+
+
+def _source(module_name, cls=None):
+    module = sys.modules.get(module_name)
+    if module is None and cls is None:
+        # 还没有import的核心模块也要用它的源码，否则键会随着import的先后而变化
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            pass
+    try:
+        return inspect.getsource(module)
+    except (OSError, TypeError):
+        pass
+    # 在notebook里定义的类没有模块的源码，只能用类本身的源码
+    try:
+        return inspect.getsource(cls) if cls is not None else module_name
+    except (OSError, TypeError):
+        return "%s.%s" % (module_name, getattr(cls, "__qualname__", ""))
+
+
+def fingerprint_code(*classes):
+    """
+    代码的指纹：classes以及它们的所有父类所在模块的源码，再加上CORE_MODULES的源码
+    """
+    sources = {}
+    for cls in classes:
+        for klass in cls.__mro__:
+            if klass.__module__ == "builtins" or klass.__module__ in sources:
+                continue
+            sources[klass.__module__] = _source(klass.__module__, klass)
+    for name in CORE_MODULES:
+        if name not in sources:
+            sources[name] = _source(name)
+    digest = hashlib.blake2b(digest_size=20)
+    for name in sorted(sources):
+        digest.update(name.encode())
+        digest.update(sources[name].encode())
+    return digest.hexdigest()
+
+
+def _qualified_name(obj):
+    return "%s.%s" % (obj.__module__, obj.__qualname__)
+
+
+def _canonical_value(value, seen):
+    """
+    把参数变成只由None、bool、int、float、str和list组成的值，内容相同的参数总是得到相同的结果
+    1、对象用类的完整名字加上按名字排序的vars(obj)表示，递归处理其中的值，不会出现repr中的内存地址
+    2、类和模块级的函数用它们的完整名字表示
+    3、无法这样表示的值（lambda、闭包、没有__dict__的对象等）抛出TypeError，而不是得到一个每次都不同的键
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+        return ["datetime", repr(value)]
+    if isinstance(value, Enum):
+        return ["enum", _qualified_name(type(value)), value.name]
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        name = _qualified_name(value)
+        if "<" in name:
+            raise TypeError("无法作为缓存键的一部分：%r（lambda或者在函数中定义的类、函数）" % (value,))
+        return ["name", name]
+    if id(value) in seen:
+        raise TypeError("无法作为缓存键的一部分：%r（循环引用）" % (value,))
+    seen = seen | {id(value)}
+    if isinstance(value, (list, tuple)):
+        return [type(value).__name__, [_canonical_value(item, seen) for item in value]]
+    if isinstance(value, (set, frozenset)):
+        items = [_canonical_value(item, seen) for item in value]
+        return ["set", sorted(items, key=lambda item: json.dumps(item, sort_keys=True))]
+    if isinstance(value, dict):
+        items = [[_canonical_value(k, seen), _canonical_value(v, seen)] for k, v in value.items()]
+        return ["dict", sorted(items, key=lambda item: json.dumps(item[0], sort_keys=True))]
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return ["ndarray", array.dtype.str, list(array.shape), hashlib.blake2b(array.tobytes()).hexdigest()]
+    if isinstance(value, np.random.RandomState):
+        return ["RandomState", _canonical_value(value.get_state(legacy=False), seen)]
+    if isinstance(value, np.random.Generator):
+        return ["Generator", _canonical_value(value.bit_generator.state, seen)]
+    try:
+        attributes = vars(value)
+    except TypeError:
+        raise TypeError("无法作为缓存键的一部分：%r（没有__dict__）" % (value,)) from None
+    return ["object", _qualified_name(type(value)), _canonical_value(attributes, seen)]
+
+
+def _canonical(value):
+    return json.dumps(_canonical_value(value, frozenset()), sort_keys=True)
+
+
+def run_key(data_key, strategy_cls, strategy_params, portfolio_cls, portfolio_kwargs, execution_cls,
+            execution_kwargs, initial_capital, start_datetime, end_datetime=None, data_handler_cls=None,
+            data_handler_kwargs=None):
+    """
+    一次回测的缓存键，任何一个输入发生变化，键都会变化
+    data_handler_cls和它的参数、end_datetime也是键的一部分，这样调用方给出的data_key没有覆盖到它们时也不会得到旧的结果
+    """
+    data_handler_cls = resolve_data_handler(data_handler_cls)
+    classes = [strategy_cls, portfolio_cls, execution_cls]
+    if data_handler_cls is not None:
+        classes.append(data_handler_cls)
+    parts = [
+        data_key,
+        fingerprint_code(*classes),
+        "%s.%s" % (strategy_cls.__module__, strategy_cls.__qualname__), _canonical(strategy_params or {}),
+        "%s.%s" % (portfolio_cls.__module__, portfolio_cls.__qualname__), _canonical(portfolio_kwargs or {}),
+        "%s.%s" % (execution_cls.__module__, execution_cls.__qualname__), _canonical(execution_kwargs or {}),
+        _canonical(data_handler_cls), _canonical(data_handler_kwargs or {}),
+        repr(float(initial_capital)), str(start_datetime), str(end_datetime),
+    ]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class CachedResult(object):
+    """
+    缓存的一次回测的结果
+    equity_curve:   Portfolio.create_equity_curve_dataframe()，store_history为False时是None
+    stats:  output_summary_stats()
+    hit:    是否来自缓存
+    """
+
+    def __init__(self, key, equity_curve, stats, hit=False):
+        self.key = key
+        self.equity_curve = equity_curve
+        self.stats = stats
+        self.hit = hit
+
+
+class ResultCache(object):
+    """
+    本地磁盘上的回测结果缓存，按内容寻址：文件名就是run_key
+    1、每个结果一个pickle文件，读取时更新文件的修改时间，作为LRU的依据
+    2、所有结果的总大小超过max_bytes时，从最久没有用过的开始删除
+    """
+
+    def __init__(self, root, max_bytes=1 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".pkl")
+
+    def get(self, key):
+        """
+        :return:    CachedResult，没有缓存时返回None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                equity_curve, stats = pickle.load(f)
+            self._touch(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return CachedResult(key, equity_curve, stats, hit=True)
+
+    @staticmethod
+    def _touch(path):
+        # 显式给出纳秒时间，不依赖文件系统自动更新的时间的精度
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def put(self, key, equity_curve, stats):
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((equity_curve, stats), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._touch(path)
+        self.evict()
+        return CachedResult(key, equity_curve, stats)
+
+    def entries(self):
+        """
+        :return:    [(修改时间, 字节数, 路径), ...]，最久没有用过的在前面
+        """
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+def run_backtest_cached(cache: ResultCache, symbol_list, start_datetime, end_datetime, data_handler_cls, strategy_cls,
+                        strategy_params=None, data_handler_kwargs=None, portfolio_cls=NaivePortfolio,
+                        execution_cls=SimulatedExecutionHandler, initial_capital=100000.0, portfolio_kwargs=None,
+                        execution_kwargs=None, data_key=None):
+    """
+    带缓存的一次完整回测，参数和BacktestEngine相同
+    data_key为None时先用data_handler_cls加载数据，再用数据、代码和参数计算缓存键，命中时不再运行回测
+    :param data_key:    数据的指纹，默认用fingerprint_bar_store计算（需要加载并读一遍全部数据）；
+                        调用方已经知道数据的版本时可以直接给出，这时先查缓存，命中时不会加载数据，也不会构造engine
+    :return:    CachedResult
+    """
+    def key_for(data_key):
+        return run_key(data_key, strategy_cls, strategy_params, portfolio_cls, portfolio_kwargs, execution_cls,
+                       execution_kwargs, initial_capital, start_datetime, end_datetime, data_handler_cls,
+                       data_handler_kwargs)
+
+    if data_key is not None:
+        key = key_for(data_key)
+        result = cache.get(key)
+        if result is not None:
+            return result
+    engine = BacktestEngine(symbol_list, start_datetime, end_datetime, data_handler_cls, strategy_cls,
+                            portfolio_cls=portfolio_cls, execution_cls=execution_cls, initial_capital=initial_capital,
+                            data_handler_kwargs=data_handler_kwargs, strategy_params=strategy_params,
+                            portfolio_kwargs=portfolio_kwargs, execution_kwargs=execution_kwargs)
+    if data_key is None:
+        key = key_for(fingerprint_bar_store(engine.data_handler.bar_store))
+        result = cache.get(key)
+        if result is not None:
+            return result
+    portfolio = engine.run()
+    equity_curve = portfolio.create_equity_curve_dataframe() if portfolio.store_history else None
+    return cache.put(key, equity_curve, engine.output_summary_stats())
@@ -0,0 +1,212 @@
+import json
+import os
+
+import numpy as np
+
+from bt.components.logs.journal import RECORD_DTYPES
+from bt.components.performance.performance import create_numeric_summary_stats
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+CURVE_COLUMNS = {"datetime": np.int64, "cash": np.float64, "commission": np.float64, "total": np.float64}
+STATS = ("total return", "sharp ratio", "max drawdown", "drawdown duration")
+TRADE_DTYPE = RECORD_DTYPES["fill"]
+
+
+def trades_from_positions(datetime, positions):
+    """
+    根据相邻两期持仓的变化得到每一笔交易，格式和Journal的fill记录相同，价格和佣金未知，为nan
+    :param datetime:    每期的int64纳秒时间戳
+    :param positions:   形状为(期数, symbol数)的持仓
+    """
+    change = np.diff(positions, axis=0)
+    rows, columns = np.nonzero(change)
+    quantity = change[rows, columns]
+    trades = np.empty(len(rows), dtype=TRADE_DTYPE)
+    trades["time"] = datetime[rows + 1]
+    trades["symbol"] = columns
+    trades["direction"] = np.sign(quantity)
+    trades["quantity"] = np.abs(quantity)
+    trades["price"] = np.nan
+    trades["commission"] = np.nan
+    return trades
+
+
+def _stat_file(name):
+    return name.replace(" ", "_") + ".f8"
+
+
+class RunStore(object):
+    """
+    按列保存在磁盘上的回测结果，可以保存成千上万次回测，之后用memory map只读取需要的列
+    1、所有回测的同一列追加在同一个二进制文件中：curve/下是每期的datetime、cash、commission、total，
+       positions.f8是每期的持仓，trades.bin是交易记录，stats/下是每个统计量一个文件，第i个数是第i次回测的
+    2、index.jsonl中每行是一次回测的元数据：参数、symbol_list，以及它在各个列文件中的位置
+    3、写入时先追加列文件，最后写index.jsonl，写到一半中断的回测不会出现在index中，重新打开时它留下的数据被截掉
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, "curve"), exist_ok=True)
+        os.makedirs(os.path.join(root, "stats"), exist_ok=True)
+        self.index = []
+        path = self._path("index.jsonl")
+        if os.path.exists(path):
+            with open(path) as f:
+                self.index = [json.loads(line) for line in f if line.strip()]
+        # 上次写到一半中断的回测可能只追加了一部分列文件，把每个列文件都截断到index.jsonl记录的长度，
+        # 否则之后追加的回测在各个列文件中的位置就不一致了
+        if self.index:
+            last = self.index[-1]
+            curve_rows = last["curve"] + last["length"]
+            position_items = last["positions"] + last["length"] * len(last["symbol_list"])
+            trade_rows = sum(last["trades"])
+        else:
+            curve_rows = position_items = trade_rows = 0
+        for name, dtype in CURVE_COLUMNS.items():
+            self._truncate(self._path("curve", name + ".bin"), curve_rows, dtype)
+        self._truncate(self._path("positions.f8"), position_items, np.float64)
+        self._truncate(self._path("trades.bin"), trade_rows, TRADE_DTYPE)
+        for name in STATS:
+            self._truncate(self._path("stats", _stat_file(name)), len(self.index), np.float64)
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def _truncate(path, count, dtype):
+        size = count * np.dtype(dtype).itemsize
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    @staticmethod
+    def _append(path, values, dtype):
+        values = np.ascontiguousarray(values, dtype=dtype)
+        offset = os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0
+        with open(path, "ab") as f:
+            values.tofile(f)
+        return offset
+
+    def _map(self, path, dtype, offset=0, count=None):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        data = np.memmap(path, dtype=dtype, mode="r")
+        return data[offset:] if count is None else data[offset:offset + count]
+
+    def add_run(self, portfolio, params=None, metadata=None, trades=None):
+        """
+        保存一次回测的结果
+        :param portfolio:   运行完的Portfolio，需要store_history为True
+        :param params:  策略参数，可以用select按参数查询
+        :param metadata:    其他可以json序列化的信息
+        :param trades:  交易记录（比如read_journal(...)["fill"]），默认根据持仓的变化得到
+        :return:    run_id
+        """
+        history = portfolio.history
+        n = history.length
+        datetime = history.datetime[:n]
+        positions = history.positions[:n]
+        stats = create_numeric_summary_stats(portfolio.create_equity_curve_dataframe())
+        if trades is None:
+            trades = trades_from_positions(datetime, positions)
+
+        entry = {"run_id": len(self.index), "params": params or {}, "metadata": metadata or {},
+                 "symbol_list": list(portfolio.symbol_list), "length": n}
+        # 所有curve列的行数相同，所以它们的起始位置也相同
+        offsets = [self._append(self._path("curve", name + ".bin"), getattr(history, name)[:n], dtype)
+                   for name, dtype in CURVE_COLUMNS.items()]
+        entry["curve"] = offsets[0]
+        entry["positions"] = self._append(self._path("positions.f8"), positions, np.float64)
+        entry["trades"] = [self._append(self._path("trades.bin"), trades, TRADE_DTYPE), len(trades)]
+        for name in STATS:
+            self._append(self._path("stats", _stat_file(name)), [stats[name]], np.float64)
+        with open(self._path("index.jsonl"), "a") as f:
+            f.write(json.dumps(entry, default=repr) + "\n")
+        self.index.append(entry)
+        return entry["run_id"]
+
+    def stats(self, names=STATS):
+        """
+        :return:    {统计量: 长度为回测次数的memory map数组}，只读取names中的列
+        """
+        return {name: self._map(self._path("stats", _stat_file(name)), np.float64, 0, len(self.index))
+                for name in names}
+
+    def top_k(self, name, k, largest=True):
+        """
+        按某个统计量排序的前k次回测，nan排在最后
+        :return:    run_id的数组
+        """
+        values = np.array(self.stats((name,))[name])
+        values = np.where(np.isnan(values), -np.inf if largest else np.inf, values)
+        if largest:
+            values = -values
+        k = min(k, len(values))
+        if k == 0:
+            return np.empty(0, dtype=np.intp)
+        candidates = np.argpartition(values, k - 1)[:k]
+        return candidates[np.argsort(values[candidates], kind="stable")]
+
+    def select(self, **params):
+        """
+        参数符合条件的回测，比如select(strength=5)、select(window=[10, 20])（list或tuple表示其中之一）
+        :return:    run_id的list
+        """
+        selected = []
+        for entry in self.index:
+            run_params = entry["params"]
+            for name, value in params.items():
+                if name not in run_params:
+                    break
+                if isinstance(value, (list, tuple, set)):
+                    if run_params[name] not in value:
+                        break
+                elif run_params[name] != value:
+                    break
+            else:
+                selected.append(entry["run_id"])
+        return selected
+
+    def curve(self, run_id, columns=tuple(CURVE_COLUMNS)):
+        """
+        :return:    {列名: memory map数组}，只读取columns中的列
+        """
+        entry = self.index[run_id]
+        return {name: self._map(self._path("curve", name + ".bin"), CURVE_COLUMNS[name], entry["curve"],
+                                entry["length"]) for name in columns}
+
+    def curves(self, run_ids, column="total"):
+        """
+        多次回测的同一列，长度相同时是一个二维数组，每行一次回测，可以直接交给metrics中的函数
+        """
+        arrays = [self.curve(run_id, (column,))[column] for run_id in run_ids]
+        if arrays and all(len(a) == len(arrays[0]) for a in arrays):
+            return np.vstack(arrays)
+        return arrays
+
+    def positions(self, run_id):
+        """
+        :return:    形状为(期数, symbol数)的持仓，memory map
+        """
+        entry = self.index[run_id]
+        m = len(entry["symbol_list"])
+        data = self._map(self._path("positions.f8"), np.float64, entry["positions"], entry["length"] * m)
+        return data.reshape(entry["length"], m)
+
+    def trades(self, run_id):
+        offset, count = self.index[run_id]["trades"]
+        return self._map(self._path("trades.bin"), TRADE_DTYPE, offset, count)
+
+    def frame(self, names=STATS):
+        """
+        每次回测一行的DataFrame，包含参数和统计信息
+        """
+        frame = pd.DataFrame([entry["params"] for entry in self.index], index=pd.RangeIndex(len(self.index),
+                                                                                           name="run_id"))
+        for name, values in self.stats(names).items():
+            frame[name] = np.asarray(values)
+        return frame
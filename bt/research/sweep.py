@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from bt.components.data_handler.data import BarStoreDataHandler
+from bt.components.data_handler.registry import resolve_data_handler
+from bt.components.data_handler.shared import SharedBarStore, attach_bar_store
+from bt.components.execution_handler.execution import SimulatedExecutionHandler
+from bt.components.portfolio.portfolio import NaivePortfolio
+from bt.event_loop.engine import BacktestEngine, EventBus
+from bt.components.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def expand_param_grid(param_grid):
+    """
+    把参数网格展开成参数组合的list
+    :param param_grid:  {参数名: 候选值的list}，或者已经展开好的[{参数名: 值}, ...]
+    :return:    [{参数名: 值}, ...]
+    """
+    if isinstance(param_grid, dict):
+        names = list(param_grid)
+        return [dict(zip(names, values)) for values in itertools.product(*(param_grid[n] for n in names))]
+    return [dict(p) for p in param_grid]
+
+
+def _run_one(handle, strategy_cls, params, start_datetime, portfolio_cls, execution_cls, initial_capital):
+    """
+    在worker进程中跑一个参数组合，数据直接映射共享内存
+    """
+    engine = BacktestEngine(handle["symbol_list"], start_datetime, None, BarStoreDataHandler, strategy_cls,
+                            portfolio_cls=portfolio_cls, execution_cls=execution_cls,
+                            initial_capital=initial_capital,
+                            data_handler_kwargs={"bar_store": attach_bar_store(handle)}, strategy_params=params)
+    engine.run()
+    return engine.output_summary_stats()
+
+
+def run_sweep(strategy_cls, param_grid, symbol_list, data_handler_cls, start_datetime, end_datetime,
+              data_handler_kwargs=None, portfolio_cls=NaivePortfolio, execution_cls=SimulatedExecutionHandler,
+              initial_capital=100000.0, max_workers=None, progress=None, cancel_event=None) -> pd.DataFrame:
+    """
+    并行地对一个策略的参数网格做回测
+    1、数据只在当前进程中用data_handler_cls加载、对齐一次，然后放到共享内存中，所有worker直接映射这块内存，
+       所以worker的个数增加时内存占用基本不变
+    2、每个参数组合在进程池中跑一遍事件驱动的回测，结果是output_summary_stats
+    :param strategy_cls:    Strategy的子类
+    :param param_grid:      参数网格，见expand_param_grid
+    :param symbol_list:     交易品种的代码
+    :param data_handler_cls:    用来加载数据的DataHandler子类，或者注册过的数据源的名字
+    :param start_datetime:  开始时间
+    :param end_datetime:    结束时间
+    :param data_handler_kwargs: 传给data_handler_cls的其他参数
+    :param portfolio_cls:   Portfolio的子类
+    :param execution_cls:   ExecutionHandler的子类
+    :param initial_capital: 初始资金
+    :param max_workers:     进程池的大小，默认是cpu的个数
+    :param progress:    progress(完成的个数, 总个数, 参数, 结果)，每完成一个参数组合调用一次
+    :param cancel_event:    一个threading.Event（或者有is_set()方法的对象），被设置之后不再提交新的任务，
+                            已经排队但还没有开始运行的任务也会被取消，已经完成的结果照常返回
+    :return:    每个参数组合一行的DataFrame，包含参数和统计信息
+    """
+    combos = expand_param_grid(param_grid)
+    data_handler_cls = resolve_data_handler(data_handler_cls)
+    data_handler = data_handler_cls(EventBus(), symbol_list, start_datetime, end_datetime,
+                                    **(data_handler_kwargs or {}))
+    shared = SharedBarStore(data_handler.bar_store)
+    del data_handler
+
+    max_workers = max_workers or os.cpu_count() or 1
+    rows = [None] * len(combos)
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            remaining = iter(enumerate(combos))
+
+            def submit_next():
+                for i, params in remaining:
+                    future = executor.submit(_run_one, shared.handle, strategy_cls, params, start_datetime,
+                                             portfolio_cls, execution_cls, initial_capital)
+                    pending[future] = i
+                    return
+
+            # 任务是逐步提交的，这样取消之后不会有大量已经排队的任务
+            for _ in range(2 * max_workers):
+                submit_next()
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = pending.pop(future)
+                    if future.cancelled():
+                        continue
+                    stats = future.result()
+                    row = dict(combos[i])
+                    row.update(stats)
+                    rows[i] = row
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(combos), combos[i], stats)
+                    if cancel_event is None or not cancel_event.is_set():
+                        submit_next()
+                    else:
+                        # 还没有开始运行的任务直接取消，已经在运行的照常完成
+                        for other in pending:
+                            other.cancel()
+    finally:
+        shared.close()
+    return pd.DataFrame([row for row in rows if row is not None])
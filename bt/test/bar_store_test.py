@@ -0,0 +1,73 @@
+import logging
+import queue
+
+import numpy as np
+import pandas as pd
+
+from bt.components.data_handler.bar_store import BarStore, align_symbol_arrays, frame_to_arrays
+from bt.components.data_handler.data import DataHandler
+
+
+def make_frame(index, close):
+    close = np.asarray(close, dtype=np.float64)
+    return pd.DataFrame({"open": close, "low": close - 0.5, "high": close + 0.5, "close": close,
+                         "vol": np.full(len(close), 100.0)}, index=pd.DatetimeIndex(index))
+
+
+class FrameDataHandler(DataHandler):
+    def __init__(self, events, frames):
+        self.frames = frames
+        super(FrameDataHandler, self).__init__(events, list(frames), None, None)
+
+    def get_data_from_external(self):
+        self.symbol_data.update(self.frames)
+
+
+def test_align_matches_pandas_reindex_pad():
+    a = make_frame(["2017-09-05 09:30", "2017-09-05 09:45", "2017-09-05 10:15"], [1.0, 2.0, 3.0])
+    b = make_frame(["2017-09-05 09:45", "2017-09-05 10:00"], [10.0, 11.0])
+    timestamps, fields = align_symbol_arrays(["a", "b"], {"a": frame_to_arrays(a), "b": frame_to_arrays(b)})
+    comb_index = a.index.union(b.index)
+    assert np.array_equal(timestamps, comb_index.values.astype("datetime64[ns]").view(np.int64))
+    for j, frame in enumerate([a, b]):
+        expected = frame.reindex(index=comb_index, method="pad")["close"].values
+        np.testing.assert_array_equal(fields["close"][:, j], expected)
+
+
+def test_cursor_and_zero_copy_views():
+    events = queue.Queue()
+    handler = FrameDataHandler(events, {"a": make_frame(pd.date_range("2017-09-05", periods=4, freq="15min"),
+                                                        [1.0, 2.0, 3.0, 4.0])})
+    assert len(handler.get_latest_bars("a").close) == 0
+    for _ in range(3):
+        handler.update_bars()
+    bars = handler.get_latest_bars("a", n=2)
+    np.testing.assert_array_equal(bars.close, [2.0, 3.0])
+    assert np.shares_memory(bars.close, handler.bar_store.fields["close"])
+    assert handler.get_latest_bar_value("a", "close") == 3.0
+    handler.update_bars()
+    assert handler.continue_backtest
+    handler.update_bars()
+    assert not handler.continue_backtest
+    assert events.qsize() == 5
+
+
+def test_append_grows_capacity():
+    store = BarStore(["a", "b"], capacity=1)
+    for t in range(5):
+        store.append(t, close=np.array([t, t * 2.0]))
+    assert store.capacity >= 5
+    while store.advance():
+        pass
+    np.testing.assert_array_equal(store.latest_bars("b", n=3).close, [4.0, 6.0, 8.0])
+    assert np.isnan(store.latest_bars("b").open[-1])
+
+
+def test_unknown_symbol_is_logged(caplog, capsys):
+    handler = FrameDataHandler(queue.Queue(), {"a": make_frame(pd.date_range("2017-09-05", periods=2, freq="15min"),
+                                                               [1.0, 2.0])})
+    handler.update_bars()
+    with caplog.at_level(logging.ERROR, logger="bt"):
+        assert handler.get_latest_bars("missing") is None
+    assert "missing" in caplog.text
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+
+from bt.benchmark.benchmark import compare, measure, run_benchmarks
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.event_loop.engine import EventBus
+
+START = "2017-09-05 09:30:00"
+
+
+def test_synthetic_data_is_seeded_and_consistent():
+    a = SyntheticDataHandler(EventBus(), ["a", "b"], START, n_bars=50, seed=1).bar_store
+    b = SyntheticDataHandler(EventBus(), ["a", "b"], START, n_bars=50, seed=1).bar_store
+    np.testing.assert_array_equal(a.fields["close"], b.fields["close"])
+    assert a.length == 50 and np.all(np.diff(a.timestamp) == 15 * 60 * 10 ** 9)
+    assert np.all(a.fields["low"] <= np.minimum(a.fields["open"], a.fields["close"]))
+    assert np.all(a.fields["high"] >= np.maximum(a.fields["open"], a.fields["close"]))
+
+
+def test_benchmarks_run_and_compare_flags_regressions():
+    current = run_benchmarks(sizes=[(3, 50)], repeat=2)
+    assert {r["name"] for r in current["results"]} == {"event_loop", "portfolio_update", "summary_stats",
+                                                              "matching"}
+    assert compare(current, current) == []
+    faster = {"results": [dict(r, bars_per_sec=r["bars_per_sec"] * 2) for r in current["results"]]}
+    regressions = compare(current, faster, threshold=0.1)
+    assert len(regressions) == 4 and all(r["metric"] == "bars_per_sec" for r in regressions)
+
+
+def test_measure_warms_up_and_takes_fastest_run():
+    durations = iter([0.05, 0.03, 0.0, 0.02, 0.0])
+    calls = []
+
+    def prepare():
+        duration = next(durations)
+
+        def run():
+            calls.append(duration)
+            time.sleep(duration)
+        return run
+
+    seconds, _ = measure(prepare, repeat=3)
+    # 第一次是预热，最后一次只测内存，计时的是中间3次中最快的一次
+    assert calls == [0.05, 0.03, 0.0, 0.02, 0.0]
+    assert seconds < 0.02
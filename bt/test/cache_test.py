@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from bt.components.data_handler.bar_store import BAR_FIELDS
+from bt.components.data_handler.cache import BarCache, BarCacheMissError, subtract_ranges, to_ns
+
+
+class FakeSource(object):
+    """
+    每15分钟一个bar，收盘价等于从2017-09-05开始的bar序号
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbol, start_datetime, end_datetime):
+        self.calls.append((start_datetime, end_datetime))
+        step = 15 * 60 * 10 ** 9
+        origin = to_ns("2017-09-05 00:00:00")
+        first = -(-(to_ns(start_datetime) - origin) // step)
+        last = (to_ns(end_datetime) - origin) // step
+        timestamps = origin + np.arange(first, last + 1, dtype=np.int64) * step
+        close = np.arange(first, last + 1, dtype=np.float64)
+        return timestamps, {f: close for f in BAR_FIELDS}
+
+
+def test_subtract_ranges():
+    assert subtract_ranges(0, 100, []) == [(0, 100)]
+    assert subtract_ranges(0, 100, [(10, 20), (50, 200)]) == [(0, 9), (21, 49)]
+    assert subtract_ranges(30, 40, [(10, 20), (50, 200)]) == [(30, 40)]
+    assert subtract_ranges(60, 70, [(10, 20), (50, 200)]) == []
+
+
+def test_incremental_gap_filling_and_offline(tmp_path):
+    cache = BarCache(str(tmp_path))
+    source = FakeSource()
+    timestamps, columns = cache.load("600348", "15min", "2017-09-05 09:30:00", "2017-09-05 15:00:00", fetch=source)
+    assert len(source.calls) == 1
+    assert columns["close"][0] == 38 and columns["close"][-1] == 60
+
+    timestamps, columns = cache.load("600348", "15min", "2017-09-05 09:00:00", "2017-09-06 10:00:00", fetch=source)
+    assert source.calls[1:] == [("2017-09-05 09:00:00", "2017-09-05 09:29:59"),
+                                ("2017-09-05 15:00:00", "2017-09-06 10:00:00")]
+    np.testing.assert_array_equal(columns["close"], np.arange(36, 137))
+    assert np.all(np.diff(timestamps) > 0)
+
+    timestamps, columns = cache.load("600348", "15min", "2017-09-05 12:00:00", "2017-09-06 09:00:00", offline=True)
+    assert columns["close"][0] == 48 and isinstance(columns["close"], np.memmap)
+    with pytest.raises(BarCacheMissError):
+        cache.load("600348", "15min", "2017-09-04 12:00:00", "2017-09-05 12:00:00", offline=True)
+    with pytest.raises(BarCacheMissError):
+        cache.load("600345", "15min", "2017-09-05 12:00:00", "2017-09-05 13:00:00", offline=True)
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from bt.components.data_handler.bar_store import BarStore, BAR_FIELDS
+from bt.components.data_handler.data import SyntheticDataHandler, BarStoreDataHandler, IterableDataHandler
+from bt.components.data_handler.merge import arrays_to_stream
+from bt.components.event.event import SignalEvent, EventType
+from bt.components.execution_handler.matching import MatchingExecutionHandler
+from bt.components.strategy.strategy import Strategy
+from bt.event_loop.checkpoint import Checkpointer
+from bt.event_loop.engine import BacktestEngine, EventBus
+
+START = "2017-09-05 09:30:00"
+SYMBOLS = ["a", "b", "c"]
+
+
+class AboveAverageStrategy(Strategy):
+    """
+    收盘价第一次高于移动平均时买入并持有；crash_at用来模拟回测中途崩溃
+    """
+
+    def __init__(self, data_handler, events, window=5, crash_at=None):
+        super(AboveAverageStrategy, self).__init__(data_handler, events)
+        self.sma = data_handler.add_indicator("sma", window=window)
+        self.crash_at = crash_at
+        self.bars = 0
+
+    def calculate_signals(self, event):
+        if not self.data_handler.continue_backtest:
+            return
+        self.bars += 1
+        if self.bars == self.crash_at:
+            raise RuntimeError("crash")
+        for s in self.symbol_list:
+            close = self.data_handler.get_latest_bar_value(s, "close")
+            if not self.bought[s] and close > self.sma.value(s):
+                self.events.put(SignalEvent(s, self.data_handler.get_latest_bar_datetime(), "LONG", 10))
+                self.bought[s] = True
+
+
+def full_store(n_bars=120):
+    return SyntheticDataHandler(EventBus(), SYMBOLS, START, n_bars=n_bars, seed=7).bar_store
+
+
+def prefix_store(store, n):
+    return BarStore.from_arrays(SYMBOLS, store.timestamp[:n], {f: store.fields[f][:n] for f in BAR_FIELDS})
+
+
+def make_engine(store, **kwargs):
+    return BacktestEngine(SYMBOLS, START, None, BarStoreDataHandler, AboveAverageStrategy,
+                          execution_cls=MatchingExecutionHandler, data_handler_kwargs={"bar_store": store},
+                          execution_kwargs={"participation": 0.0001}, **kwargs)
+
+
+def assert_same_result(expected, actual):
+    n = expected.portfolio.history.length
+    assert actual.portfolio.history.length == n
+    for name in ("datetime", "positions", "cash", "commission", "total"):
+        np.testing.assert_array_equal(getattr(actual.portfolio.history, name)[:n],
+                                      getattr(expected.portfolio.history, name)[:n])
+    assert actual.portfolio.current_positions == expected.portfolio.current_positions
+    assert actual.portfolio.tracker.max_drawdown == expected.portfolio.tracker.max_drawdown
+
+
+def test_extend_finished_backtest_with_new_bars(tmp_path):
+    store = full_store()
+    expected = make_engine(store)
+    expected.run()
+
+    path = str(tmp_path / "run.ckpt")
+    first = make_engine(prefix_store(store, 70))
+    first.run()
+    # 快照时还有没有成交完的订单
+    assert first.broker.orders
+    first.save_checkpoint(path)
+
+    resumed = make_engine(store)
+    resumed.restore_checkpoint(path)
+    assert resumed.data_handler.bar_store.cursor == 70
+    assert resumed.strategy.sma is resumed.data_handler.add_indicator("sma", window=5)
+    resumed.run()
+    assert_same_result(expected, resumed)
+
+
+def test_resume_after_crash(tmp_path):
+    store = full_store()
+    expected = make_engine(store)
+    expected.run()
+
+    path = str(tmp_path / "run.ckpt")
+    checkpointer = Checkpointer(path, every_bars=25)
+    crashed = make_engine(store, strategy_params={"crash_at": 60}, checkpointer=checkpointer)
+    with pytest.raises(RuntimeError):
+        crashed.run()
+    assert checkpointer.saved == 2
+
+    resumed = make_engine(store)
+    resumed.restore_checkpoint(path)
+    assert resumed.strategy.bars == 50 and resumed.strategy.crash_at == 60
+    resumed.strategy.crash_at = None
+    resumed.run()
+    assert_same_result(expected, resumed)
+
+
+def test_resume_streaming_handler(tmp_path):
+    store = full_store(60)
+
+    def streams(n):
+        return {s: arrays_to_stream(store.timestamp[:n], {f: store.fields[f][:n, j] for f in BAR_FIELDS})
+                for j, s in enumerate(SYMBOLS)}
+
+    def engine(n):
+        return BacktestEngine(SYMBOLS, START, None, IterableDataHandler, AboveAverageStrategy,
+                              data_handler_kwargs={"streams": streams(n), "max_history": 8})
+
+    expected = engine(60)
+    expected.run()
+    path = str(tmp_path / "run.ckpt")
+    first = engine(40)
+    first.run()
+    first.save_checkpoint(path)
+    resumed = engine(60)
+    resumed.restore_checkpoint(path)
+    np.testing.assert_array_equal(resumed.data_handler.get_latest_bars("b", n=8).close, store.fields["close"][32:40, 1])
+    resumed.run()
+    assert_same_result(expected, resumed)
+    with pytest.raises(ValueError):
+        BacktestEngine(SYMBOLS[:2], START, None, SyntheticDataHandler, AboveAverageStrategy).restore_checkpoint(path)
@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pytest
+
+from bt.components.data_handler.data import TushareDataHandler
+from bt.components.data_handler.download import Downloader, DownloadError, RateLimiter
+from bt.event_loop.engine import EventBus
+from bt.test.cache_test import FakeSource
+
+
+class FlakySource(FakeSource):
+    """
+    每个symbol的前failures[symbol]次请求失败，同时记录最大的并发数
+    """
+
+    def __init__(self, failures):
+        super(FlakySource, self).__init__()
+        self.failures = dict(failures)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, symbol, start_datetime, end_datetime):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            remaining = self.failures.get(symbol, 0)
+            self.failures[symbol] = remaining - 1
+        try:
+            if remaining > 0:
+                raise IOError("连接超时")
+            return super(FlakySource, self).__call__(symbol, start_datetime, end_datetime)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_retries_and_partial_failures():
+    source = FlakySource({"b": 2, "c": 10})
+    sleeps = []
+    downloader = Downloader(source, max_workers=3, retries=3, backoff=1.0, sleep=sleeps.append)
+    symbols = ["a", "b", "c", "d"]
+    report = downloader.download(symbols, "2017-09-05 09:30:00", "2017-09-05 15:00:00")
+    assert sorted(report.results) == ["a", "b", "d"]
+    assert list(report.failures) == ["c"] and isinstance(report.failures["c"], IOError)
+    assert report.attempts == {"a": 1, "b": 3, "c": 4, "d": 1}
+    assert source.max_active <= 3
+    assert len(sleeps) == 5 and max(sleeps) <= 4.0
+    assert report.results["a"][1]["close"][0] == 38
+
+
+def test_rate_limiter():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=10, burst=2, clock=clock, sleep=clock.sleep)
+    for _ in range(12):
+        limiter.acquire()
+    # 开始的2个请求不需要等待，之后每个请求间隔0.1秒
+    assert clock.now == pytest.approx(1.0)
+
+
+class FakeTushareDataHandler(TushareDataHandler):
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        super(FakeTushareDataHandler, self).__init__(*args, **kwargs)
+
+    def fetch_bars(self, symbol, start_datetime, end_datetime):
+        return self.source(symbol, start_datetime, end_datetime)
+
+
+def test_tushare_handler_downloads_concurrently(tmp_path):
+    symbols = ["600%03d" % i for i in range(20)]
+    start, end = "2017-09-05 09:30:00", "2017-09-05 15:00:00"
+    source = FlakySource({symbols[3]: 1, symbols[7]: 5})
+    with pytest.raises(DownloadError):
+        FakeTushareDataHandler(EventBus(), symbols, start, end, cache_dir=str(tmp_path), retries=0, source=source)
+
+    source = FlakySource({symbols[7]: 5})
+    handler = FakeTushareDataHandler(EventBus(), symbols, start, end, cache_dir=str(tmp_path), retries=0,
+                                     allow_partial=True, source=source)
+    assert handler.symbol_list == [s for s in symbols if s != symbols[7]]
+    assert list(handler.download_report.failures) == [symbols[7]]
+    # 第一次已经缓存的symbol不会再下载，只有第一次失败的symbols[3]需要下载
+    assert len(source.calls) == 1
+    handler.update_bars()
+    np.testing.assert_array_equal(handler.bar_store.latest_row("close"), np.full(19, 38.0))
@@ -0,0 +1,108 @@
+import queue
+
+import pytest
+
+from bt.components.event.event import EventType, MarketEvent
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine, EventBus
+from bt.test.vectorized_test import RandomDataHandler, START
+
+
+def test_event_bus_is_fifo():
+    bus = EventBus()
+    bus.put(1)
+    bus.put(2)
+    assert bus.qsize() == 2 and bus.get(False) == 1 and bus.get(False) == 2 and bus.empty()
+    # 和queue.Queue一样，空队列的get(False)抛出queue.Empty，原来的消费循环可以照常使用
+    with pytest.raises(queue.Empty):
+        bus.get(False)
+
+
+def test_multiple_handlers_per_event_type():
+    engine = BacktestEngine(["600345", "600348"], START, None, RandomDataHandler, BuyAndHoldStrategy)
+    seen = []
+    engine.register(EventType.ORDER, lambda event: seen.append(("first", event.symbol)), first=True)
+    engine.register(EventType.FILL, lambda event: seen.append(("fill", event.symbol)))
+    portfolio = engine.run()
+
+    assert seen == [("first", "600345"), ("first", "600348"), ("fill", "600345"), ("fill", "600348")]
+    # 默认的handler仍然被调用了：每个bar一个快照，再加上初始状态
+    assert len(portfolio.all_holdings) == engine.data_handler.bar_store.length + 1
+    assert portfolio.current_positions == {"600345": 1000, "600348": 1000}
+
+
+def test_dispatch_uses_handler_table():
+    engine = BacktestEngine(["600345"], START, None, RandomDataHandler, BuyAndHoldStrategy)
+    engine.handlers[EventType.MARKET] = []
+    calls = []
+    engine.register(EventType.MARKET, calls.append)
+    event = MarketEvent()
+    engine.dispatch(event)
+    assert calls == [event]
+
+
+def test_events_are_slotted_and_market_event_is_reused():
+    from bt.components.event.event import FillEvent
+    fill = FillEvent(0, "600348", "SH", 1000, "BUY", None)
+    assert not hasattr(fill, "__dict__") and fill.type_enum == EventType.FILL and fill.commission == 5
+    engine = BacktestEngine(["600345"], START, None, RandomDataHandler, BuyAndHoldStrategy)
+    engine.data_handler.update_bars()
+    engine.data_handler.update_bars()
+    assert engine.events[0] is engine.events[1] is engine.data_handler.market_event
+
+
+def test_instrumentation_records_handlers_events_and_trace(tmp_path):
+    import json
+    from bt.event_loop.instrument import Instrumentation
+    instrumentation = Instrumentation(trace=True)
+    engine = BacktestEngine(["600345", "600348"], START, None, RandomDataHandler, BuyAndHoldStrategy,
+                            instrumentation=instrumentation)
+    engine.run()
+    n_bars = engine.data_handler.bar_store.length
+
+    table = instrumentation.summary().set_index("handler")
+    assert table.loc["RandomDataHandler.update_bars", "calls"] == n_bars + 1
+    assert table.loc["BuyAndHoldStrategy.calculate_signals", "calls"] == n_bars + 1
+    assert table.loc["NaivePortfolio.update_from_fill", "calls"] == 2
+    assert abs(table["share"].sum() - 1.0) < 1e-9
+    events = instrumentation.event_summary()
+    assert events["MARKET"] == n_bars + 1 and events["SIGNAL"] == events["ORDER"] == events["FILL"] == 2
+    assert events["queue_depth_max"] >= 2
+
+    instrumentation.export_chrome_trace(str(tmp_path / "trace.json"))
+    with open(str(tmp_path / "trace.json")) as f:
+        trace = json.load(f)["traceEvents"]
+    assert len(trace) == sum(table["calls"]) and {"name", "ph", "ts", "dur"} <= set(trace[0])
+    instrumentation.export_collapsed(str(tmp_path / "stacks.txt"))
+    with open(str(tmp_path / "stacks.txt")) as f:
+        assert any(line.startswith("run;MARKET;BuyAndHoldStrategy.calculate_signals ") for line in f)
+
+
+def test_execution_handler_with_original_signature():
+    from bt.components.event.event import FillEvent
+    from bt.components.execution_handler.execution import ExecutionHandler
+
+    class LegacyExecutionHandler(ExecutionHandler):
+        def __init__(self, events):
+            self.events = events
+
+        def execute_order(self, event):
+            self.events.put(FillEvent(None, event.symbol, "SH", event.quantity, event.direction, None))
+
+    engine = BacktestEngine(["600345"], START, None, RandomDataHandler, BuyAndHoldStrategy,
+                            execution_cls=LegacyExecutionHandler)
+    assert engine.broker.data_handler is engine.data_handler
+    assert engine.run().current_positions == {"600345": 1000}
+
+
+def test_run_backtest_matches_engine():
+    from bt.event_loop.backtest import run_backtest
+    engine = BacktestEngine(["600345", "600348"], START, None, RandomDataHandler, BuyAndHoldStrategy)
+    expected = engine.run()
+    data_handler = RandomDataHandler(EventBus(), ["600345", "600348"], START, None)
+    portfolio = run_backtest(data_handler, BuyAndHoldStrategy, START, print_orders=True)
+    assert portfolio.current_positions == expected.current_positions
+    assert portfolio.current_holdings == expected.current_holdings
+
+    with pytest.raises(TypeError):
+        run_backtest(RandomDataHandler(queue.Queue(), ["600345"], START, None), BuyAndHoldStrategy, START)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from bt.components.data_handler.bar_store import BAR_FIELDS, align_symbol_arrays, to_timestamp_array
+from bt.components.data_handler.file_data import FileDataHandler, write_binary_bars, csv_chunks, build_csv_index
+from bt.components.data_handler.cache import to_ns
+from bt.event_loop.engine import EventBus
+
+
+def make_symbol_arrays(symbols, n=300, seed=0):
+    rng = np.random.RandomState(seed)
+    base = pd.date_range("2017-09-05 09:30:00", periods=2 * n, freq="15min")
+    data = {}
+    for s in symbols:
+        index = np.sort(rng.choice(len(base), n, replace=False))
+        timestamps = to_timestamp_array(base[index])
+        data[s] = (timestamps, {f: rng.rand(n) for f in BAR_FIELDS})
+    return data
+
+
+def write_csv(path, timestamps, columns):
+    frame = pd.DataFrame({f: columns[f] for f in BAR_FIELDS})
+    frame.insert(0, "datetime", pd.to_datetime(timestamps).strftime("%Y-%m-%d %H:%M:%S"))
+    frame.to_csv(path, index=False, float_format="%.17g")
+
+
+def run_handler(handler, symbols):
+    closes = []
+    while True:
+        handler.update_bars()
+        if not handler.continue_backtest:
+            break
+        closes.append([handler.get_latest_bar_value(s, "close") for s in symbols])
+    return np.array(closes)
+
+
+def expected_closes(symbols, data, start, end):
+    start_ns, end_ns = to_ns(start), to_ns(end)
+    clipped = {}
+    for s in symbols:
+        timestamps, columns = data[s]
+        keep = (timestamps >= start_ns) & (timestamps <= end_ns)
+        clipped[s] = (timestamps[keep], {f: columns[f][keep] for f in BAR_FIELDS})
+    _, aligned = align_symbol_arrays(symbols, clipped)
+    return aligned["close"]
+
+
+def test_file_handler_matches_alignment(tmp_path):
+    symbols = ["a", "b", "c"]
+    data = make_symbol_arrays(symbols)
+    for s in symbols:
+        write_binary_bars(str(tmp_path), s, *data[s])
+        write_csv(str(tmp_path / ("%s.csv" % s)), *data[s])
+    start, end = "2017-09-07 10:00:00", "2017-09-10 14:00:00"
+    expected = expected_closes(symbols, data, start, end)
+    for fmt in ("binary", "csv"):
+        handler = FileDataHandler(EventBus(), symbols, start, end, root=str(tmp_path), fmt=fmt, chunk_size=17,
+                                  max_history=8)
+        np.testing.assert_array_equal(run_handler(handler, symbols), expected)
+
+
+def test_csv_index_seeks_to_start(tmp_path):
+    data = make_symbol_arrays(["a"], n=1000, seed=3)
+    path = str(tmp_path / "a.csv")
+    write_csv(path, *data["a"])
+    start_ns = int(data["a"][0][700])
+    chunks = list(csv_chunks(path, start_ns, np.iinfo(np.int64).max, chunk_size=64, index_stride=100))
+    timestamps = np.concatenate([t for t, _ in chunks])
+    np.testing.assert_array_equal(timestamps, data["a"][0][700:])
+    # 从最近的索引位置（第700行）开始解析，第一块就是从start开始的
+    assert len(chunks[0][0]) == 64
+
+
+def test_csv_index_location(tmp_path):
+    data = make_symbol_arrays(["a"], n=200, seed=4)
+    root = tmp_path / "data"
+    root.mkdir()
+    path = str(root / "a.csv")
+    write_csv(path, *data["a"])
+    index = build_csv_index(path, stride=50, index_dir=str(tmp_path / "index"))
+    assert (tmp_path / "index" / "a.csv.idx.npy").exists()
+    assert not (root / "a.csv.idx.npy").exists()
+    # 索引写不进去时（比如只读的目录）只在内存中使用
+    (tmp_path / "file").write_text("")
+    np.testing.assert_array_equal(build_csv_index(path, stride=50, index_dir=str(tmp_path / "file" / "index")),
+                                  index)
+
+
+def test_abandoned_run_is_closed(tmp_path):
+    symbols = ["a", "b"]
+    data = make_symbol_arrays(symbols)
+    for s in symbols:
+        write_csv(str(tmp_path / ("%s.csv" % s)), *data[s])
+    with FileDataHandler(EventBus(), symbols, None, None, root=str(tmp_path), fmt="csv", chunk_size=16) as handler:
+        for _ in range(20):
+            handler.update_bars()
+        assert handler.continue_backtest
+        threads = list(handler.executor._threads)
+    # 中途放弃的回测也会结束预读线程
+    assert threads and not any(thread.is_alive() for thread in threads)
+    assert handler.prefetchers == []
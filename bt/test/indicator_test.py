@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.event_loop.engine import EventBus
+
+START = "2017-09-05 09:45:00"
+
+
+def run_to_end(data_handler, record):
+    history = {name: [] for name in record}
+    while True:
+        data_handler.update_bars()
+        if not data_handler.continue_backtest:
+            break
+        for name, indicator in record.items():
+            history[name].append(indicator.values.copy())
+    data_handler.events.clear()
+    return {name: np.array(values) for name, values in history.items()}
+
+
+def test_indicators_match_pandas():
+    data_handler = SyntheticDataHandler(EventBus(), ["a", "b"], START, n_bars=200, seed=2)
+    for _ in range(7):
+        data_handler.update_bars()
+    record = {
+        "sma": data_handler.add_indicator("sma", window=20),
+        "ema": data_handler.add_indicator("ema", window=10),
+        "var": data_handler.add_indicator("var", window=15),
+        "max": data_handler.add_indicator("max", window=12, field="high"),
+        "min": data_handler.add_indicator("min", window=12, field="low"),
+        "vwap": data_handler.add_indicator("vwap", window=5),
+    }
+    history = run_to_end(data_handler, record)
+    fields = data_handler.bar_store.fields
+    close = pd.DataFrame(fields["close"])
+    expected = {
+        "sma": close.rolling(20).mean(),
+        "ema": close.ewm(span=10, adjust=False).mean(),
+        "var": close.rolling(15).var(),
+        "max": pd.DataFrame(fields["high"]).rolling(12).max(),
+        "min": pd.DataFrame(fields["low"]).rolling(12).min(),
+    }
+    typical = (fields["high"] + fields["low"] + fields["close"]) / 3
+    pv = pd.DataFrame(typical * fields["vol"]).rolling(5, min_periods=1).sum()
+    expected["vwap"] = pv / pd.DataFrame(fields["vol"]).rolling(5, min_periods=1).sum()
+    for name, frame in expected.items():
+        np.testing.assert_allclose(history[name], frame.values[7:], rtol=1e-9, err_msg=name)
+
+
+def test_atr_and_shared_instances():
+    data_handler = SyntheticDataHandler(EventBus(), ["a"], START, n_bars=60, seed=3)
+    atr = data_handler.add_indicator("atr", window=14)
+    assert data_handler.add_indicator("atr", window=14) is atr
+    assert data_handler.add_indicator("atr", window=10) is not atr
+    # 默认参数写出来和不写，以及按位置给出，都是同一个实例
+    atr_default = data_handler.add_indicator("atr")
+    assert data_handler.add_indicator("atr", window=14) is atr_default is atr
+    sma = data_handler.add_indicator("sma", window=20)
+    assert data_handler.add_indicator("sma", window=20, field="close") is sma
+    assert data_handler.add_indicator("sma", window=20, field="high") is not sma
+    history = run_to_end(data_handler, {"atr": atr})
+    fields = data_handler.bar_store.fields
+    high, low, close = fields["high"][:, 0], fields["low"][:, 0], fields["close"][:, 0]
+    previous = np.concatenate([[np.nan], close[:-1]])
+    tr = np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+    expected = np.full(len(tr), np.nan)
+    expected[13] = tr[:14].mean()
+    for t in range(14, len(tr)):
+        expected[t] = (expected[t - 1] * 13 + tr[t]) / 14
+    np.testing.assert_allclose(history["atr"][:, 0], expected)
@@ -0,0 +1,55 @@
+import logging
+
+import numpy as np
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.event.event import OrderEvent
+from bt.components.logs import logger, enable_console_logging, disable_console_logging
+from bt.components.logs.journal import Journal, read_journal
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine
+from bt.test.vectorized_test import START
+
+SYMBOLS = ["600345", "600348"]
+
+
+def test_journal_round_trip(tmp_path):
+    engine = BacktestEngine(SYMBOLS, START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                            data_handler_kwargs={"n_bars": 300, "seed": 3})
+    path = str(tmp_path / "journal")
+    # buffer_size很小，保证中途有整块交给后台线程写出
+    with Journal(path, SYMBOLS, buffer_size=16).attach(engine):
+        portfolio = engine.run()
+
+    journal = read_journal(path)
+    assert len(journal["signal"]) == len(SYMBOLS)
+    assert len(journal["order"]) == len(SYMBOLS)
+    fills = journal["fill"]
+    assert sorted(fills["symbol"].tolist()) == [0, 1]
+    assert (fills["direction"] == 1).all()
+
+    holdings = journal["holdings"]
+    history = portfolio.history
+    n = history.length
+    # history的第一行是初始资金，之后每个bar一行
+    assert len(holdings) == n - 1
+    np.testing.assert_array_equal(holdings["time"], history.datetime[1:n])
+    np.testing.assert_array_equal(holdings["cash"], history.cash[1:n])
+    np.testing.assert_array_equal(holdings["total"], history.total[1:n])
+
+    frame = journal.frame("fill")
+    assert set(frame["symbol"]) == set(SYMBOLS)
+    assert frame["time"].dtype == np.dtype("datetime64[ns]")
+
+
+def test_logging_leaves_root_logger_alone(caplog):
+    root_level = logging.getLogger().level
+    enable_console_logging(logging.INFO)
+    try:
+        assert logging.getLogger().level == root_level
+        assert logger.level == logging.INFO
+    finally:
+        disable_console_logging()
+    with caplog.at_level(logging.INFO, logger="bt"):
+        OrderEvent("600345", 10, "BUY", "MKT").print_order()
+    assert "Symbol=600345" in caplog.text
@@ -0,0 +1,76 @@
+import numpy as np
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.execution_handler.matching import MatchingExecutionHandler, FixedSlippage, FixedLatency
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.components.event.event import EventType
+from bt.event_loop.engine import BacktestEngine, EventBus
+
+START = "2017-09-05 09:30:00"
+SYMBOLS = {"a": 0}
+
+
+def bar(open_, low, high, vol):
+    return np.array([open_]), np.array([low]), np.array([high]), np.array([vol])
+
+
+def fills(events):
+    result = [(e.quantity, e.direction, e.fill_cost) for e in events]
+    events.clear()
+    return result
+
+
+def test_price_time_priority_and_partial_fills():
+    events = EventBus()
+    broker = MatchingExecutionHandler(events, participation=0.5)
+    broker.submit("a", 300, "BUY", price=9.0, timestamp=0)
+    broker.submit("a", 200, "BUY", price=10.0, timestamp=0)
+    broker.submit("a", 100, "BUY", price=10.0, timestamp=0)
+    broker.submit("a", 100, "BUY", timestamp=0)
+    broker.submit("a", 50, "SELL", price=12.0, timestamp=0)
+    # 可成交500：市价单先成交，然后是价格高的一档，同一档内先到先成交
+    broker.match(1, SYMBOLS, *bar(9.5, 9.2, 11.0, 1000))
+    assert fills(events) == [(100, "BUY", 9.5), (200, "BUY", 9.5), (100, "BUY", 9.5)]
+    # 9.0的买单在最低价9.0时成交，价格是限价；卖单在最高价12.0时成交
+    broker.match(2, SYMBOLS, *bar(10.5, 9.0, 12.0, 400))
+    assert fills(events) == [(200, "BUY", 9.0), (50, "SELL", 12.0)]
+    broker.match(3, SYMBOLS, *bar(8.0, 7.0, 8.5, 1000))
+    assert fills(events) == [(100, "BUY", 8.0)]
+    assert broker.orders == {} and not broker.active
+
+
+def test_latency_slippage_and_cancel():
+    events = EventBus()
+    broker = MatchingExecutionHandler(events, slippage=FixedSlippage(bps=100), latency=FixedLatency(15),
+                                      participation=None)
+    buy = broker.submit("a", 100, "BUY", timestamp=0)
+    limit = broker.submit("a", 100, "SELL", price=10.0, timestamp=0)
+    broker.match(10, SYMBOLS, *bar(10.0, 9.0, 11.0, 1000))
+    assert fills(events) == []
+    broker.match(20, SYMBOLS, *bar(10.0, 9.0, 11.0, 1000))
+    # 市价买单有1%的滑点，限价卖单的滑点不能让价格低于限价
+    assert fills(events) == [(100, "BUY", 10.1), (100, "SELL", 10.0)]
+    assert broker.cancel(buy) == 0 and broker.cancel(limit) == 0
+    order = broker.submit("a", 100, "BUY", price=5.0, timestamp=20)
+    broker.match(40, SYMBOLS, *bar(10.0, 9.0, 11.0, 1000))
+    assert broker.cancel(order) == 100
+    broker.match(50, SYMBOLS, *bar(4.0, 4.0, 4.0, 1000))
+    assert fills(events) == []
+
+
+def test_engine_with_matching_broker():
+    engine = BacktestEngine(["a", "b"], START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                            execution_cls=MatchingExecutionHandler, data_handler_kwargs={"n_bars": 50, "seed": 2},
+                            execution_kwargs={"participation": 0.001})
+    received = []
+    engine.register(EventType.FILL, received.append)
+    portfolio = engine.run()
+    assert portfolio.current_positions == {"a": 1000, "b": 1000}
+    # 第一个bar上下的单从第二个bar开始按开盘价分多次成交，每个bar最多成交成交量的0.1%
+    store = engine.data_handler.bar_store
+    a_fills = [e for e in received if e.symbol == "a"]
+    assert len(a_fills) > 1 and a_fills[0].time_index == store.timestamp[1]
+    assert a_fills[0].quantity == int(store.fields["vol"][1, 0] * 0.001)
+    assert a_fills[0].fill_cost == store.fields["open"][1, 0]
+    cost = sum(e.quantity * e.fill_cost + e.commission for e in received)
+    np.testing.assert_allclose(portfolio.current_holdings["cash"], 100000.0 - cost)
@@ -0,0 +1,57 @@
+import numpy as np
+
+from bt.components.data_handler.bar_store import BarStore, BAR_FIELDS, align_symbol_arrays
+from bt.components.data_handler.data import IterableDataHandler
+from bt.components.data_handler.merge import arrays_to_stream, merge_bar_streams
+from bt.event_loop.engine import EventBus
+
+
+def random_symbol_arrays(symbols, seed=0):
+    rng = np.random.RandomState(seed)
+    data = {}
+    for s in symbols:
+        timestamps = np.unique(rng.randint(0, 200, rng.randint(1, 60))).astype(np.int64)
+        data[s] = (timestamps, {f: rng.rand(len(timestamps)) for f in BAR_FIELDS})
+    return data
+
+
+def test_merge_matches_full_alignment():
+    symbols = ["a", "b", "c", "d"]
+    data = random_symbol_arrays(symbols)
+    timestamps, aligned = align_symbol_arrays(symbols, data)
+    merged = [(t, {f: v.copy() for f, v in row.items()})
+              for t, row in merge_bar_streams(symbols, {s: arrays_to_stream(*data[s]) for s in symbols})]
+    np.testing.assert_array_equal([t for t, _ in merged], timestamps)
+    for f in BAR_FIELDS:
+        np.testing.assert_array_equal(np.array([row[f] for _, row in merged]), aligned[f])
+
+
+def test_streaming_handler_keeps_bounded_history():
+    symbols = ["a", "b", "c"]
+    data = random_symbol_arrays(symbols, seed=4)
+    timestamps, aligned = align_symbol_arrays(symbols, data)
+    handler = IterableDataHandler(EventBus(), symbols, streams={s: arrays_to_stream(*data[s]) for s in symbols},
+                                  max_history=8)
+    held = None
+    while True:
+        handler.update_bars()
+        if not handler.continue_backtest:
+            break
+        bars = handler.get_latest_bars("b", n=8)
+        if held is None and len(bars.close) == 8:
+            held = (bars.close, bars.close.copy())
+        assert handler.bar_store.capacity == 16
+    bars = handler.get_latest_bars("c", n=8)
+    np.testing.assert_array_equal(bars.close, aligned["close"][-8:, 2])
+    np.testing.assert_array_equal(bars.datetime, timestamps[-8:])
+    # 之前返回的视图在搬移数据之后仍然有效
+    np.testing.assert_array_equal(*held)
+
+
+def test_bar_store_compaction():
+    store = BarStore(["a"], capacity=4, max_history=2)
+    for t in range(10):
+        store.append(t, close=np.array([float(t)]))
+        store.advance()
+        np.testing.assert_array_equal(store.latest_bars("a", n=2).close, [max(t - 1, 0), t][-min(t + 1, 2):])
+    assert store.capacity == 4
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from bt.components.performance import metrics
+from bt.components.performance.performance import create_drawdowns
+
+
+def loop_drawdowns(equity_curve: pd.Series):
+    """
+    原来逐个元素计算的实现，用来对比
+    """
+    hwm = [0]
+    drawdown = pd.Series(index=equity_curve.index, dtype=np.float64)
+    duration = pd.Series(index=equity_curve.index, dtype=np.float64)
+    for i in range(1, len(equity_curve)):
+        hwm.append(max(hwm[i - 1], equity_curve.values[i]))
+        drawdown.iloc[i] = hwm[i] - equity_curve.values[i]
+        duration.iloc[i] = 0 if drawdown.iloc[i] == 0 else duration.iloc[i - 1] + 1
+    return drawdown.max(), duration.max()
+
+
+def random_equity(runs, n, seed=3):
+    rng = np.random.RandomState(seed)
+    return np.cumprod(1.0 + rng.normal(0.0002, 0.01, (runs, n)), axis=1)
+
+
+def test_vectorized_drawdowns_match_loop():
+    for seed in range(5):
+        curve = pd.Series(random_equity(1, 300, seed)[0], index=pd.date_range("2017-09-05", periods=300, freq="15min"))
+        curve.iloc[0] = np.nan
+        assert create_drawdowns(curve) == loop_drawdowns(curve)
+    curve = pd.Series([np.nan, 1.0, 0.9, np.nan, 1.2, 1.1])
+    np.testing.assert_allclose(create_drawdowns(curve), loop_drawdowns(curve))
+
+
+def test_batch_metrics_match_single_curve_formulas():
+    equity = random_equity(4, 500)
+    returns = metrics.returns_from_equity(equity)
+    for k in range(4):
+        r = equity[k, 1:] / equity[k, :-1] - 1
+        assert np.isclose(metrics.sharpe_ratio(returns, periods=252)[k], np.sqrt(252) * r.mean() / r.std())
+        downside = np.sqrt(np.mean(np.minimum(r, 0) ** 2))
+        assert np.isclose(metrics.sortino_ratio(returns, periods=252)[k], np.sqrt(252) * r.mean() / downside)
+        curve = pd.Series(np.concatenate([[np.nan], equity[k]]))
+        max_dd, duration = metrics.max_drawdowns(equity)
+        assert np.isclose(max_dd[k], create_drawdowns(curve)[0]) and duration[k] == create_drawdowns(curve)[1]
+        rolling = pd.Series(returns[k]).rolling(20).std(ddof=0).values * np.sqrt(252)
+        np.testing.assert_allclose(metrics.rolling_volatility(returns, 20, periods=252)[k], rolling)
+
+
+def test_drawdown_episodes_and_turnover():
+    equity = np.array([[1.0, 1.2, 1.0, 0.9, 1.3, 1.1],
+                       [1.0, 0.8, 0.9, 1.0, 1.0, 1.0]])
+    episodes = metrics.drawdown_episodes(equity)
+    assert episodes[["run", "start", "trough", "end"]].values.tolist() == [[0, 2, 3, 4], [0, 5, 5, 6], [1, 1, 1, 3]]
+    np.testing.assert_allclose(episodes["depth"], [0.3, 0.2, 0.2])
+    assert episodes["recovered"].tolist() == [True, False, True]
+
+    positions = np.array([[[0], [10], [10], [0]]], dtype=np.float64)
+    prices = np.full((4, 1), 2.0)
+    total = np.full((1, 4), 100.0)
+    np.testing.assert_allclose(metrics.turnover(positions, prices, total, periods=4), [0.4])
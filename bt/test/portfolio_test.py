@@ -0,0 +1,54 @@
+import numpy as np
+
+from bt.components.portfolio.history import PortfolioHistory
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine
+from bt.test.vectorized_test import RandomDataHandler, START
+
+
+def test_history_grows_and_equity_curve_shares_memory():
+    history = PortfolioHistory(["a", "b"], capacity=2)
+    for t in range(5):
+        history.append(t, [t, 0], [t * 10.0, 0.0], 100.0 - t, float(t), 100.0 + 9 * t)
+    assert history.capacity >= 5 and history.length == 5
+    curve = history.create_equity_curve_dataframe()
+    assert list(curve.columns) == ["a", "b", "cash", "commission", "total", "returns", "equity_curve"]
+    assert np.shares_memory(curve["a"].values, history.holdings)
+    np.testing.assert_array_equal(curve["total"].values, 100.0 + 9 * np.arange(5))
+
+
+def test_all_holdings_records_keep_old_dict_format():
+    engine = BacktestEngine(["600345", "600348"], START, None, RandomDataHandler, BuyAndHoldStrategy)
+    portfolio = engine.run()
+    first = portfolio.all_holdings[0]
+    assert first["cash"] == first["total"] == 100000.0 and first["600345"] == 0.0
+    last = portfolio.all_positions[-1]
+    assert last["600345"] == last["600348"] == 1000
+    assert len(list(portfolio.all_holdings)) == portfolio.history.length
+
+
+def test_streaming_tracker_matches_full_history_stats():
+    engine = BacktestEngine(["600345", "600348"], START, None, RandomDataHandler, BuyAndHoldStrategy)
+    portfolio = engine.run()
+    tracker = portfolio.tracker
+    curve = portfolio.create_equity_curve_dataframe()
+    returns = curve["returns"].values[1:-1]
+    assert np.isclose(tracker.mean, returns.mean()) and np.isclose(tracker.variance, returns.var())
+    assert tracker.summary_stats() == portfolio.output_summary_stats()
+
+    engine = BacktestEngine(["600345", "600348"], START, None, RandomDataHandler, BuyAndHoldStrategy,
+                            portfolio_kwargs={"store_history": False})
+    streaming = engine.run()
+    assert streaming.history.length == 1
+    assert streaming.output_summary_stats() == portfolio.output_summary_stats()
+
+
+def test_sparse_valuation_matches_dense():
+    symbols = ["6003%02d" % i for i in range(20)]
+    dense = BacktestEngine(symbols, START, None, RandomDataHandler, BuyAndHoldStrategy).run()
+    sparse = BacktestEngine(symbols, START, None, RandomDataHandler, BuyAndHoldStrategy,
+                            portfolio_kwargs={"sparse_valuation": True}).run()
+    np.testing.assert_allclose(sparse.history.total[:sparse.history.length],
+                               dense.history.total[:dense.history.length])
+    np.testing.assert_array_equal(sparse.history.holdings, dense.history.holdings)
+    assert list(sparse.held_index) == list(range(20))
@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+import pytest
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.data_handler.registry import register_data_source, get_data_source, data_source_names
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine
+from bt.test.vectorized_test import START
+
+
+def test_worker_imports_skip_pandas_and_tushare():
+    # 在新的进程中检查，当前进程里其他测试早就import了pandas
+    code = ("import sys\n"
+            "import bt.research.sweep, bt.event_loop.engine, bt.components.data_handler.registry\n"
+            "print(','.join(m for m in ('pandas', 'tushare') if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ""
+
+
+def test_registry_resolves_names():
+    assert get_data_source("synthetic") is SyntheticDataHandler
+    assert {"tushare", "file", "synthetic"} <= set(data_source_names())
+    register_data_source("my_synthetic", "bt.components.data_handler.data:SyntheticDataHandler")
+    engine = BacktestEngine(["600345"], START, None, "my_synthetic", BuyAndHoldStrategy,
+                            data_handler_kwargs={"n_bars": 50})
+    assert isinstance(engine.data_handler, SyntheticDataHandler)
+    engine.run()
+    with pytest.raises(KeyError):
+        get_data_source("no_such_source")
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from bt.components.data_handler.data import IterableDataHandler, SyntheticDataHandler
+from bt.components.data_handler.merge import arrays_to_stream
+from bt.event_loop.engine import EventBus
+
+START = "2017-09-05 09:45:00"
+
+
+def run_to_end(data_handler):
+    while data_handler.continue_backtest:
+        data_handler.update_bars()
+    data_handler.events.clear()
+
+
+def expected_resample(data_handler, rule, offset):
+    store = data_handler.bar_store
+    index = pd.DatetimeIndex(store.timestamp.view("datetime64[ns]"))
+    frame = pd.DataFrame({f: store.fields[f][:, 0] for f in store.fields}, index=index)
+    frame["ts"] = index
+    grouped = frame.resample(rule, closed="right", label="right", offset=offset)
+    return grouped.agg({"open": "first", "high": "max", "low": "min", "close": "last", "vol": "sum", "ts": "last"})
+
+
+def test_time_grid_matches_pandas_resample():
+    data_handler = SyntheticDataHandler(EventBus(), ["600348"], START, n_bars=37, seed=5)
+    data_handler.add_timeframe("60min", minutes=60, offset_minutes=30)
+    run_to_end(data_handler)
+    expected = expected_resample(data_handler, "60min", "30min")
+    bars = data_handler.get_latest_bars("600348", n=100, timeframe="60min")
+    assert len(bars.close) == len(expected)
+    for f in ["open", "high", "low", "close", "vol"]:
+        np.testing.assert_allclose(getattr(bars, f), expected[f].values)
+    np.testing.assert_array_equal(bars.datetime, expected["ts"].values.astype("datetime64[ns]").view(np.int64))
+
+
+def test_bar_count_mode_and_late_registration():
+    data_handler = SyntheticDataHandler(EventBus(), ["a", "b"], START, n_bars=10, seed=1)
+    for _ in range(6):
+        data_handler.update_bars()
+    data_handler.add_timeframe("60min", bars=4)
+    bars = data_handler.get_latest_bars("b", n=5, timeframe="60min")
+    assert len(bars.close) == 2
+    closes = data_handler.bar_store.fields["close"][:, 1]
+    assert bars.close[-1] == closes[5] and bars.close[0] == closes[3]
+    run_to_end(data_handler)
+    bars = data_handler.get_latest_bars("b", n=5, timeframe="60min")
+    np.testing.assert_array_equal(bars.close, closes[[3, 7, 9]])
+    np.testing.assert_allclose(bars.vol[1], data_handler.bar_store.fields["vol"][4:8, 1].sum())
+    assert bars.high[0] == data_handler.bar_store.fields["high"][:4, 1].max()
+
+
+def test_padded_bars_do_not_repeat_volume():
+    step = 15 * 60 * 10 ** 9
+    start = np.datetime64("2017-09-05 09:45:00", "ns").view(np.int64)
+    timestamps = start + np.arange(8) * step
+    columns = {f: np.arange(1.0, 9.0) for f in ("open", "low", "high", "close", "vol")}
+    # b在第3个bar之后停牌，之后的bar都是用最后一个bar填充的
+    streams = {"a": arrays_to_stream(timestamps, columns),
+               "b": arrays_to_stream(timestamps[:3], {f: v[:3] for f, v in columns.items()})}
+    data_handler = IterableDataHandler(EventBus(), ["a", "b"], streams=streams)
+    data_handler.add_timeframe("60min", bars=4)
+    run_to_end(data_handler)
+    bars = data_handler.get_latest_bars("b", n=2, timeframe="60min")
+    np.testing.assert_array_equal(bars.vol, [6.0, 0.0])
+    np.testing.assert_array_equal(bars.close, [3.0, 3.0])
+    np.testing.assert_array_equal(data_handler.get_latest_bars("a", n=2, timeframe="60min").vol, [10.0, 26.0])
@@ -0,0 +1,101 @@
+import pandas as pd
+import pytest
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.execution_handler.matching import FixedLatency, FixedSlippage, MatchingExecutionHandler
+from bt.components.portfolio.portfolio import NaivePortfolio
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.research.cache import ResultCache, run_backtest_cached, run_key
+from bt.test.vectorized_test import START
+
+SYMBOLS = ["600345", "600348"]
+
+
+def run(cache, seed=0, **kwargs):
+    return run_backtest_cached(cache, SYMBOLS, START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                               data_handler_kwargs={"n_bars": 200, "seed": seed}, **kwargs)
+
+
+def test_hits_and_invalidation(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    first = run(cache, strategy_params={"strength": 5})
+    assert not first.hit
+    second = run(cache, strategy_params={"strength": 5})
+    assert second.hit and second.key == first.key
+    assert second.stats == first.stats
+    pd.testing.assert_frame_equal(second.equity_curve, first.equity_curve)
+
+    # 参数、数据、资金的任何变化都会得到新的键
+    keys = {first.key,
+            run(cache, strategy_params={"strength": 6}).key,
+            run(cache, seed=1, strategy_params={"strength": 5}).key,
+            run(cache, strategy_params={"strength": 5}, initial_capital=200000.0).key}
+    assert len(keys) == 4
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    first = run(cache, strategy_params={"strength": 1})
+    entry_size = cache.size()
+    cache.max_bytes = int(entry_size * 2.5)
+    second = run(cache, strategy_params={"strength": 2})
+    # 再读一次first，second就变成了最久没有用过的
+    assert run(cache, strategy_params={"strength": 1}).hit
+    run(cache, strategy_params={"strength": 3})
+    assert cache.get(second.key) is None
+    assert cache.get(first.key) is not None
+    assert cache.size() <= cache.max_bytes
+
+
+class CountingDataHandler(SyntheticDataHandler):
+    loads = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingDataHandler.loads += 1
+        super().__init__(*args, **kwargs)
+
+
+def test_data_key_hit_skips_loading(tmp_path):
+    cache = ResultCache(str(tmp_path))
+
+    def run_v1(end_datetime=None, n_bars=200):
+        return run_backtest_cached(cache, SYMBOLS, START, end_datetime, CountingDataHandler, BuyAndHoldStrategy,
+                                   data_handler_kwargs={"n_bars": n_bars, "seed": 0},
+                                   strategy_params={"strength": 5}, data_key="v1")
+
+    first = run_v1()
+    assert not first.hit
+    loads = CountingDataHandler.loads
+    second = run_v1()
+    assert second.hit and second.key == first.key
+    assert CountingDataHandler.loads == loads
+
+    # data_key相同，但是结束时间、data handler的参数或者类不同时不能命中
+    assert not run_v1(end_datetime="2018-01-01").hit
+    assert not run_v1(n_bars=100).hit
+    other = run_backtest_cached(cache, SYMBOLS, START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                                data_handler_kwargs={"n_bars": 200, "seed": 0},
+                                strategy_params={"strength": 5}, data_key="v1")
+    assert not other.hit
+
+
+def test_key_of_model_objects_is_stable():
+    def key(slippage, latency):
+        return run_key("v1", BuyAndHoldStrategy, None, NaivePortfolio, None, MatchingExecutionHandler,
+                       {"slippage": slippage, "latency": latency}, 100000.0, START)
+
+    # 不同的对象、相同的内容得到相同的键，内容不同时键也不同
+    assert key(FixedSlippage(5), FixedLatency(100)) == key(FixedSlippage(5), FixedLatency(100))
+    assert key(FixedSlippage(5), FixedLatency(100)) != key(FixedSlippage(6), FixedLatency(100))
+    assert key(FixedSlippage(5), FixedLatency(100)) != key(FixedSlippage(5), FixedLatency(200))
+    with pytest.raises(TypeError):
+        key(lambda price, quantity: price, FixedLatency(100))
+
+
+def test_matching_execution_hits_cache(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    first = run(cache, execution_cls=MatchingExecutionHandler,
+                execution_kwargs={"slippage": FixedSlippage(5), "latency": FixedLatency(100)})
+    second = run(cache, execution_cls=MatchingExecutionHandler,
+                 execution_kwargs={"slippage": FixedSlippage(5), "latency": FixedLatency(100)})
+    assert not first.hit and second.hit
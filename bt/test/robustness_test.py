@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.performance import metrics
+from bt.components.performance.robustness import SEED_BLOCK, resample, block_bootstrap, resample_stats
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine
+from bt.test.vectorized_test import START
+
+
+def equity_returns():
+    engine = BacktestEngine(["600345", "600348"], START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                            data_handler_kwargs={"n_bars": 400, "seed": 5})
+    return engine.run().create_equity_curve_dataframe()["returns"]
+
+
+def test_block_bootstrap_takes_contiguous_blocks():
+    returns = np.arange(10, dtype=np.float64)
+    samples = block_bootstrap(returns, 50, 4, np.random.default_rng(0))
+    assert samples.shape == (50, 10)
+    # 块内是连续的期，超过末尾时从头接上
+    blocks = samples[:, :8].reshape(50, 2, 4)
+    assert ((np.diff(blocks, axis=2) % 10) == 1).all()
+
+
+def test_resample_stats_match_metrics():
+    samples = np.random.default_rng(1).normal(0.0005, 0.01, (20, 300))
+    stats = resample_stats(samples)
+    equity = np.cumprod(1.0 + samples, axis=1)
+    max_drawdown, duration = metrics.max_drawdowns(equity)
+    np.testing.assert_array_equal(stats["sharp ratio"], metrics.sharpe_ratio(samples))
+    np.testing.assert_array_equal(stats["max drawdown"], max_drawdown)
+    np.testing.assert_array_equal(stats["drawdown duration"], duration)
+
+
+def test_resample_is_reproducible_and_chunk_independent():
+    returns = equity_returns()
+    first = resample(returns, n_samples=300, seed=7, chunk_elements=4000)
+    # 分块的大小（每块1组、3组、全部）和进程数都不影响结果
+    for again in (resample(returns, n_samples=300, seed=7, chunk_elements=4000, processes=2),
+                  resample(returns, n_samples=300, seed=7, chunk_elements=len(returns) * SEED_BLOCK * 3),
+                  resample(returns, n_samples=300, seed=7, chunk_elements=1 << 30)):
+        for name in first.samples:
+            assert len(again.samples[name]) == 300
+            np.testing.assert_array_equal(first.samples[name], again.samples[name])
+
+    lower, upper = first.confidence_intervals(0.9)["max drawdown"]
+    assert lower <= np.median(first.samples["max drawdown"]) <= upper
+    summary = first.summary()
+    assert list(summary.columns) == ["actual", "mean", "lower", "upper"]
+
+    # 打乱顺序不改变夏普比率，只改变回撤
+    shuffled = resample(returns, n_samples=100, method="shuffle", seed=7)
+    np.testing.assert_allclose(shuffled.samples["sharp ratio"], shuffled.actual["sharp ratio"])
+    assert np.ptp(shuffled.samples["max drawdown"]) > 0
+
+    with pytest.raises(ValueError):
+        resample(returns, method="jackknife")
+
+
+def test_chunks_bound_memory_for_long_series(monkeypatch):
+    from bt.components.performance import robustness
+    returns = np.random.default_rng(2).normal(0.0002, 0.01, 2000)
+    chunk_elements = 2000 * SEED_BLOCK // 8   # 比一组重采样少，每块只有8行
+    for method in ("block", "shuffle"):
+        expected = resample(returns, n_samples=150, method=method, seed=3, chunk_elements=1 << 30)
+        shapes = []
+        original = robustness.resample_stats
+
+        def recording(samples, *args, **kwargs):
+            shapes.append(samples.shape)
+            return original(samples, *args, **kwargs)
+
+        monkeypatch.setattr(robustness, "resample_stats", recording)
+        result = resample(returns, n_samples=150, method=method, seed=3, chunk_elements=chunk_elements)
+        monkeypatch.setattr(robustness, "resample_stats", original)
+        assert max(rows * n for rows, n in shapes) <= chunk_elements
+        for name in expected.samples:
+            np.testing.assert_array_equal(result.samples[name], expected.samples[name])
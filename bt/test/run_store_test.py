@@ -0,0 +1,76 @@
+import numpy as np
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.performance.performance import create_numeric_summary_stats
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine
+from bt.research.store import RunStore
+from bt.test.vectorized_test import START
+
+SYMBOLS = ["600345", "600348", "600350"]
+
+
+def run(strength, seed):
+    engine = BacktestEngine(SYMBOLS, START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                            data_handler_kwargs={"n_bars": 200, "seed": seed}, strategy_params={"strength": strength})
+    return engine.run()
+
+
+def test_store_and_query(tmp_path):
+    store = RunStore(str(tmp_path))
+    portfolios = {}
+    for strength in (1, 5, 10):
+        for seed in (0, 1):
+            portfolio = run(strength, seed)
+            run_id = store.add_run(portfolio, params={"strength": strength, "seed": seed})
+            portfolios[run_id] = portfolio
+
+    # 重新打开，所有数据都来自磁盘
+    store = RunStore(str(tmp_path))
+    assert len(store) == 6
+    returns = {run_id: create_numeric_summary_stats(p.create_equity_curve_dataframe())["total return"]
+               for run_id, p in portfolios.items()}
+    best = sorted(returns, key=returns.get, reverse=True)[:2]
+    assert list(store.top_k("total return", 2)) == best
+    assert list(store.top_k("total return", 1, largest=False)) == [min(returns, key=returns.get)]
+
+    assert store.select(strength=5) == [2, 3]
+    assert store.select(strength=[1, 10], seed=1) == [1, 5]
+
+    history = portfolios[3].history
+    n = history.length
+    curve = store.curve(3, columns=("total",))
+    assert list(curve) == ["total"]
+    np.testing.assert_array_equal(curve["total"], history.total[:n])
+    np.testing.assert_array_equal(store.positions(3), history.positions[:n])
+    assert store.curves(store.select(seed=0)).shape == (3, n)
+
+    # BuyAndHold在每个symbol上只买入一次
+    trades = store.trades(3)
+    assert sorted(trades["symbol"].tolist()) == [0, 1, 2]
+    assert (trades["quantity"] == 500).all()
+
+    frame = store.frame()
+    assert frame.loc[3, "strength"] == 5
+    assert frame["sharp ratio"].dtype == np.float64
+
+
+def test_interrupted_write_is_discarded(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.add_run(run(1, 0))
+    # 模拟写到一半中断：只有datetime列多了10行，index中没有这次回测
+    with open(tmp_path / "curve" / "datetime.bin", "ab") as f:
+        np.arange(10, dtype=np.int64).tofile(f)
+    with open(tmp_path / "stats" / "sharp_ratio.f8", "ab") as f:
+        np.zeros(1).tofile(f)
+
+    store = RunStore(str(tmp_path))
+    portfolio = run(5, 1)
+    run_id = store.add_run(portfolio)
+    history = portfolio.history
+    n = history.length
+    curve = store.curve(run_id)
+    for name in ("datetime", "total"):
+        np.testing.assert_array_equal(curve[name], getattr(history, name)[:n])
+    np.testing.assert_array_equal(store.positions(run_id), history.positions[:n])
+    assert len(store.stats()["sharp ratio"]) == 2
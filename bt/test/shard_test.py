@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from bt.components.data_handler.data import SyntheticDataHandler
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine
+from bt.event_loop.shard import run_sharded, split_symbols
+from bt.test.vectorized_test import START
+
+SYMBOLS = ["s%02d" % i for i in range(7)]
+DATA = {"n_bars": 300, "seed": 11}
+
+
+def run(**kwargs):
+    return run_sharded(BuyAndHoldStrategy, SYMBOLS, SyntheticDataHandler, START, None, data_handler_kwargs=DATA,
+                       **kwargs)
+
+
+def test_split_symbols():
+    assert split_symbols(SYMBOLS, 3) == [SYMBOLS[:2], SYMBOLS[2:4], SYMBOLS[4:]]
+    assert len(split_symbols(SYMBOLS, 20)) == len(SYMBOLS)
+
+
+def test_sharded_run_matches_single_process():
+    engine = BacktestEngine(SYMBOLS, START, None, SyntheticDataHandler, BuyAndHoldStrategy,
+                            data_handler_kwargs=DATA)
+    engine.run()
+    history = engine.portfolio.history
+    n = history.length
+
+    local = run(n_shards=3, processes=0, batch_bars=64)
+    np.testing.assert_array_equal(local.datetime, history.datetime[:n])
+    for name in ("cash", "commission", "total"):
+        np.testing.assert_allclose(getattr(local, name), getattr(history, name)[:n], rtol=1e-12)
+    assert local.positions == engine.portfolio.current_positions
+
+    # 分到多个进程中结果完全相同
+    parallel = run(n_shards=3, processes=2, batch_bars=64)
+    np.testing.assert_array_equal(parallel.total, local.total)
+    assert parallel.output_summary_stats() == local.output_summary_stats()
+
+
+def test_capital_limit():
+    unlimited = run(n_shards=3, processes=0, strategy_params={"strength": 20})
+    assert unlimited.cash[-1] < 0 and unlimited.rejected == 0
+
+    limited = run(n_shards=3, processes=0, strategy_params={"strength": 20}, max_leverage=1.0)
+    assert limited.rejected > 0
+    assert limited.cash[-1] >= 0
+
+
+class CrashingStrategy(BuyAndHoldStrategy):
+    """
+    模拟worker进程被kill：第一次收到行情时直接退出进程
+    """
+
+    def calculate_signals(self, event):
+        os._exit(3)
+
+
+def test_dead_worker_raises():
+    with pytest.raises(RuntimeError, match="exitcode 3"):
+        run_sharded(CrashingStrategy, SYMBOLS, SyntheticDataHandler, START, None, data_handler_kwargs=DATA,
+                    n_shards=2, processes=2)
+
+
+class PartialDataHandler(SyntheticDataHandler):
+    """
+    模拟allow_partial=True时下载失败的symbol被去掉
+    """
+
+    def __init__(self, events, symbol_list, *args, **kwargs):
+        super().__init__(events, [s for s in symbol_list if s != "missing"], *args, **kwargs)
+
+
+def test_dropped_symbols_are_not_sharded():
+    expected = run(n_shards=3, processes=0)
+    result = run_sharded(BuyAndHoldStrategy, SYMBOLS + ["missing"], PartialDataHandler, START, None,
+                         data_handler_kwargs=DATA, n_shards=3, processes=0)
+    # 资金只分给实际加载的symbol，和没有这个symbol时完全相同
+    np.testing.assert_array_equal(result.total, expected.total)
+    assert result.positions == expected.positions
@@ -0,0 +1,30 @@
+import threading
+
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.research.sweep import expand_param_grid, run_sweep
+from bt.test.vectorized_test import RandomDataHandler, START
+
+
+def test_expand_param_grid():
+    assert expand_param_grid({"a": [1, 2], "b": ["x"]}) == [{"a": 1, "b": "x"}, {"a": 2, "b": "x"}]
+    assert expand_param_grid([{"a": 1}]) == [{"a": 1}]
+
+
+def test_sweep_collects_stats_and_reports_progress():
+    seen = []
+    results = run_sweep(BuyAndHoldStrategy, {"strength": [1, 5, 10, 20]}, ["600345", "600348"],
+                        RandomDataHandler, START, None, max_workers=2,
+                        progress=lambda done, total, params, stats: seen.append((done, total)))
+    assert list(results["strength"]) == [1, 5, 10, 20]
+    assert "sharp ratio" in results.columns
+    assert sorted(seen) == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    # strength越大持仓越多，收益的绝对值也越大
+    assert results["total return"].nunique() == 4
+
+
+def test_sweep_cancellation_keeps_finished_runs():
+    cancel = threading.Event()
+    results = run_sweep(BuyAndHoldStrategy, {"strength": list(range(1, 21))}, ["600345"], RandomDataHandler,
+                        START, None, max_workers=1, progress=lambda *args: cancel.set(), cancel_event=cancel)
+    # 取消时已经在运行的任务照常完成，排队的任务被取消
+    assert 1 <= len(results) <= 2
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from bt.components.data_handler.data import DataHandler
+from bt.components.strategy.strategy import BuyAndHoldStrategy
+from bt.event_loop.engine import BacktestEngine
+from bt.event_loop.vectorized import (VectorizedBuyAndHoldStrategy, calculate_commissions, positions_from_signals,
+                                      run_vectorized_backtest)
+
+START = "2017-09-05 09:30:00"
+
+
+class RandomDataHandler(DataHandler):
+    def get_data_from_external(self):
+        rng = np.random.RandomState(7)
+        index = pd.date_range(self.start_datetime, periods=200, freq="15min")
+        for s in self.symbol_list:
+            close = 10 + np.cumsum(rng.normal(0, 0.1, len(index)))
+            self.symbol_data[s] = pd.DataFrame({"open": close, "low": close, "high": close, "close": close,
+                                                "vol": np.full(len(index), 1e5)}, index=index)
+
+
+def test_matches_event_engine_on_buy_and_hold():
+    engine = BacktestEngine(["600345", "600348", "600724"], START, None, RandomDataHandler, BuyAndHoldStrategy)
+    expected = engine.run().create_equity_curve_dataframe()
+    data_handler = engine.data_handler
+
+    strategy = VectorizedBuyAndHoldStrategy(data_handler.symbol_list)
+    result = run_vectorized_backtest(data_handler.bar_store, strategy, START)
+    actual = result.create_equity_curve_dataframe()
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_freq=False)
+
+
+def test_positions_from_signals_and_commission():
+    signals = np.array([[np.nan, 1.0], [1.0, np.nan], [np.nan, 0.0], [-1.0, np.nan]])
+    np.testing.assert_array_equal(positions_from_signals(signals, 100),
+                                  [[0, 100], [100, 100], [100, 0], [-100, 0]])
+    np.testing.assert_array_equal(calculate_commissions(np.array([0.0, 1000.0, -100000.0])), [0.0, 5.0, 20.0])